@@ -0,0 +1,262 @@
+"""
+Write-behind usage analytics.
+
+Handlers only enqueue (no awaits, no DB work on the reply path). A background
+task flushes everything in one transaction every ``flush_interval`` seconds,
+or sooner once ``flush_max`` items are pending:
+
+- session starts → one multi-row INSERT … ON CONFLICT
+- session touches → coalesced to the latest timestamp per session, one UPDATE … FROM (VALUES …)
+- session ends → same, one UPDATE
+- events → one multi-row INSERT
+- per-day counters (analytics_usage_daily, sql/004) → one upsert, so /stats
+  never has to count the raw tables
+
+If the database is unavailable the batch is kept and retried with backoff.
+A flush cancelled mid-write (shutdown) keeps its batch aside until the write's
+outcome is known, and puts it back unless it committed. Beyond
+``max_pending`` queued events new ones are dropped and counted, so
+analytics can never grow memory without bound or slow a reply down.
+"""
+import asyncio, json, traceback
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import psycopg2.extras
+
+_SESSIONS_SQL = """
+insert into analytics_usage_sessions (id, user_agent, referer, ip, started_at, last_seen)
+values %s
+on conflict (id) do update set last_seen = greatest(analytics_usage_sessions.last_seen, excluded.last_seen)
+returning started_at, (xmax = 0) as inserted
+"""
+_TOUCH_SQL = """
+update analytics_usage_sessions s set last_seen = greatest(s.last_seen, v.ts)
+from (values %s) as v(id, ts) where s.id = v.id
+"""
+_END_SQL = """
+update analytics_usage_sessions s set ended_at = v.ts, last_seen = greatest(s.last_seen, v.ts)
+from (values %s) as v(id, ts) where s.id = v.id
+"""
+_EVENTS_SQL = "insert into analytics_usage_events (session_id, type, payload, ts) values %s"
+_ROLLUP_SQL = """
+insert into analytics_usage_daily as d (day, sessions, messages)
+select v.ts::date, sum(v.sessions), sum(v.messages) from (values %s) as v(ts, sessions, messages)
+group by 1
+on conflict (day) do update
+  set sessions = d.sessions + excluded.sessions, messages = d.messages + excluded.messages
+"""
+_HAS_ROLLUP_SQL = "select to_regclass('public.analytics_usage_daily') is not null"
+
+# /stats: constant-time read of the rollup (+ index range scan for "active now") …
+COUNTS_ROLLUP_SQL = """
+select
+  (select count(*) from analytics_usage_sessions where last_seen > now() - make_interval(secs := %s)),
+  coalesce((select sessions from analytics_usage_daily where day = current_date), 0),
+  coalesce((select sum(sessions) from analytics_usage_daily), 0),
+  coalesce((select messages from analytics_usage_daily where day = current_date), 0)
+"""
+# … or, before sql/004 is applied, one pass with index-friendly range predicates.
+COUNTS_FALLBACK_SQL = """
+select
+  count(*) filter (where last_seen > now() - make_interval(secs := %s)),
+  count(*) filter (where started_at >= current_date),
+  count(*),
+  (select count(*) from analytics_usage_events where type = 'message' and ts >= current_date)
+from analytics_usage_sessions
+"""
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class AnalyticsQueue:
+    def __init__(self, pool, flush_interval: float = 2.0, flush_max: int = 200,
+                 max_pending: int = 10_000, max_backoff: float = 60.0):
+        self.pool = pool
+        self.flush_interval = flush_interval
+        self.flush_max = flush_max
+        self.max_pending = max_pending
+        self.max_backoff = max_backoff
+        self._starts: Dict[str, Tuple] = {}
+        self._touches: Dict[str, datetime] = {}
+        self._ends: Dict[str, datetime] = {}
+        self._events: List[Tuple] = []
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._orphans: List[Tuple[Tuple, Dict[str, bool]]] = []   # (batch, state) of cancelled flushes
+        self.has_rollup: Optional[bool] = None    # analytics_usage_daily present? (checked on first flush)
+        self.counters = dict(enqueued=0, coalesced=0, dropped=0, flushes=0, flushed_rows=0, flush_errors=0)
+
+    # ── enqueue (called from handlers) ───────────────────────
+    def start_session(self, session_id: str, user_agent=None, referer=None, ip=None) -> None:
+        ts = _now()
+        self._starts[session_id] = (session_id, user_agent, referer, ip, ts, ts)
+        self._enqueued()
+
+    def touch_session(self, session_id: str) -> None:
+        if session_id in self._touches:
+            self.counters["coalesced"] += 1
+        self._touches[session_id] = _now()
+        self._enqueued()
+
+    def end_session(self, session_id: str) -> None:
+        self._ends[session_id] = _now()
+        self._enqueued()
+
+    def log_event(self, session_id: str, etype: str, payload: dict) -> None:
+        if len(self._events) >= self.max_pending:
+            self.counters["dropped"] += 1
+            return
+        self._events.append((session_id, etype, json.dumps(payload), _now()))
+        self._enqueued()
+
+    def pending(self) -> int:
+        return len(self._starts) + len(self._touches) + len(self._ends) + len(self._events)
+
+    def _enqueued(self) -> None:
+        self.counters["enqueued"] += 1
+        self._ensure_task()
+        if self._wake is not None and self.pending() >= self.flush_max:
+            self._wake.set()
+
+    # ── flushing ─────────────────────────────────────────────
+    def _ensure_task(self) -> None:
+        if self._task is not None and not self._task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return          # no loop (e.g. at exit): close() flushes synchronously
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = loop.create_task(self._run())
+
+    def _take(self):
+        batch = (list(self._starts.values()), list(self._touches.items()),
+                 list(self._ends.items()), self._events)
+        self._starts, self._touches, self._ends, self._events = {}, {}, {}, []
+        return batch
+
+    def _restore(self, batch) -> None:
+        starts, touches, ends, events = batch
+        for row in starts:
+            self._starts.setdefault(row[0], row)
+        for sid, ts in touches:
+            self._touches[sid] = max(ts, self._touches.get(sid, ts))
+        for sid, ts in ends:
+            self._ends.setdefault(sid, ts)
+        room = self.max_pending - len(self._events)
+        if room < len(events):
+            self.counters["dropped"] += len(events) - max(0, room)
+            events = events[len(events) - max(0, room):]
+        self._events = events + self._events
+
+    async def check_rollup(self) -> bool:
+        if self.has_rollup is None:
+            row = await self.pool.fetch_one(_HAS_ROLLUP_SQL)
+            self.has_rollup = bool(row and row[0])
+        return self.has_rollup
+
+    def _write(self, conn, batch) -> int:
+        starts, touches, ends, events = batch
+        with conn.cursor() as cur:
+            if self.has_rollup is None:
+                cur.execute(_HAS_ROLLUP_SQL)
+                self.has_rollup = bool(cur.fetchone()[0])
+            rollup: List[Tuple] = []
+            if starts:
+                inserted = psycopg2.extras.execute_values(cur, _SESSIONS_SQL, starts, fetch=True)
+                rollup += [(ts, 1, 0) for ts, new in inserted if new]
+            if touches:
+                psycopg2.extras.execute_values(cur, _TOUCH_SQL, touches, template="(%s, %s::timestamptz)")
+            if ends:
+                psycopg2.extras.execute_values(cur, _END_SQL, ends, template="(%s, %s::timestamptz)")
+            if events:
+                psycopg2.extras.execute_values(cur, _EVENTS_SQL, events, page_size=1000)
+                rollup += [(ts, 0, 1) for _, etype, _, ts in events if etype == "message"]
+            if rollup and self.has_rollup:
+                psycopg2.extras.execute_values(cur, _ROLLUP_SQL, rollup, template="(%s::timestamptz, %s::int, %s::int)")
+        return len(starts) + len(touches) + len(ends) + len(events)
+
+    def _write_marked(self, conn, batch, state: Dict[str, bool]) -> int:
+        try:
+            n = self._write(conn, batch)
+            conn.commit()
+            state["ok"] = True
+            return n
+        finally:
+            state["done"] = True
+
+    def _reconcile(self, final: bool = False) -> None:
+        """
+        Settle batches whose flush was cancelled while the worker thread kept
+        writing: drop them once committed, restore them if the write failed
+        (or, when ``final``, if it never finished).
+        """
+        keep = []
+        for batch, state in self._orphans:
+            if state.get("ok"):
+                continue
+            if state.get("done") or final:
+                self._restore(batch)
+            else:
+                keep.append((batch, state))
+        self._orphans = keep
+
+    async def flush(self) -> bool:
+        """Write everything pending now; returns False (batch kept) on DB error."""
+        self._ensure_task()
+        async with self._flush_lock:
+            self._reconcile()
+            if not self.pending():
+                return True
+            batch, state = self._take(), {}
+            try:
+                n = await self.pool.run(self._write_marked, batch, state)
+            except Exception:
+                self.counters["flush_errors"] += 1
+                self._restore(batch)
+                traceback.print_exc()
+                return False
+            except BaseException:
+                # Cancelled (shutdown): the write may still commit on its thread;
+                # settled by the next flush or by close().
+                self._orphans.append((batch, state))
+                raise
+            self.counters["flushes"] += 1
+            self.counters["flushed_rows"] += n
+            return True
+
+    async def _run(self) -> None:
+        backoff = 0.0
+        while True:
+            if backoff:
+                await asyncio.sleep(backoff)        # DB trouble: don't let size triggers spin
+            else:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._wake.clear()
+            ok = await self.flush()
+            backoff = 0.0 if ok else min(self.max_backoff, max(self.flush_interval, backoff * 2))
+
+    def close(self) -> None:
+        """Blocking final flush (atexit); best effort, never raises."""
+        if self._task is not None:
+            self._task.cancel()
+        self._reconcile(final=True)
+        if not self.pending():
+            return
+        batch = self._take()
+        try:
+            with self.pool.connection() as conn:
+                self._write(conn, batch)
+        except Exception:
+            self.counters["dropped"] += len(batch[3])
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(pending=self.pending(), **self.counters)
@@ -1,15 +1,34 @@
-import os, re, calendar, asyncio, traceback
+import os, re, asyncio, traceback, atexit
 from dataclasses import dataclass
 from datetime import date, datetime, timedelta
-from typing import List, Tuple, Optional, Dict
-import uuid, json
+from typing import AsyncIterator, List, Tuple, Optional, Dict, Set
+import uuid
 
 import chainlit as cl
 import psycopg2
-import psycopg2.extras
 from dotenv import load_dotenv
 
+import db
+from analytics import AnalyticsQueue, COUNTS_ROLLUP_SQL, COUNTS_FALLBACK_SQL
+from price_cache import PriceDayCache
+from cube import PriceCube
+from rollups import HourlySeries, PriceRollups
+from derivatives import DerivativesService
+from ingest_log import IngestLog
+from export import HOURLY_RPC_SQL, HOURLY_SERIES_SQL, QUARTER_RPC_SQL, Exporter, ExportResult, discard, statement_args
+from parsing import QueryParser, QuerySpec, _compress_ranges, build_specs, is_month_intent, parse_export
+from kernels import columns, vwap_prices, weighted_sums
+from perf import PerfRecorder, annotate, db_call, stage, timed
+from slowlog import SlowQueryLog
+from warmup import Warmup
+
 ANALYTICS_ACTIVE_WINDOW_SEC = int(os.getenv("ANALYTICS_ACTIVE_WINDOW_SEC", "120"))
+# Write-behind analytics (app/analytics.py): flush period, size trigger, queue cap.
+ANALYTICS_FLUSH_SEC = float(os.getenv("ANALYTICS_FLUSH_SEC", "2"))
+ANALYTICS_FLUSH_MAX = int(os.getenv("ANALYTICS_FLUSH_MAX", "200"))
+ANALYTICS_MAX_PENDING = int(os.getenv("ANALYTICS_MAX_PENDING", "10000"))
+# /stats answers are reused for this many seconds.
+STATS_CACHE_SEC = float(os.getenv("STATS_CACHE_SEC", "5"))
 
 # ─────────────────────────────────────────────────────────────
 # Branding: custom avatar (logo)
@@ -29,11 +48,86 @@ DB_USER = os.getenv("DB_USER", "").strip()
 DB_PASSWORD = os.getenv("DB_PASSWORD", "").strip()
 DB_SSLMODE = os.getenv("DB_SSLMODE", "require").strip()
 
+# Shared pool (see app/db.py): sizing, checkout wait, idle health-check and
+# the default per-statement timeout applied to every pooled connection.
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_ACQUIRE_TIMEOUT_SEC = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT_SEC", "10"))
+DB_POOL_CHECK_IDLE_SEC = float(os.getenv("DB_POOL_CHECK_IDLE_SEC", "30"))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "15000"))
+# Rows per fetch for server-side-cursor reads (cube loads); bounds client memory.
+DB_FETCH_CHUNK_ROWS = int(os.getenv("DB_FETCH_CHUNK_ROWS", "10000"))
+
 DEFAULT_STAT = os.getenv("DEFAULT_STAT", "twap").strip().lower()
 if DEFAULT_STAT not in ("twap", "vwap", "list", "daily_avg"):
     DEFAULT_STAT = "twap"
 
-DATE_MIN_GUARD = date(2010, 1, 1)
+# Parsed-query LRU (app/parsing.py); 0 disables it.
+PARSE_CACHE_MAX = int(os.getenv("PARSE_CACHE_MAX", "4096"))
+
+# Max specs of one message processed at the same time (multi-year / multi-window queries).
+# A spec usually holds 2-3 pooled connections at once, and about 7 at worst
+# (4 price-cache load runs, aggregate + list window, derivative close, export
+# stream). Callers beyond DB_POOL_MAX queue on the event loop (db.ConnectionPool),
+# so the default DB_POOL_MAX // 3 sizes for the usual case and the rare peak waits.
+SPEC_CONCURRENCY = int(os.getenv("SPEC_CONCURRENCY", "0")) or max(1, DB_POOL_MAX // 3)
+
+# Day-slice cache of spot rows (see app/price_cache.py). Ranges longer than
+# PRICE_CACHE_MAX_SPAN_DAYS bypass it and use the server-side query paths.
+PRICE_CACHE_MAX_ROWS = int(os.getenv("PRICE_CACHE_MAX_ROWS", "250000"))
+PRICE_CACHE_MAX_SPAN_DAYS = int(os.getenv("PRICE_CACHE_MAX_SPAN_DAYS", "62"))
+PRICE_CACHE_TTL_HIST_SEC = float(os.getenv("PRICE_CACHE_TTL_HIST_SEC", str(24 * 3600)))
+PRICE_CACHE_TTL_RECENT_SEC = float(os.getenv("PRICE_CACHE_TTL_RECENT_SEC", "300"))
+
+# Query engine for spot data: 'db' (RPCs, default) or 'cube' (app/cube.py,
+# NumPy arrays reloaded every CUBE_REFRESH_SEC; falls back to 'db' for days
+# the cube doesn't hold yet).
+QUERY_ENGINE = os.getenv("QUERY_ENGINE", "db").strip().lower()
+if QUERY_ENGINE not in ("db", "cube"):
+    QUERY_ENGINE = "db"
+CUBE_REFRESH_SEC = int(os.getenv("CUBE_REFRESH_SEC", "900"))
+CUBE_LOAD_TIMEOUT_MS = int(os.getenv("CUBE_LOAD_TIMEOUT_MS", "120000"))
+
+# Derivative lookups cache (app/derivatives.py).
+DERIV_CACHE_MAX = int(os.getenv("DERIV_CACHE_MAX", "2048"))
+DERIV_CACHE_TTL_HIST_SEC = float(os.getenv("DERIV_CACHE_TTL_HIST_SEC", str(6 * 3600)))
+DERIV_CACHE_TTL_RECENT_SEC = float(os.getenv("DERIV_CACHE_TTL_RECENT_SEC", "300"))
+
+# TWAP/VWAP from the daily/monthly rollup tables (sql/007, app/rollups.py)
+# wherever they cover the range; ROLLUP_COVERAGE_SEC is how often their
+# covered span is re-read, and how often price_ingest_log (sql/009) is polled
+# to drop cached days an ingest changed.
+USE_ROLLUPS = os.getenv("USE_ROLLUPS", "1").strip().lower() not in ("0", "false", "no", "off")
+ROLLUP_COVERAGE_SEC = float(os.getenv("ROLLUP_COVERAGE_SEC", "60"))
+# Hourly reads from the materialized series (sql/008: native hours + hours
+# derived from 15-min slots, flagged) instead of the hourly RPC.
+USE_HOURLY_SERIES = os.getenv("USE_HOURLY_SERIES", "1").strip().lower() not in ("0", "false", "no", "off")
+# Per-stage latency tracing (app/perf.py, shown by /perf); PERF_LOG=1 also
+# prints one JSON line per message and a line per cube reload to stdout (off
+# by default so production logs are not flooded). PROGRESS_DELAY_SEC keeps "Interpreting …"
+# on screen before querying starts.
+PERF_LOG = os.getenv("PERF_LOG", "0").strip().lower() not in ("0", "false", "no", "off")
+PROGRESS_DELAY_SEC = float(os.getenv("PROGRESS_DELAY_SEC", "0.10"))
+# "export csv" / "export parquet": full series streamed to a file attachment
+# (app/export.py); EXPORT_DIR defaults to a temp dir, files are removed once sent.
+EXPORT_DIR = os.getenv("EXPORT_DIR", "").strip()
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "20000"))
+EXPORT_TIMEOUT_MS = int(os.getenv("EXPORT_TIMEOUT_MS", "120000"))
+# Slow rpc_* statements (app/slowlog.py, shown by /slowlog): parameters are
+# logged and an EXPLAIN (ANALYZE, BUFFERS) is captured on a separate
+# connection. SLOW_QUERY_MS=0 turns capture off.
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "1000"))
+SLOW_QUERY_LOG_MAX = int(os.getenv("SLOW_QUERY_LOG_MAX", "200"))
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "1").strip().lower() not in ("0", "false", "no", "off")
+SLOW_QUERY_EXPLAIN_TIMEOUT_MS = int(os.getenv("SLOW_QUERY_EXPLAIN_TIMEOUT_MS", "60000"))
+SLOW_QUERY_EXPLAIN_COOLDOWN_SEC = float(os.getenv("SLOW_QUERY_EXPLAIN_COOLDOWN_SEC", "300"))
+# Startup warm-up (app/warmup.py, shown by /ready): pool, parser and NumPy on a
+# thread at import; coverage probes and optional preloads of the last
+# WARMUP_PRICE_DAYS of DAM/GDAM rows and today's derivative closes when the
+# first session starts. WARMUP=0 leaves everything lazy.
+WARMUP_ENABLED = os.getenv("WARMUP", "1").strip().lower() not in ("0", "false", "no", "off")
+WARMUP_PRICE_DAYS = max(0, int(os.getenv("WARMUP_PRICE_DAYS", "0")))
+WARMUP_DERIVS = os.getenv("WARMUP_DERIVS", "1").strip().lower() not in ("0", "false", "no", "off")
 
 # print("DB PATH:", "DATABASE_URL" if DB_URL else "split fields")
 # print("DATABASE_URL =", (DB_URL or "<none>"))
@@ -42,13 +136,68 @@ DATE_MIN_GUARD = date(2010, 1, 1)
 
 
 def _connect():
+    """Connection factory for the pool; handlers never call this directly."""
     keepalive = dict(connect_timeout=10, keepalives=1, keepalives_idle=30, keepalives_interval=10, keepalives_count=5)
+    if DB_STATEMENT_TIMEOUT_MS > 0:
+        keepalive["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
     if DB_URL:
-        return psycopg2.connect(DB_URL, sslmode=DB_SSLMODE, **keepalive)
-    return psycopg2.connect(
-        host=DB_HOST, port=DB_PORT, dbname=DB_NAME,
-        user=DB_USER, password=DB_PASSWORD, sslmode=DB_SSLMODE, **keepalive
-    )
+        conn = psycopg2.connect(DB_URL, sslmode=DB_SSLMODE, **keepalive)
+    else:
+        conn = psycopg2.connect(
+            host=DB_HOST, port=DB_PORT, dbname=DB_NAME,
+            user=DB_USER, password=DB_PASSWORD, sslmode=DB_SSLMODE, **keepalive
+        )
+    db.register_float_numeric(conn)
+    return conn
+
+PERF = PerfRecorder(log=print if PERF_LOG else None)
+
+SLOWLOG = SlowQueryLog(
+    _connect, threshold_ms=SLOW_QUERY_MS, max_entries=SLOW_QUERY_LOG_MAX, explain=SLOW_QUERY_EXPLAIN,
+    explain_timeout_ms=SLOW_QUERY_EXPLAIN_TIMEOUT_MS, cooldown_sec=SLOW_QUERY_EXPLAIN_COOLDOWN_SEC,
+)
+atexit.register(SLOWLOG.close)
+
+POOL = db.ConnectionPool(
+    _connect, minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX,
+    acquire_timeout=DB_POOL_ACQUIRE_TIMEOUT_SEC, check_idle_sec=DB_POOL_CHECK_IDLE_SEC, observer=db_call,
+    on_statement=SLOWLOG.observe if SLOWLOG.enabled else None,
+)
+atexit.register(POOL.close)
+
+ANALYTICS = AnalyticsQueue(
+    POOL, flush_interval=ANALYTICS_FLUSH_SEC, flush_max=ANALYTICS_FLUSH_MAX, max_pending=ANALYTICS_MAX_PENDING,
+)
+atexit.register(ANALYTICS.close)   # runs before POOL.close (atexit is LIFO)
+
+PRICE_CACHE = PriceDayCache(
+    max_rows=PRICE_CACHE_MAX_ROWS, ttl_hist_sec=PRICE_CACHE_TTL_HIST_SEC, ttl_recent_sec=PRICE_CACHE_TTL_RECENT_SEC,
+)
+
+CUBE = PriceCube()
+
+ROLLUPS = PriceRollups(POOL, coverage_sec=ROLLUP_COVERAGE_SEC)
+HOURLY = HourlySeries(POOL, coverage_sec=ROLLUP_COVERAGE_SEC)
+
+EXPORTS = Exporter(POOL, directory=EXPORT_DIR, chunk_rows=EXPORT_CHUNK_ROWS, timeout_ms=EXPORT_TIMEOUT_MS)
+
+DERIVS = DerivativesService(
+    POOL, ttl_hist_sec=DERIV_CACHE_TTL_HIST_SEC, ttl_recent_sec=DERIV_CACHE_TTL_RECENT_SEC, max_entries=DERIV_CACHE_MAX,
+)
+
+
+def _on_ingest(market: str, first: date, last: date) -> None:
+    """A price_ingest_log entry: spot markets drop their cached days, exchanges their derivative answers."""
+    if market in ("DAM", "GDAM"):
+        n = PRICE_CACHE.invalidate(market, None, first, last)
+    else:
+        n = DERIVS.invalidate(market, first)
+    if PERF_LOG:
+        print(f"[ingest] {market} {first}..{last} changed: {n} cached entries dropped")
+
+
+INGEST_LOG = IngestLog(POOL, _on_ingest, poll_sec=ROLLUP_COVERAGE_SEC)
+
 # Disclaimer footer for derivative market focus
 DISCLAIMER_FOOTER = """
 
@@ -70,7 +219,8 @@ async def progress_start(text: str = "💭 Interpreting …") -> cl.Message:
 
 async def progress_update(m: cl.Message, text: str) -> None:
     try:
-        await m.update(content=text)
+        m.content = text
+        await m.update()
     except Exception:
         pass
 
@@ -91,239 +241,10 @@ async def progress_hide(m: cl.Message) -> None:
 # ─────────────────────────────────────────────────────────────
 # Parsing – deterministic pipeline
 # ─────────────────────────────────────────────────────────────
-MONTHS = {
-    "jan":1,"january":1,"feb":2,"february":2,"mar":3,"march":3,"apr":4,"april":4,
-    "may":5,"jun":6,"june":6,"jul":7,"july":7,"aug":8,"august":8,"sep":9,"sept":9,"september":9,
-    "oct":10,"october":10,"nov":11,"november":11,"dec":12,"december":12
-}
-MONTH_WORDS = r"(jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec|january|february|march|april|june|july|august|september|october|november|december)"
+# Parsing lives in parsing.py; PARSER memoizes it per normalized text.
+PARSER = QueryParser(max_entries=PARSE_CACHE_MAX, default_stat=DEFAULT_STAT)
 EXCH_RE = re.compile(r"\b(MCX|NSE)\b", re.IGNORECASE)
 
-
-def normalize(text: str) -> str:
-    s = text.strip()
-    s = s.replace("–", "-").replace("—", "-").replace("-", "-")
-    s = re.sub(r"\s+", " ", s)
-    s = re.sub(r"\bbetween\s+(\S.*?)\s+and\s+(\S.*?)\b", r"\1 to \2", s, flags=re.I)
-    s = re.sub(r"\b(upto|through|till|until)\b", "to", s, flags=re.I)
-    s = re.sub(rf"\b({MONTH_WORDS})\s*[-']\s*(\d{{2}})\b", lambda m: f"{m.group(1)} 20{m.group(2)}", s, flags=re.I)
-    return s
-
-def parse_market(text: str) -> str:
-    if re.search(r"\b(gdam|green day\.?\s*ahead)\b", text, re.I): return "GDAM"
-    if re.search(r"\b(dam)\b", text, re.I): return "DAM"
-    return "DAM"
-
-def parse_stat(text: str) -> str:
-    s = text.lower()
-    if re.search(r"\b(vwap|weighted)\b", s): return "vwap"
-    if re.search(r"\bdaily\s+(avg|average)\b", s): return "daily_avg"
-    if re.search(r"\b(list|table|rows|detailed)\b", s): return "list"
-    if re.search(r"\b(avg|average|mean|twap)\b", s): return "twap"
-    return DEFAULT_STAT
-
-
-def parse_multi_year_months(text: str) -> List[Tuple[date, date]]:
-    """
-    Robust parser for multi-year month queries.
-    Handles:
-    - "November 2022, November 2023, November 2024"
-    - "November 2022, 2023, 2024"
-    - "Nov 2022, 2023, and 2024"
-    - "dam november 2022, 2023, 2024"
-    - Any combination with commas and 'and'
-    
-    Returns list of (start_date, end_date) tuples for each month
-    """
-    s = text.lower().strip()
-    results = []
-    
-    # Pattern 1: "November 2022, 2023, 2024" (month once, multiple years)
-    # More precise: month followed by year, then more years separated by commas
-    month_match = re.search(
-        rf"\b({MONTH_WORDS})\s+(\d{{4}})\b(?:\s*,\s*(?:and\s+)?(\d{{4}}))+", 
-        s, re.I
-    )
-    if month_match:
-        month_name = month_match.group(1).lower()
-        if month_name in MONTHS:
-            month_num = MONTHS[month_name]
-            # Get ALL years from the entire matched portion
-            full_match = month_match.group(0)
-            years = re.findall(r'\b\d{4}\b', full_match)
-            
-            if len(years) > 1:  # Found multiple years
-                for year_str in years:
-                    try:
-                        year = int(year_str)
-                        if 2000 <= year <= 2100:  # Sanity check
-                            start = date(year, month_num, 1)
-                            end = date(year, month_num, calendar.monthrange(year, month_num)[1])
-                            results.append((start, end))
-                    except (ValueError, calendar.IllegalMonthError):
-                        continue  # Skip invalid dates
-                
-                if len(results) > 1:  # Only return if we got multiple valid periods
-                    return results
-    
-    # Pattern 2: "November 2022, November 2023, November 2024" (month repeated)
-    # More precise: only match complete "Month YYYY" patterns
-    pattern = rf"\b({MONTH_WORDS})\s+(\d{{4}})\b"
-    matches = re.findall(pattern, s, re.I)
-    
-    if len(matches) > 1:  # Multiple month-year pairs found
-        seen_periods = set()  # Avoid duplicates
-        
-        for match in matches:
-            month_name = match[0].lower()
-            year_str = match[1]
-            
-            if month_name in MONTHS:
-                try:
-                    month_num = MONTHS[month_name]
-                    year = int(year_str)
-                    
-                    if 2000 <= year <= 2100:  # Sanity check
-                        period_key = (year, month_num)
-                        if period_key not in seen_periods:
-                            seen_periods.add(period_key)
-                            start = date(year, month_num, 1)
-                            end = date(year, month_num, calendar.monthrange(year, month_num)[1])
-                            results.append((start, end))
-                except (ValueError, calendar.IllegalMonthError):
-                    continue  # Skip invalid dates
-        
-        if len(results) > 1:  # Only return if we got multiple valid periods
-            return results
-    
-    return []  # Not a multi-year query or couldn't parse
-
-def parse_date_or_range(text: str) -> Tuple[Optional[date], Optional[date]]:
-    s = " " + text.lower().strip() + " "
-    today = date.today()
-
-    if " yesterday " in s:
-        d = today - timedelta(days=1); return (d, d)
-    if " today " in s:
-        return (today, today)
-    if " this month " in s:
-        start = date(today.year, today.month, 1)
-        end = date(today.year, today.month, calendar.monthrange(today.year, today.month)[1])
-        return (start, end)
-    if " last month " in s:
-        y, m = today.year, today.month - 1
-        if m == 0: y, m = y - 1, 12
-        return (date(y, m, 1), date(y, m, calendar.monthrange(y, m)[1]))
-    # Month-day to month-day range in SAME year: "24 September to 24 October 2025"
-    m = re.search(
-        rf"(?:from\s+)?(\d{{1,2}})\s+({MONTH_WORDS})\s+(?:to|until|till|-)\s+(\d{{1,2}})\s+({MONTH_WORDS})\s+(\d{{2,4}})",
-        s, re.I
-    )
-    if m:
-        d1 = int(m.group(1))
-        mon1 = MONTHS[m.group(2).lower()]
-        d2 = int(m.group(3))
-        mon2 = MONTHS[m.group(4).lower()]
-        yr = int(m.group(5))
-        if yr < 100:
-            yr += 2000
-        start, end = date(yr, mon1, d1), date(yr, mon2, d2)
-        if start > end:
-            start, end = end, start
-        return (start, end)
-
-    # word-date RANGE (original pattern continues below)
-    m = re.search(rf"\b(?:from\s*)?(\d{{1,2}})\s+{MONTH_WORDS}\s+(\d{{2,4}})\s*(?:to|-)\s*(\d{{1,2}})\s+{MONTH_WORDS}\s+(\d{{2,4}})\b", s, re.I)
-
-    # Month-day to month-day range in SAME year: "24 September to 24 October 2025"
-    m = re.search(
-        rf"(?:from\s+)?(\d{{1,2}})\s+({MONTH_WORDS})\s+(?:to|until|till|-)\s+(\d{{1,2}})\s+({MONTH_WORDS})\s+(\d{{2,4}})",
-        s, re.I
-    )
-    if m:
-        d1 = int(m.group(1))
-        mon1 = MONTHS[m.group(2).lower()]
-        d2 = int(m.group(3))
-        mon2 = MONTHS[m.group(4).lower()]
-        yr = int(m.group(5))
-        if yr < 100:
-            yr += 2000
-        start, end = date(yr, mon1, d1), date(yr, mon2, d2)
-        if start > end:
-            start, end = end, start
-        return (start, end)
-
-    # word-date RANGE (original pattern continues below)
-    m = re.search(rf"\b(?:from\s*)?(\d{{1,2}})\s+{MONTH_WORDS}\s+(\d{{2,4}})\s*(?:to|-)\s*(\d{{1,2}})\s+{MONTH_WORDS}\s+(\d{{2,4}})\b", s, re.I)
-
-    # word-date RANGE
-    m = re.search(rf"\b(?:from\s*)?(\d{{1,2}})\s+{MONTH_WORDS}\s+(\d{{2,4}})\s*(?:to|-)\s*(\d{{1,2}})\s+{MONTH_WORDS}\s+(\d{{2,4}})\b", s, re.I)
-    if m:
-        d1 = int(m.group(1)); mon1 = MONTHS[m.group(2).lower()]; y1 = int(m.group(3))
-        d2 = int(m.group(4)); mon2 = MONTHS[m.group(5).lower()]; y2 = int(m.group(6))
-        if y1 < 100: y1 += 2000
-        if y2 < 100: y2 += 2000
-        start, end = date(y1, mon1, d1), date(y2, mon2, d2)
-        if start > end: start, end = end, start
-        return (start, end)
-
-    # day range within SAME month (e.g., 10-15 Aug 2025)
-    m = re.search(rf"\b(\d{{1,2}})\s*(?:to|-)\s*(\d{{1,2}})\s+{MONTH_WORDS}(?:\s+(\d{{2,4}}))?\b", s, re.I)
-    if m:
-        d1, d2 = int(m.group(1)), int(m.group(2))
-        mon = MONTHS[m.group(3).lower()]
-        yr  = int(m.group(4)) if m.group(4) else today.year
-        if yr < 100: yr += 2000
-        return (date(yr, mon, min(d1, d2)), date(yr, mon, max(d1, d2)))
-
-    # numeric date RANGE
-    m = re.search(r"\b(\d{1,2})[/-](\d{1,2})[/-](\d{2,4})\s*(?:to|-)\s*(\d{1,2})[/-](\d{1,2})[/-](\d{2,4})\b", s, re.I)
-    if m:
-        d1, m1, y1 = int(m.group(1)), int(m.group(2)), int(m.group(3))
-        d2, m2, y2 = int(m.group(4)), int(m.group(5)), int(m.group(6))
-        y1 = y1 + 2000 if y1 < 100 else y1
-        y2 = y2 + 2000 if y2 < 100 else y2
-        start, end = date(y1, m1, d1), date(y2, m2, d2)
-        if start > end: start, end = end, start
-        return (start, end)
-
-    # single numeric date
-    m = re.search(r"\b(\d{1,2})[/-](\d{1,2})[/-](\d{2,4})\b", s)
-    if m:
-        d0, m0, y0 = int(m.group(1)), int(m.group(2)), int(m.group(3))
-        if y0 < 100: y0 += 2000
-        d = date(y0, m0, d0)
-        if d >= DATE_MIN_GUARD:
-            return (d, d)
-
-    # single day with month word
-    m = re.search(rf"\b(\d{{1,2}})\s+{MONTH_WORDS}(?:\s+(\d{{2,4}}))?\b", s, re.I)
-    if m:
-        d0 = int(m.group(1)); mon0 = MONTHS[m.group(2).lower()]
-        y0 = int(m.group(3)) if m.group(3) else today.year
-        if y0 < 100: y0 += 2000
-        d = date(y0, mon0, d0)
-        if d >= DATE_MIN_GUARD:
-            return (d, d)
-
-    # month + year
-    m = re.search(rf"\b{MONTH_WORDS}\s+(\d{{2,4}})\b", s, re.I)
-    if m:
-        mon = MONTHS[m.group(1).lower()]
-        yr  = int(m.group(2));  yr = yr + 2000 if yr < 100 else yr
-        last = calendar.monthrange(yr, mon)[1]
-        s1, s2 = date(yr, mon, 1), date(yr, mon, last)
-        if s1 >= DATE_MIN_GUARD:
-            return (s1, s2)
-
-    # year only (if phrased)
-    m = re.search(r"\b(20\d{2})\b", s)
-    if m and re.search(r"\b(in|for|year|full\s+year)\b", s):
-        y = int(m.group(1)); return (date(y, 1, 1), date(y, 12, 31))
-
-    return (None, None)
-
-
 def _same_calendar_month(a: date, b: date) -> bool:
     return (a.year == b.year) and (a.month == b.month)
 
@@ -333,17 +254,6 @@ def _is_same_contract_month(target_day: date, cm: date) -> bool:
     return cm.year == target_day.year and cm.month == target_day.month
 
 
-
-def is_month_intent(text: str, start: Optional[date], end: Optional[date]) -> bool:
-    if not start or not end:
-        return False
-    first = date(start.year, start.month, 1)
-    last  = date(start.year, start.month, calendar.monthrange(start.year, start.month)[1])
-    whole_month = (start == first and end == last)
-    yyyymm = bool(re.search(r"\b20\d{2}-(0[1-9]|1[0-2])\b", text or ""))
-    has_month_word = bool(re.search(MONTH_WORDS, text or "", re.I))
-    return whole_month and has_month_word or yyyymm
-
 # Ranges for hours/slots (unchanged from your current app)
 def _fmt_hhmm(total_min: int) -> str:
     # show 24:00 for exact end-of-day instead of wrapping to 00:00
@@ -359,35 +269,43 @@ def hour_block_window(b: int) -> str:
 def slot_window(s: int) -> str:
     return f"{_fmt_hhmm((s-1)*15)}–{_fmt_hhmm(s*15)}"
 
-def _same_calendar_month(a: date, b: date) -> bool:
-    return (a.year == b.year) and (a.month == b.month)
-
-
-def _compress_ranges(indices: List[int]) -> List[Tuple[int, int]]:
-    if not indices:
-        return []
-    b = sorted(set(indices))
-    out = []
-    s = p = b[0]
-    for x in b[1:]:
-        if x == p + 1:
-            p = x
-        else:
-            out.append((s, p))
-            s = p = x
-    out.append((s, p))
-    return out
 
 @dataclass
-class QuerySpec:
-    market: str
-    start_date: date
-    end_date: date
-    granularity: str            # 'hour' | 'quarter'
-    hours: Optional[List[int]]
-    slots: Optional[List[int]]
-    stat: str                   # 'list' | 'twap' | 'vwap' | 'daily_avg'
-    area: str = "ALL"
+class PriceAgg:
+    """Additive sums over a set of price rows (₹/MWh, minutes, MW)."""
+    n_rows: int = 0
+    n_days: int = 0
+    minutes: float = 0.0
+    price_min: float = 0.0        # Σ price × minutes
+    mw_min: float = 0.0           # Σ scheduled MW × minutes
+    price_mw_min: float = 0.0     # Σ price × scheduled MW × minutes
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    n_derived: int = 0            # hourly rows derived from 15-min slots (sql/008)
+
+    def twap_kwh(self) -> Optional[float]:
+        return None if not self.n_rows or self.minutes == 0 else (self.price_min / self.minutes) / 1000.0
+
+    def vwap_kwh(self) -> Optional[float]:
+        # Same rule as vwap_kwh(): fall back to TWAP when there is no scheduled volume.
+        if not self.n_rows: return None
+        if self.mw_min > 0: return (self.price_mw_min / self.mw_min) / 1000.0
+        return self.twap_kwh()
+
+    def coverage(self, expected_rows: int) -> Optional[float]:
+        """Share of ``expected_rows`` present (None when nothing was expected)."""
+        return None if expected_rows <= 0 else self.n_rows / expected_rows
+
+    @classmethod
+    def from_rows(cls, rows: List[Dict], price_key: str, sched_key: str, minute_key: str = "duration_min",
+                  vwap_key: Optional[str] = None) -> "PriceAgg":
+        if not rows:
+            return cls()
+        with stage("aggregate"):
+            vprice = vwap_prices(rows, vwap_key, price_key) if vwap_key else None
+            sums = weighted_sums(*columns(rows, price_key, sched_key, minute_key), vwap_price=vprice)
+            return cls(n_days=len({r["delivery_date"] for r in rows}),
+                       n_derived=sum(1 for r in rows if r.get("derived")), **sums)
 
 
 def _hour_blocks_to_slot_ranges(hranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
@@ -399,212 +317,6 @@ def _hour_blocks_to_slot_ranges(hranges: List[Tuple[int, int]]) -> List[Tuple[in
         out.append((s1, s2))
     return out
 
-def parse_ranges(text: str) -> dict:
-    s_orig = normalize(text)
-    s = s_orig.lower()
-
-    hours: List[int] = []
-    quarters: List[int] = []
-
-    prefer_quarter = bool(re.search(r"\b(blocks?|slots?|quarters?)\b", s))
-    prefer_hour    = bool(re.search(r"\b(hours?|hrs?)\b", s))
-
-    any_minute_nonzero = False
-
-    # “whole day”
-    if re.search(r"\b(full day|all 24|entire day|whole day)\b", s):
-        hours = list(range(1, 25))
-
-    # HH[:MM][am/pm] to HH[:MM][am/pm]
-    time_pat = re.compile(
-        r"\b(\d{1,2})(?::(\d{2}))?\s*(am|pm)?\s*(?:to|-)\s*(\d{1,2})(?::(\d{2}))?\s*(am|pm)?\b",
-        re.I,
-    )
-    found_time_range = False
-
-    def _to24_inner(h: int, ampm: Optional[str]) -> int:
-        if ampm:
-            h = h % 12
-            if ampm.lower() == "pm":
-                h += 12
-        return max(0, min(23, h))
-
-    for m in time_pat.finditer(s):
-        found_time_range = True
-        h1, m1, a1 = int(m.group(1)), int(m.group(2) or 0), m.group(3)
-        h2, m2, a2 = int(m.group(4)), int(m.group(5) or 0), m.group(6)
-        h2_raw = int(m.group(4))  # keep raw for “... to 24”
-
-        if m1 > 0 or m2 > 0:
-            any_minute_nonzero = True
-
-        H1, H2 = _to24_inner(h1, a1), _to24_inner(h2, a2)
-
-        # Hour blocks (1..24), inclusive
-        start_block = min(24, H1 + 1 + (1 if m1 > 0 else 0))
-        end_block   = min(24, H2 + (0 if m2 == 0 else 1))
-        if m2 == 0:
-            end_block = max(1, H2)
-        # special case: “to 24” with no minutes or am/pm → include 23–24
-        if (h2_raw == 24) and (a2 is None) and (m2 == 0):
-            end_block = 24
-        if end_block >= start_block:
-            hours.extend(range(start_block, end_block + 1))
-
-        # Quarter slots (1..96)
-        def ceil_slot(h: int, mm: int) -> int: return (h*60 + mm + 14)//15 + 1
-        def end_slot(h: int, mm: int)  -> int: return (h*60 + mm)//15
-        sslot = max(1, min(96, ceil_slot(H1, m1)))
-        eslot = max(1, min(96, end_slot(H2, m2)))
-        if (h2_raw == 24) and (a2 is None) and (m2 == 0):
-            eslot = 96
-        if eslot >= sslot:
-            quarters.extend(range(sslot, eslot + 1))
-
-    # scrub numeric dates so “10-12” inside dates don’t become time ranges
-    clean = re.sub(r"\b\d{1,2}[/-]\d{1,2}[/-]\d{2,4}\b", " ", s)
-
-    # “H to H hrs/hours”  (24 is allowed on the right)
-    for m in re.finditer(r"\b(\d{1,2})\s*(?:to|-)\s*(\d{1,2})\s*(?:hours?|hrs?)\b", clean, re.I):
-        h1 = max(0, min(23, int(m.group(1))))
-        h2 = max(0, min(24, int(m.group(2))))
-        start_block = min(24, h1 + 1)
-        end_block   = 24 if h2 == 24 else max(1, min(24, h2))
-        if end_block >= start_block:
-            hours.extend(range(start_block, end_block + 1))
-
-    # “blocks/slots A-B”
-    for m in re.finditer(r"\b(\d{1,2})\s*(?:to|-)\s*(\d{1,2})\s*(?:blocks?|slots?|quarters?)\b", clean, re.I):
-        a, b = int(m.group(1)), int(m.group(2))
-        lo, hi = sorted((a, b))
-        lo = max(1, lo); hi = min(96, hi)
-        quarters.extend(range(lo, hi + 1))
-        prefer_quarter = True
-
-    # Fallback: naked “a-b” when we didn’t already capture any clock-range
-    if not found_time_range:
-        for m in re.finditer(r"\b(\d{1,2})\s*(?:to|-)\s*(\d{1,2})\b", clean, re.I):
-            a, b = int(m.group(1)), int(m.group(2))
-            lo, hi = sorted((a, b))
-            if prefer_quarter or hi > 24:
-                lo = max(1, lo); hi = min(96, hi)
-                quarters.extend(range(lo, hi + 1))
-            else:
-                lo = max(1, lo); hi = min(24, hi)
-                hours.extend(range(lo, hi + 1))
-
-    hours    = sorted({h for h in hours    if 1 <= h <= 24})
-    quarters = sorted({q for q in quarters if 1 <= q <= 96})
-
-    # Decide mode
-    if prefer_quarter or any_minute_nonzero:
-        gran = "quarter"
-    elif prefer_hour:
-        gran = "hour"
-    else:
-        gran = "hour" if hours else "quarter"
-
-    return {"hours": hours, "quarters": quarters, "granularity": gran}
-
-def extract_explicit_time_groups(text: str) -> Dict[str, List[Tuple[int,int]]]:
-    """
-    Return explicit time groups (do not merge overlaps) and de-duplicate them.
-    Prevents duplicates when the same span matches both the generic time regex
-    and the '... hrs' regex.
-    """
-    s = normalize(text).lower()
-    hours_groups_raw, slot_groups_raw = [], []
-
-    time_pat = re.compile(
-        r"\b(\d{1,2})(?::(\d{2}))?\s*(am|pm)?\s*(?:to|-)\s*(\d{1,2})(?::(\d{2}))?\s*(am|pm)?\b",
-        re.I,
-    )
-
-    def _to24(h, ampm):
-        h = int(h)
-        if ampm:
-            h = h % 12
-            if ampm.lower() == "pm":
-                h += 12
-        return max(0, min(23, h))
-
-    # A) HH[:MM][am/pm] to HH[:MM][am/pm]
-    for m in time_pat.finditer(s):
-        h1, m1, a1 = int(m.group(1)), int(m.group(2) or 0), m.group(3)
-        h2, m2, a2 = int(m.group(4)), int(m.group(5) or 0), m.group(6)
-        H1, H2 = _to24(h1, a1), _to24(h2, a2)
-
-        # hour blocks 1..24, inclusive
-        sb = min(24, H1 + 1 + (1 if m1 > 0 else 0))
-        eb = min(24, H2 + (0 if m2 == 0 else 1))
-        if m2 == 0:
-            eb = max(1, H2)
-        # special “to 24”
-        if (m.group(4).isdigit() and int(m.group(4)) == 24 and a2 is None and m2 == 0):
-            eb = 24
-        if eb >= sb:
-            hours_groups_raw.append((sb, eb))
-
-        # 15-min slots 1..96
-        def ceil_slot(h, mm): return (h*60 + mm + 14)//15 + 1
-        def end_slot(h, mm):  return (h*60 + mm)//15
-        sslot = max(1, min(96, ceil_slot(H1, m1)))
-        eslot = max(1, min(96, end_slot(H2, m2)))
-        if (m.group(4).isdigit() and int(m.group(4)) == 24 and a2 is None and m2 == 0):
-            eslot = 96
-        if eslot >= sslot:
-            slot_groups_raw.append((sslot, eslot))
-
-    # B) “H to H hrs/hours”  (24 allowed on right)
-    for m in re.finditer(r"\b(\d{1,2})\s*(?:to|-)\s*(\d{1,2})\s*(?:hours?|hrs?)\b", s, re.I):
-        h1 = max(0, min(23, int(m.group(1))))
-        h2 = max(0, min(24, int(m.group(2))))
-        sb = min(24, h1 + 1)
-        eb = 24 if h2 == 24 else max(1, min(24, h2))
-        if eb >= sb:
-            hours_groups_raw.append((sb, eb))
-
-    # C) “blocks/slots A-B”
-    for m in re.finditer(r"\b(\d{1,2})\s*(?:to|-)\s*(\d{1,2})\s*(?:blocks?|slots?|quarters?)\b", s, re.I):
-        a, b = int(m.group(1)), int(m.group(2))
-        lo, hi = sorted((a, b))
-        lo = max(1, lo); hi = min(96, hi)
-        slot_groups_raw.append((lo, hi))
-
-    # Deduplicate while preserving order
-    def dedupe(pairs: List[Tuple[int,int]]) -> List[Tuple[int,int]]:
-        seen = set()
-        out = []
-        for a,b in pairs:
-            key = (min(a,b), max(a,b))
-            if key not in seen:
-                seen.add(key)
-                out.append(key)
-        return out
-
-        # If we already have explicit hour groups and user did not mention
-    # slots/blocks/quarters, suppress slot groups entirely.
-    if hours_groups_raw and not re.search(r'\b(slots?|blocks?|quarters?)\b', s):
-        slot_groups_raw = []
-
-
-    return {"hours": dedupe(hours_groups_raw), "slots": dedupe(slot_groups_raw)}
-
-
-def canonicalize(market: str, start: Optional[date], end: Optional[date], gran: str, hours: List[int], slots: List[int], stat: str) -> Optional[QuerySpec]:
-    if not start or not end:
-        return None
-    if start > end:
-        start, end = end, start
-    market = "GDAM" if market.upper()=="GDAM" else "DAM"
-    gran = "hour" if gran=="hour" else "quarter"
-    if gran == "hour":
-        hs = sorted(set([h for h in hours if 1<=h<=24])) or list(range(1,25))
-        return QuerySpec(market, start, end, "hour", hs, None, stat if stat in ("list","twap","vwap","daily_avg") else "list")
-    else:
-        qs = sorted(set([q for q in slots if 1<=q<=96])) or list(range(1,97))
-        return QuerySpec(market, start, end, "quarter", None, qs, stat if stat in ("list","twap","vwap","daily_avg") else "list")
-
 
 def dmy(d: date) -> str: return d.strftime("%d %b %Y")
 
@@ -626,58 +338,263 @@ def format_duration(block_start: Optional[int], block_end: Optional[int]) -> str
 # DB calls (DAM/GDAM)
 # ─────────────────────────────────────────────────────────────
 
-def fetch_hourly(market: str, ds: date, de: date, b1: Optional[int], b2: Optional[int]) -> List[Dict]:
-    with _connect() as conn, conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-        if b1 and b2:
-            cur.execute("SELECT * FROM public.rpc_get_hourly_prices_range(%s,%s,%s,%s,%s);", (market, ds, de, b1, b2))
-        else:
-            cur.execute("SELECT * FROM public.rpc_get_hourly_prices_range(%s,%s,%s,NULL,NULL);", (market, ds, de))
-        return [dict(r) for r in cur.fetchall()]
+async def fetch_hourly(market: str, ds: date, de: date, b1: Optional[int], b2: Optional[int]) -> List[Dict]:
+    if b1 and b2:
+        return await POOL.fetch_dicts("SELECT * FROM public.rpc_get_hourly_prices_range(%s,%s,%s,%s,%s);", (market, ds, de, b1, b2))
+    return await POOL.fetch_dicts("SELECT * FROM public.rpc_get_hourly_prices_range(%s,%s,%s,NULL,NULL);", (market, ds, de))
 
 
-def fetch_quarter(market: str, ds: date, de: date, s1: Optional[int], s2: Optional[int]) -> List[Dict]:
-    with _connect() as conn, conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-        if s1 and s2:
-            cur.execute("SELECT * FROM public.rpc_get_quarter_prices_range(%s,%s,%s,%s,%s);", (market, ds, de, s1, s2))
-        else:
-            cur.execute("SELECT * FROM public.rpc_get_quarter_prices_range(%s,%s,%s,NULL,NULL);", (market, ds, de))
-        return [dict(r) for r in cur.fetchall()]
+async def fetch_quarter(market: str, ds: date, de: date, s1: Optional[int], s2: Optional[int]) -> List[Dict]:
+    if s1 and s2:
+        return await POOL.fetch_dicts("SELECT * FROM public.rpc_get_quarter_prices_range(%s,%s,%s,%s,%s);", (market, ds, de, s1, s2))
+    return await POOL.fetch_dicts("SELECT * FROM public.rpc_get_quarter_prices_range(%s,%s,%s,NULL,NULL);", (market, ds, de))
+
+
+# Range-set variants: every (lo, hi) block/slot range of a spec in ONE statement.
+# The single-range RPCs are applied per range via LATERAL; rows come back grouped
+# by range (in the order given) and then by date/index, exactly as the old
+# per-range loop concatenated them.
+_HOURLY_RANGES_SQL = """
+SELECT r.*
+FROM unnest(%s::int[], %s::int[]) WITH ORDINALITY AS g(lo, hi, ord)
+CROSS JOIN LATERAL public.rpc_get_hourly_prices_range(%s, %s, %s, g.lo, g.hi) AS r
+ORDER BY g.ord, r.delivery_date, r.block_index;
+"""
+
+_QUARTER_RANGES_SQL = """
+SELECT r.*
+FROM unnest(%s::int[], %s::int[]) WITH ORDINALITY AS g(lo, hi, ord)
+CROSS JOIN LATERAL public.rpc_get_quarter_prices_range(%s, %s, %s, g.lo, g.hi) AS r
+ORDER BY g.ord, r.delivery_date, r.slot_index;
+"""
+
+
+# Aggregate mode: the same range-set query, reduced in Postgres to the sums
+# PriceAgg needs, so stat != 'list' moves one row over the wire instead of
+# every hourly/15-min row.
+_AGG_RANGES_SQL = """
+SELECT count(*)::int                                              AS n_rows,
+       count(DISTINCT r.delivery_date)::int                       AS n_days,
+       coalesce(sum(r.duration_min::float8), 0)                   AS minutes,
+       coalesce(sum(r.{price}::float8 * r.duration_min), 0)       AS price_min,
+       coalesce(sum(coalesce(r.{mw}, 0)::float8 * r.duration_min), 0) AS mw_min,
+       coalesce(sum(r.{price}::float8 * coalesce(r.{mw}, 0) * r.duration_min), 0) AS price_mw_min,
+       min(r.{price})::float8                                     AS min_price,
+       max(r.{price})::float8                                     AS max_price
+FROM unnest(%s::int[], %s::int[]) AS g(lo, hi)
+CROSS JOIN LATERAL public.{rpc}(%s, %s, %s, g.lo, g.hi) AS r;
+"""
+_HOURLY_AGG_SQL  = _AGG_RANGES_SQL.format(rpc="rpc_get_hourly_prices_range", price="price_avg_rs_per_mwh", mw="scheduled_mw_sum")
+_QUARTER_AGG_SQL = _AGG_RANGES_SQL.format(rpc="rpc_get_quarter_prices_range", price="price_rs_per_mwh", mw="scheduled_mw")
+
+
+async def _fetch_agg(sql: str, market: str, ds: date, de: date, ranges: List[Tuple[int, int]]) -> PriceAgg:
+    # An empty range list becomes a single (NULL, NULL) pair, i.e. the whole day.
+    los = [a for a, _ in ranges] or [None]
+    his = [b for _, b in ranges] or [None]
+    rows = await POOL.fetch_dicts(sql, (los, his, market, ds, de))
+    return PriceAgg(**rows[0]) if rows else PriceAgg()
+
+
+async def fetch_hourly_agg(market: str, ds: date, de: date, ranges: List[Tuple[int, int]]) -> PriceAgg:
+    return await _fetch_agg(_HOURLY_AGG_SQL, market, ds, de, ranges)
+
+
+async def fetch_quarter_agg(market: str, ds: date, de: date, ranges: List[Tuple[int, int]]) -> PriceAgg:
+    return await _fetch_agg(_QUARTER_AGG_SQL, market, ds, de, ranges)
+
+
+# List mode: only the rows a list table shows (the first and last LIST_EDGE_ROWS
+# in range-set order) plus the total count; the sort happens in Postgres, so
+# transfer and client memory stay flat however long the range is.
+_WINDOW_RANGES_SQL = """
+SELECT * FROM (
+  SELECT r.*, row_number() OVER (ORDER BY g.ord, r.delivery_date, r.{idx}) AS rn_, count(*) OVER () AS n_
+  FROM unnest(%s::int[], %s::int[]) WITH ORDINALITY AS g(lo, hi, ord)
+  CROSS JOIN LATERAL public.{rpc}(%s, %s, %s, g.lo, g.hi) AS r
+) x
+WHERE rn_ <= %s OR rn_ > n_ - %s
+ORDER BY rn_;
+"""
+_HOURLY_WINDOW_SQL  = _WINDOW_RANGES_SQL.format(rpc="rpc_get_hourly_prices_range", idx="block_index")
+_QUARTER_WINDOW_SQL = _WINDOW_RANGES_SQL.format(rpc="rpc_get_quarter_prices_range", idx="slot_index")
+
+
+async def _fetch_window(sql: str, market: str, ds: date, de: date, ranges: List[Tuple[int, int]]) -> Tuple[List[Dict], int]:
+    los = [a for a, _ in ranges] or [None]
+    his = [b for _, b in ranges] or [None]
+    rows = await POOL.fetch_dicts(sql, (los, his, market, ds, de, LIST_EDGE_ROWS, LIST_EDGE_ROWS))
+    return rows, (int(rows[0]["n_"]) if rows else 0)
+
+
+async def fetch_hourly_ranges(market: str, ds: date, de: date, ranges: List[Tuple[int, int]]) -> List[Dict]:
+    if not ranges:
+        return await fetch_hourly(market, ds, de, None, None)
+    los, his = [a for a, _ in ranges], [b for _, b in ranges]
+    return await POOL.fetch_dicts(_HOURLY_RANGES_SQL, (los, his, market, ds, de))
+
+
+async def fetch_quarter_ranges(market: str, ds: date, de: date, ranges: List[Tuple[int, int]]) -> List[Dict]:
+    if not ranges:
+        return await fetch_quarter(market, ds, de, None, None)
+    los, his = [a for a, _ in ranges], [b for _, b in ranges]
+    return await POOL.fetch_dicts(_QUARTER_RANGES_SQL, (los, his, market, ds, de))
+
+# Full-history loads for the cube engine (lean tuples, long statement timeout).
+_CUBE_SQL = {
+    "hour": "SELECT delivery_date, block_index, price_avg_rs_per_mwh::float8, scheduled_mw_sum::float8, duration_min "
+            "FROM public.rpc_get_hourly_prices_range(%s,%s,%s,NULL,NULL);",
+    "quarter": "SELECT delivery_date, slot_index, price_rs_per_mwh::float8, scheduled_mw::float8, duration_min "
+               "FROM public.rpc_get_quarter_prices_range(%s,%s,%s,NULL,NULL);",
+}
+
+
+# Hours from the materialized series (sql/008) when it exists, so the cube has
+# the derived hours, their VWAP price and the derived flag like the DB paths.
+_CUBE_HOURLY_SERIES_SQL = (
+    "SELECT delivery_date, block_index, price_avg_rs_per_mwh, scheduled_mw_sum, duration_min, "
+    "price_vwap_rs_per_mwh, derived FROM price_hourly "
+    "WHERE market = %s AND delivery_date BETWEEN %s AND %s ORDER BY delivery_date, block_index;"
+)
+
+
+async def _cube_loader(market: str, gran: str, ds: date, de: date) -> AsyncIterator[List[Tuple]]:
+    sql = _CUBE_SQL[gran]
+    if gran == "hour":
+        await HOURLY.refresh_coverage()
+        if HOURLY.available:
+            sql = _CUBE_HOURLY_SERIES_SQL
+    async for chunk in POOL.stream(sql, (market, ds, de), chunk_rows=DB_FETCH_CHUNK_ROWS, timeout_ms=CUBE_LOAD_TIMEOUT_MS):
+        yield chunk
+
+
+async def _cube_refresher():
+    while True:
+        try:
+            await CUBE.load(_cube_loader)
+            if PERF_LOG:
+                print(f"[cube] loaded in {CUBE.load_seconds:.1f}s: {CUBE.stats()}")
+        except Exception:
+            traceback.print_exc()
+        await asyncio.sleep(CUBE_REFRESH_SEC)
+
+
+# Entry points used by the handlers, in order of preference:
+#   1) QUERY_ENGINE=cube and the cube holds the whole date range → NumPy;
+#   2) aggregates only: the rollup tables, when they hold the whole range;
+#   3) short ranges → PRICE_CACHE day-slices;
+#   4) otherwise the range-set / aggregate SQL.
+# Hourly steps 3–4 read the materialized hourly series when it holds the range,
+# so days with only 15-min data come back in the same query (derived=True).
+def _use_cube(market: str, gran: str, ds: date, de: date) -> bool:
+    return QUERY_ENGINE == "cube" and CUBE.covers(market, gran, ds, de)
+
+
+async def _use_rollups(market: str, gran: str, ds: date, de: date) -> bool:
+    return USE_ROLLUPS and await ROLLUPS.covers(market, gran, ds, de)
+
+
+async def _use_hourly_series(market: str, ds: date, de: date) -> bool:
+    return USE_HOURLY_SERIES and await HOURLY.covers(market, "hour", ds, de)
+
+
+def _cacheable(ds: date, de: date) -> bool:
+    return PRICE_CACHE.enabled and (de - ds).days + 1 <= PRICE_CACHE_MAX_SPAN_DAYS
+
+
+async def get_hourly_rows(market: str, ds: date, de: date, ranges: List[Tuple[int, int]]) -> List[Dict]:
+    if _use_cube(market, "hour", ds, de):
+        return CUBE.rows(market, "hour", ds, de, ranges)
+    series = await _use_hourly_series(market, ds, de)
+    if _cacheable(ds, de):
+        load = (lambda a, b: HOURLY.rows(market, a, b, [])) if series else \
+               (lambda a, b: fetch_hourly(market, a, b, None, None))
+        return await PRICE_CACHE.get_rows(market, "hour", ds, de, ranges, load)
+    if series:
+        return await HOURLY.rows(market, ds, de, ranges)
+    return await fetch_hourly_ranges(market, ds, de, ranges)
+
+
+async def get_quarter_rows(market: str, ds: date, de: date, ranges: List[Tuple[int, int]]) -> List[Dict]:
+    if _use_cube(market, "quarter", ds, de):
+        return CUBE.rows(market, "quarter", ds, de, ranges)
+    if _cacheable(ds, de):
+        return await PRICE_CACHE.get_rows(market, "quarter", ds, de, ranges,
+                                          lambda a, b: fetch_quarter(market, a, b, None, None))
+    return await fetch_quarter_ranges(market, ds, de, ranges)
+
+
+async def get_hourly_agg(market: str, ds: date, de: date, ranges: List[Tuple[int, int]]) -> PriceAgg:
+    if _use_cube(market, "hour", ds, de):
+        with stage("aggregate"):
+            return PriceAgg(**CUBE.sums(market, "hour", ds, de, ranges))
+    if await _use_rollups(market, "hour", ds, de):
+        return PriceAgg(**await ROLLUPS.sums(market, "hour", ds, de, ranges))
+    if _cacheable(ds, de):
+        return PriceAgg.from_rows(await get_hourly_rows(market, ds, de, ranges), "price_avg_rs_per_mwh",
+                                  "scheduled_mw_sum", vwap_key="price_vwap_rs_per_mwh")
+    if await _use_hourly_series(market, ds, de):
+        return PriceAgg(**await HOURLY.sums(market, ds, de, ranges))
+    return await fetch_hourly_agg(market, ds, de, ranges)
+
+
+async def get_quarter_agg(market: str, ds: date, de: date, ranges: List[Tuple[int, int]]) -> PriceAgg:
+    if _use_cube(market, "quarter", ds, de):
+        with stage("aggregate"):
+            return PriceAgg(**CUBE.sums(market, "quarter", ds, de, ranges))
+    if await _use_rollups(market, "quarter", ds, de):
+        return PriceAgg(**await ROLLUPS.sums(market, "quarter", ds, de, ranges))
+    if _cacheable(ds, de):
+        return PriceAgg.from_rows(await get_quarter_rows(market, ds, de, ranges), "price_rs_per_mwh", "scheduled_mw")
+    return await fetch_quarter_agg(market, ds, de, ranges)
+
+def _edges(rows: List[Dict]) -> List[Dict]:
+    return rows if len(rows) <= 2 * LIST_EDGE_ROWS else rows[:LIST_EDGE_ROWS] + rows[-LIST_EDGE_ROWS:]
+
+
+# List mode: (KPIs, first/last LIST_EDGE_ROWS rows, total row count). Rows already
+# in memory (cube, cached short ranges) are sliced; otherwise the KPIs come from
+# the aggregate path and only the edge rows are fetched, concurrently.
+async def get_hourly_list(market: str, ds: date, de: date, ranges: List[Tuple[int, int]]) -> Tuple[PriceAgg, List[Dict], int]:
+    if _use_cube(market, "hour", ds, de) or _cacheable(ds, de):
+        rows = await get_hourly_rows(market, ds, de, ranges)
+        agg = PriceAgg.from_rows(rows, "price_avg_rs_per_mwh", "scheduled_mw_sum", vwap_key="price_vwap_rs_per_mwh")
+        return agg, _edges(rows), len(rows)
+    if await _use_hourly_series(market, ds, de):
+        window = HOURLY.rows_window(market, ds, de, ranges, LIST_EDGE_ROWS)
+    else:
+        window = _fetch_window(_HOURLY_WINDOW_SQL, market, ds, de, ranges)
+    agg, (rows, n) = await asyncio.gather(get_hourly_agg(market, ds, de, ranges), window)
+    return agg, rows, n
+
+
+async def get_quarter_list(market: str, ds: date, de: date, ranges: List[Tuple[int, int]]) -> Tuple[PriceAgg, List[Dict], int]:
+    if _use_cube(market, "quarter", ds, de) or _cacheable(ds, de):
+        rows = await get_quarter_rows(market, ds, de, ranges)
+        return PriceAgg.from_rows(rows, "price_rs_per_mwh", "scheduled_mw"), _edges(rows), len(rows)
+    agg, (rows, n) = await asyncio.gather(get_quarter_agg(market, ds, de, ranges),
+                                          _fetch_window(_QUARTER_WINDOW_SQL, market, ds, de, ranges))
+    return agg, rows, n
 
 # ─────────────────────────────────────────────────────────────
 # DB calls (Derivatives)
 # ─────────────────────────────────────────────────────────────
 
-def fetch_deriv_daily_fallback(target_day: date, exchange: Optional[str]) -> List[Dict]:
+# Both go through DERIVS: deduped within a message, cached across messages.
+async def fetch_deriv_daily_fallback(target_day: date, exchange: Optional[str]) -> List[Dict]:
     """Returns daily close for nearest prior trading day (<= target_day) per exchange.
        If no rows (i.e., before Jul 2025), the caller renders N/A."""
-    with _connect() as conn, conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-        cur.execute("SELECT * FROM public.rpc_deriv_daily_with_fallback(%s,%s);", (exchange, target_day))
-        return [dict(r) for r in cur.fetchall()]
+    return await DERIVS.daily_close(target_day, exchange)
 
 
-def fetch_deriv_month_expiry(cm_first: date, exchange: Optional[str]) -> List[Dict]:
-    with _connect() as conn, conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-        cur.execute("SELECT * FROM public.rpc_deriv_expiry_for_month(%s,%s);", (exchange, cm_first))
-        return [dict(r) for r in cur.fetchall()]
+async def fetch_deriv_month_expiry(cm_first: date, exchange: Optional[str]) -> List[Dict]:
+    return await DERIVS.month_expiry(cm_first, exchange)
 
 # ─────────────────────────────────────────────────────────────
 # Math (₹/kWh)
 # ─────────────────────────────────────────────────────────────
 
-def twap_kwh(rows: List[Dict], price_key: str, minute_key: str) -> Optional[float]:
-    if not rows: return None
-    num = sum(float(r[price_key]) * float(r[minute_key]) for r in rows)
-    den = sum(float(r[minute_key]) for r in rows)
-    return None if den==0 else (num/den)/1000.0
-
-
-def vwap_kwh(rows: List[Dict], price_key: str, sched_key: str, minute_key: str) -> Optional[float]:
-    if not rows: return None
-    weights = [float(r.get(sched_key) or 0) * float(r[minute_key]) for r in rows]
-    num = sum(float(r[price_key]) * w for r, w in zip(rows, weights))
-    den = sum(weights)
-    if den>0: return (num/den)/1000.0
-    return twap_kwh(rows, price_key, minute_key)
+# twap_kwh / vwap_kwh (row-based) and the column kernels live in app/kernels.py.
 
 
 def money(v: Optional[float]) -> str:
@@ -730,33 +647,38 @@ def _render_selection_card(spec, time_label: str, idx_label: str, count: int) ->
     )
 
 
-# Tables for DAM/GDAM
+# Tables for DAM/GDAM: lists show the first and last LIST_EDGE_ROWS rows.
+LIST_EDGE_ROWS = 60
 
-def rows_to_md_hour(rows: List[Dict], limit=120) -> str:
+def rows_to_md_hour(rows: List[Dict], limit=2 * LIST_EDGE_ROWS, total: Optional[int] = None) -> str:
+    """``rows`` may already be just the edges of a longer list; ``total`` is then its length."""
     if not rows: return "_No rows._"
+    total = len(rows) if total is None else total
     hdr="| Date | Hour (HH:MM–HH:MM) | Block | Price (₹/kWh) | Sched MW |\n|---|---|---:|---:|---:|"
-    show = rows if len(rows)<=limit else rows[:60]+rows[-60:]
+    show = rows if len(rows)<=limit else rows[:limit//2]+rows[-(limit//2):]
     lines=[hdr]
     for r in show:
         dd = r["delivery_date"] if isinstance(r["delivery_date"], str) else dmy(r["delivery_date"])
         b  = int(r["block_index"])
         price_kwh = float(r["price_avg_rs_per_mwh"])/1000.0
         lines.append(f"| {dd} | {hour_block_window(b)} | {b:>2} | {price_kwh:.4f} | {float(r['scheduled_mw_sum'] or 0):.2f} |")
-    if len(rows)>limit: lines.insert(1,f"_Showing first 60 and last 60 of {len(rows)} rows (total {len(rows)})._")
+    if total>limit: lines.insert(1,f"_Showing first {limit//2} and last {limit//2} of {total} rows (total {total})._")
     return "\n".join(lines)
 
 
-def rows_to_md_quarter(rows: List[Dict], limit=120) -> str:
+def rows_to_md_quarter(rows: List[Dict], limit=2 * LIST_EDGE_ROWS, total: Optional[int] = None) -> str:
+    """``rows`` may already be just the edges of a longer list; ``total`` is then its length."""
     if not rows: return "_No rows._"
+    total = len(rows) if total is None else total
     hdr="| Date | Slot (HH:MM–HH:MM) | Slot # | Price (₹/kWh) | Sched MW |\n|---|---|---:|---:|---:|"
-    show = rows if len(rows)<=limit else rows[:60]+rows[-60:]
+    show = rows if len(rows)<=limit else rows[:limit//2]+rows[-(limit//2):]
     lines=[hdr]
     for r in show:
         dd = r["delivery_date"] if isinstance(r["delivery_date"], str) else dmy(r["delivery_date"])
         s  = int(r["slot_index"])
         price_kwh = float(r["price_rs_per_mwh"])/1000.0
         lines.append(f"| {dd} | {slot_window(s)} | {s:>2} | {price_kwh:.4f} | {float(r['scheduled_mw'] or 0):.2f} |")
-    if len(rows)>limit: lines.insert(1,f"_Showing first 60 and last 60 of {len(rows)} rows (total {len(rows)})._")
+    if total>limit: lines.insert(1,f"_Showing first {limit//2} and last {limit//2} of {total} rows (total {total})._")
     return "\n".join(lines)
 
 # ─────────────────────────────────────────────────────────────
@@ -872,56 +794,289 @@ def render_deriv_expiry(cm_first: date, rows: List[Dict]) -> str:
         lines.append(f"- **{r['exchange']} • {r['commodity']}** → ₹{price_kwh:.2f}/kWh")
     return "\n".join(lines)
 
-def _exec(sql, params=None, fetch="none"):
-    with _connect() as conn, conn.cursor() as cur:
-        cur.execute(sql, params or ())
-        if fetch == "one":
-            r = cur.fetchone(); return r[0] if r else None
-        if fetch == "all":
-            return cur.fetchall()
-        return None
-
+# Session/event writes are queued and flushed in bulk by ANALYTICS; these never block.
 def analytics_start_session(session_id: str, user_agent=None, referer=None, ip=None):
-    _exec("""
-      insert into analytics_usage_sessions (id, user_agent, referer, ip)
-      values (%s, %s, %s, %s)
-      on conflict (id) do update set last_seen = now()
-    """, (session_id, user_agent, referer, ip))
+    ANALYTICS.start_session(session_id, user_agent, referer, ip)
 
 def analytics_touch_session(session_id: str):
-    _exec("update analytics_usage_sessions set last_seen = now() where id = %s", (session_id,))
+    ANALYTICS.touch_session(session_id)
 
 def analytics_end_session(session_id: str):
-    _exec("update analytics_usage_sessions set ended_at = now(), last_seen = now() where id = %s", (session_id,))
+    ANALYTICS.end_session(session_id)
 
 def analytics_log_event(session_id: str, etype: str, payload: dict):
-    _exec("insert into analytics_usage_events (session_id, type, payload) values (%s, %s, %s)",
-          (session_id, etype, json.dumps(payload)))
-
-def analytics_counts():
-    active = _exec(
-        "select count(*) from analytics_usage_sessions "
-        "where last_seen > now() - make_interval(secs := %s)",
-        (ANALYTICS_ACTIVE_WINDOW_SEC,), fetch="one"
-    ) or 0
-    today_sessions = _exec(
-        "select count(*) from analytics_usage_sessions where started_at::date = current_date", fetch="one"
-    ) or 0
-    total_sessions = _exec("select count(*) from analytics_usage_sessions", fetch="one") or 0
-    msgs_today = _exec(
-        "select count(*) from analytics_usage_events where type='message' and ts::date = current_date", fetch="one"
-    ) or 0
-    return dict(active_now=active, today_sessions=today_sessions, total_sessions=total_sessions, messages_today=msgs_today)
+    ANALYTICS.log_event(session_id, etype, payload)
+
+_stats_cache: Tuple[float, Optional[Dict]] = (0.0, None)
+
+async def analytics_counts():
+    global _stats_cache
+    now = asyncio.get_running_loop().time()
+    cached_at, cached = _stats_cache
+    if cached is not None and now - cached_at < STATS_CACHE_SEC:
+        return cached
+    await ANALYTICS.flush()      # include what's still queued
+    await ANALYTICS.check_rollup()
+    sql = COUNTS_ROLLUP_SQL if ANALYTICS.has_rollup else COUNTS_FALLBACK_SQL
+    row = await POOL.fetch_one(sql, (ANALYTICS_ACTIVE_WINDOW_SEC,)) or (0, 0, 0, 0)
+    active, today_sessions, total_sessions, msgs_today = (int(v or 0) for v in row)
+    c = dict(active_now=active, today_sessions=today_sessions, total_sessions=total_sessions, messages_today=msgs_today)
+    _stats_cache = (now, c)
+    return c
+
+
+async def _warm_pool():
+    # Pre-open DB_POOL_MIN connections so TLS setup isn't paid by the first query.
+    try:
+        await POOL.open_async()
+    except Exception:
+        traceback.print_exc()
+
+
+# ── startup warm-up ──────────────────────────────────────────
+# One query per parser branch (dates, months, years, clock/hour/slot ranges,
+# stats, exports, derivatives).
+_WARMUP_QUERIES = (
+    "dam 15 Jan 2024", "gdam yesterday", "dam Nov 2022, 2023, 2024 6-9, 12-14, 18-22 hrs",
+    "dam 10-15 Aug 2025 list", "gdam vwap 1 Jul 2025 to 30 Sep 2025", "dam 20 Oct 2025 slots 10-20 list",
+    "dam in 2024 vwap", "dam 24 September to 24 October 2025 7:30 to 9:15", "dam 5 Aug 2025 6pm to 9pm",
+    "gdam 01/08/2025 - 07/08/2025 daily avg", "dam oct-25 export parquet", "mcx dec 2024 expiry",
+)
+
+
+def _warm_pool_sync() -> str:
+    POOL.open()
+    with POOL.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+    return f"{POOL.stats()['size']} connections"
+
+
+def _warm_numpy() -> str:
+    import numpy
+    return f"numpy {numpy.__version__}"
+
+
+async def _warm_coverage() -> str:
+    found = []
+    if USE_ROLLUPS:
+        await ROLLUPS.refresh_coverage()
+        found.append(f"rollups {'on' if ROLLUPS.available else 'missing'}")
+    if USE_HOURLY_SERIES:
+        await HOURLY.refresh_coverage()
+        found.append(f"hourly series {'on' if HOURLY.available else 'missing'}")
+    await INGEST_LOG.poll()
+    found.append(f"ingest log {'on' if INGEST_LOG.available else 'missing'}")
+    await ANALYTICS.check_rollup()
+    return ", ".join(found)
+
+
+async def _warm_prices():
+    """Last WARMUP_PRICE_DAYS of every DAM/GDAM block and slot into PRICE_CACHE."""
+    if not WARMUP_PRICE_DAYS or not PRICE_CACHE.enabled or QUERY_ENGINE == "cube":
+        return False
+    await INGEST_LOG.poll()     # mark the log's end before anything is cached
+    de = date.today()
+    ds = de - timedelta(days=WARMUP_PRICE_DAYS - 1)
+    rows = 0
+    while ds <= de:    # in windows the cache accepts
+        we = min(de, ds + timedelta(days=PRICE_CACHE_MAX_SPAN_DAYS - 1))
+        for market in ("DAM", "GDAM"):
+            rows += len(await get_hourly_rows(market, ds, we, []))
+            rows += len(await get_quarter_rows(market, ds, we, []))
+        ds = we + timedelta(days=1)
+    return f"{WARMUP_PRICE_DAYS} days, {rows:,} rows"
+
+
+async def _warm_derivs():
+    if not WARMUP_DERIVS:
+        return False
+    await INGEST_LOG.poll()
+    rows = await DERIVS.daily_close(date.today())
+    return f"{len(rows)} closes"
+
+
+WARMUP = Warmup()
+if WARMUP_ENABLED:
+    WARMUP.defer([("coverage", _warm_coverage), ("prices", _warm_prices), ("derivatives", _warm_derivs)])
+    WARMUP.start_thread([("pool", _warm_pool_sync), ("parser", lambda: f"{PARSER.warm(_WARMUP_QUERIES)} samples"),
+                         ("numpy", _warm_numpy)])
+
+
+_cube_task: Optional[asyncio.Task] = None
+_pool_tasks: Set[asyncio.Task] = set()     # the loop only keeps weak references to tasks
 
 
 @cl.on_chat_start
 async def _start():
     import uuid
+    global _cube_task
+    if WARMUP_ENABLED:
+        WARMUP.start()
+    else:
+        task = asyncio.create_task(_warm_pool())
+        _pool_tasks.add(task)
+        task.add_done_callback(_pool_tasks.discard)
+    if QUERY_ENGINE == "cube" and _cube_task is None:
+        _cube_task = asyncio.create_task(_cube_refresher())
     sid = str(uuid.uuid4())
     cl.user_session.set("sid", sid)
     analytics_start_session(sid)
 
 
+# ─────────────────────────────────────────────────────────────
+# Per-spec pipeline (spot data + derivative companion)
+# ─────────────────────────────────────────────────────────────
+
+def _expected_rows(spec: QuerySpec, gran: str) -> int:
+    """Rows a complete range holds: days × requested blocks (or their 15-min slots)."""
+    days = (spec.end_date - spec.start_date).days + 1
+    if spec.granularity == "hour":
+        return days * len(spec.hours) * (1 if gran == "hour" else 4)
+    return days * len(spec.slots)
+
+
+def _kpi_line(spec: QuerySpec, agg: PriceAgg, gran: str, fallback: bool = False) -> str:
+    primary_value = agg.vwap_kwh() if spec.stat == "vwap" else agg.twap_kwh()
+    line = f"**{_primary_metric_label(spec.stat)}: {money(primary_value)} /kWh**"
+    if fallback:
+        line += "  \n_Fallback via 15-min slots_"
+    cov = agg.coverage(_expected_rows(spec, gran))
+    if agg.n_rows and cov is not None and cov < 0.9995:
+        unit = "hourly blocks" if gran == "hour" else "15-min slots"
+        line += f"  \n_Data for {agg.n_rows:,} of {_expected_rows(spec, gran):,} {unit} ({cov:.0%})_"
+    return line + "\n\n"
+
+
+async def spot_section_agg(spec: QuerySpec) -> str:
+    """KPI line for twap/vwap/daily_avg, computed in Postgres (no row transfer)."""
+    if spec.granularity == "hour":
+        hranges = _compress_ranges(spec.hours)
+        agg = await get_hourly_agg(spec.market, spec.start_date, spec.end_date, hranges)
+        if agg.n_rows:
+            return _kpi_line(spec, agg, "hour", fallback=agg.n_derived > 0)
+        # Only reached when the hourly source has no rows at all (RPC path, or no data).
+        agg = await get_quarter_agg(spec.market, spec.start_date, spec.end_date, _hour_blocks_to_slot_ranges(hranges))
+        return _kpi_line(spec, agg, "quarter", fallback=True)
+    agg = await get_quarter_agg(spec.market, spec.start_date, spec.end_date, _compress_ranges(spec.slots))
+    return _kpi_line(spec, agg, "quarter")
+
+
+async def spot_section(spec: QuerySpec) -> str:
+    """KPI line + optional table for one spec (hourly with 15-min fallback)."""
+    if spec.stat != "list":
+        return await spot_section_agg(spec)
+    if spec.granularity == "hour":
+        hranges = _compress_ranges(spec.hours)
+        agg, rows, n = await get_hourly_list(spec.market, spec.start_date, spec.end_date, hranges)
+        if n:
+            kpi  = _kpi_line(spec, agg, "hour", fallback=agg.n_derived > 0)
+            with stage("render"):
+                body = rows_to_md_hour(rows, total=n)
+        else:
+            agg, qrows, n = await get_quarter_list(spec.market, spec.start_date, spec.end_date,
+                                                   _hour_blocks_to_slot_ranges(hranges))
+            kpi  = _kpi_line(spec, agg, "quarter", fallback=True)
+            with stage("render"):
+                body = rows_to_md_quarter(qrows, total=n)
+    else:
+        agg, qrows, n = await get_quarter_list(spec.market, spec.start_date, spec.end_date, _compress_ranges(spec.slots))
+        kpi  = _kpi_line(spec, agg, "quarter")
+        with stage("render"):
+            body = rows_to_md_quarter(qrows, total=n)
+    return kpi + body
+
+
+async def deriv_section(spec: QuerySpec, s_norm: str) -> str:
+    """Derivative companion block for one spec ("" when nothing to show)."""
+    deriv_block = ""
+
+    if spec.start_date == spec.end_date:
+        # Single day → last close as of that day (per exchange), DB handles fallback.
+        drows = await fetch_deriv_daily_fallback(spec.end_date, None)
+        if drows:
+            deriv_block = "\n" + render_deriv_companion_for_day(spec.end_date, drows)
+
+    elif _same_calendar_month(spec.start_date, spec.end_date) or is_month_intent(s_norm, spec.start_date, spec.end_date):
+        # Range fully inside one month:
+        # 1) Try daily close for the SAME contract month up to the end date.
+        drows = await fetch_deriv_daily_fallback(spec.end_date, None)
+
+        filtered = []
+        seen_ex = set()
+        for r in drows:
+            if _is_same_contract_month(spec.end_date, r['contract_month']):
+                ex = r['exchange']
+                if ex not in seen_ex:
+                    seen_ex.add(ex)
+                    filtered.append(r)
+
+        if filtered:
+            deriv_block = "\n" + render_deriv_daily_for_contract_month(spec.end_date, filtered)
+        else:
+            # 2) If no daily rows for that contract month → show that month’s EXPIRY,
+            #    but as a single date (not 01–31) via the renderer above.
+            cm_first = date(spec.end_date.year, spec.end_date.month, 1)
+            mrows = await fetch_deriv_month_expiry(cm_first, None)
+            deriv_block = "\n" + render_deriv_expiry(cm_first, mrows)
+
+    else:
+        # Cross-month ranges → last close as of end date (per exchange).
+        drows = await fetch_deriv_daily_fallback(spec.end_date, None)
+        if drows:
+            deriv_block = "\n" + render_deriv_companion_for_day(spec.end_date, drows)
+
+    return deriv_block
+
+
+async def export_spec(spec: QuerySpec, fmt: str) -> ExportResult:
+    """Every row of the spec in a file; hourly falls back to 15-min slots like spot_section."""
+    name = f"{spec.market}_{spec.start_date:%Y%m%d}-{spec.end_date:%Y%m%d}"
+    if spec.granularity == "hour":
+        hranges = _compress_ranges(spec.hours)
+        if hranges and hranges != [(1, 24)]:
+            name += "_h" + "_".join(f"{a}-{b}" for a, b in hranges)[:40]
+        series = await _use_hourly_series(spec.market, spec.start_date, spec.end_date)
+        res = await EXPORTS.export(HOURLY_SERIES_SQL if series else HOURLY_RPC_SQL,
+                                   statement_args(spec.market, spec.start_date, spec.end_date, hranges),
+                                   "hour", fmt, f"{name}_hourly")
+        if res.rows or series:
+            return res
+        discard(res.path)
+        slots = _hour_blocks_to_slot_ranges(hranges)
+    else:
+        slots = _compress_ranges(spec.slots)
+        if slots and slots != [(1, 96)]:
+            name += "_s" + "_".join(f"{a}-{b}" for a, b in slots)[:40]
+    return await EXPORTS.export(QUARTER_RPC_SQL, statement_args(spec.market, spec.start_date, spec.end_date, slots),
+                                "quarter", fmt, f"{name}_15min")
+
+
+def _export_line(res: ExportResult) -> str:
+    if not res.rows:
+        return "\n📎 _Nothing to export for this selection._"
+    kind = "Parquet" if res.fmt == "parquet" else "CSV (gzip)"
+    note = f" _{res.note}_" if res.note else ""
+    return f"\n📎 **Export:** `{res.name}` — {res.rows:,} rows, {kind}, attached below.{note}"
+
+
+async def render_spec_section(spec: QuerySpec, s_norm: str) -> str:
+    """Full markdown section for one spec; spot and derivative lookups run concurrently."""
+    if spec.granularity == "hour":
+        tlabel, blabel, n = _label_hour_ranges(spec.hours)
+        selection_card = _render_selection_card(spec, tlabel, blabel, n)
+    else:
+        tlabel, slabel, n = _label_slot_ranges(spec.slots)
+        selection_card = _render_selection_card(spec, tlabel, slabel, n)
+
+    title  = f"## Spot Market ({spec.market}) — {dmy(spec.start_date)} to {dmy(spec.end_date)}"
+    header = f"{title}\n\n{selection_card}"
+
+    spot, deriv_block = await asyncio.gather(timed("spot", spot_section(spec)), timed("deriv", deriv_section(spec, s_norm)))
+    return header + "\n" + spot + deriv_block
+
+
 # ─────────────────────────────────────────────────────────────
 # Main handler
 # ─────────────────────────────────────────────────────────────
@@ -929,14 +1084,46 @@ async def _start():
 @cl.on_message
 async def on_message(msg: cl.Message):
     text_raw = msg.content.strip()
+    with PERF.trace(chars=len(text_raw)):
+        await _handle_message(text_raw)
+
+
+async def _handle_message(text_raw: str):
     sid = cl.user_session.get("sid")
     if sid:
-        analytics_touch_session(sid)
-        analytics_log_event(sid, "message", {"len": len(text_raw), "text_preview": text_raw[:120]})
-
-    # quick stats command
+        with stage("analytics"):
+            analytics_touch_session(sid)
+            analytics_log_event(sid, "message", {"len": len(text_raw), "text_preview": text_raw[:120]})
+
+    # quick stats / latency commands
+    if text_raw.lower() in ("/perf", "perf"):
+        annotate(kind="perf")
+        p = POOL.stats()
+        cube = ""
+        if QUERY_ENGINE == "cube" and CUBE.ready:
+            cube = f" _Cube: last reload took {CUBE.load_seconds:.1f}s, {CUBE.age() / 60:.0f} min ago._"
+        await cl.Message(
+            author=ASSISTANT_AUTHOR,
+            content=(PERF.render_md() + f"\n\n_DB pool: {p['in_use']}/{p['size']} in use (max {p['maxconn']}), "
+                     f"{p['waits']} waits, {p['timeouts']} timeouts._" + cube),
+        ).send()
+        return
+    if text_raw.lower() in ("/ready", "ready"):
+        annotate(kind="ready")
+        await cl.Message(author=ASSISTANT_AUTHOR, content=WARMUP.render_md()).send()
+        return
+    if text_raw.lower() in ("/slowlog", "slowlog", "/slowlog dump", "slowlog dump"):
+        annotate(kind="slowlog")
+        elements = []
+        if text_raw.lower().endswith("dump") and SLOWLOG.entries():
+            elements = [cl.File(name="slowlog.jsonl", content=SLOWLOG.dump_jsonl().encode("utf-8"),
+                                mime="application/x-ndjson", display="inline")]
+        await cl.Message(author=ASSISTANT_AUTHOR, content=SLOWLOG.render_md(), elements=elements).send()
+        return
     if text_raw.lower() in ("/stats", "stats"):
-        c = analytics_counts()
+        annotate(kind="stats")
+        with stage("stats"):
+            c = await analytics_counts()
         await cl.Message(
             author=ASSISTANT_AUTHOR,
             content=(
@@ -948,167 +1135,98 @@ async def on_message(msg: cl.Message):
             ),
         ).send()
         return
-    s_norm = normalize(text_raw)
-
-    progress = await progress_start("💭 Interpreting …")
-    await asyncio.sleep(0.10)
-    await progress_update(progress, "🧮 Querying …")
+    with stage("progress"):
+        progress = await progress_start("💭 Interpreting …")
+        if PROGRESS_DELAY_SEC > 0:
+            with stage("progress_delay"):
+                await asyncio.sleep(PROGRESS_DELAY_SEC)
+        await progress_update(progress, "🧮 Querying …")
 
     try:
-        market = parse_market(s_norm)
-        stat = parse_stat(s_norm)
-
-        periods = parse_multi_year_months(s_norm)
-        if not periods:
-            start, end = parse_date_or_range(s_norm)
-            if not start or not end:
-                await progress_hide(progress)
-                await cl.Message(
-                    author=ASSISTANT_AUTHOR,
-                    content=("I couldn't infer a date. Try `31/10/2025`, `30 Sep 2025`, `Oct 2025`, `10–15 Aug 2025`, or `yesterday`."),
-                ).send()
-                return
-            periods = [(start, end)]
-
-        # explicit time groups
-        groups = extract_explicit_time_groups(s_norm)
-        explicit_groups = []
-        if groups["hours"]:
-            for sb, eb in groups["hours"]:
-                explicit_groups.append({"granularity": "hour", "hours": list(range(sb, eb + 1)), "slots": None})
-        if groups["slots"]:
-            for s1, s2 in groups["slots"]:
-                explicit_groups.append({"granularity": "quarter", "hours": None, "slots": list(range(s1, s2 + 1))})
-
-        if not explicit_groups:
-            parsed = parse_ranges(s_norm)
-            if parsed["granularity"] == "hour":
-                explicit_groups = [{"granularity": "hour", "hours": parsed["hours"], "slots": None}]
-            else:
-                explicit_groups = [{"granularity": "quarter", "hours": None, "slots": parsed["quarters"]}]
-
-        specs: List[QuerySpec] = []
-        for ps, pe in periods:
-            if ps and ps < DATE_MIN_GUARD:
-                continue
-            for g in explicit_groups:
-                spec = canonicalize(market, ps, pe, g["granularity"], g.get("hours") or [], g.get("slots") or [], stat)
-                if spec:
-                    specs.append(spec)
-                            # De-duplicate identical specs (same period + same hour/slot ranges)
-                    def _spec_key(sp: QuerySpec):
-                        hrs = tuple(_compress_ranges(sp.hours or []))
-                        sls = tuple(_compress_ranges(sp.slots or []))
-                        return (sp.market, sp.start_date, sp.end_date, sp.granularity, hrs, sls, sp.stat, sp.area)
-
-                    uniq, seen = [], set()
-                    for sp in specs:
-                        k = _spec_key(sp)
-                        if k not in seen:
-                            seen.add(k)
-                            uniq.append(sp)
-                    specs = uniq
-
+        with stage("parse"):
+            pq = PARSER.parse(text_raw)
+            specs = build_specs(pq) if pq.periods else []
+            export_fmt = parse_export(pq.text)
+        s_norm = pq.text
+        annotate(kind="query", specs=len(specs), export=export_fmt)
+        if not pq.periods:
+            annotate(kind="no_date")
+            await progress_hide(progress)
+            await cl.Message(
+                author=ASSISTANT_AUTHOR,
+                content=("I couldn't infer a date. Try `31/10/2025`, `30 Sep 2025`, `Oct 2025`, `10–15 Aug 2025`, or `yesterday`."),
+            ).send()
+            return
 
         if not specs:
             await progress_hide(progress)
             await cl.Message(author=ASSISTANT_AUTHOR, content="Couldn't build a query from your input.").send()
             return
 
-        sections: List[str] = []
-        for spec in specs:
-            # Header
-            if spec.granularity == "hour":
-                tlabel, blabel, n = _label_hour_ranges(spec.hours)
-                selection_card = _render_selection_card(spec, tlabel, blabel, n)
-            else:
-                tlabel, slabel, n = _label_slot_ranges(spec.slots)
-                selection_card = _render_selection_card(spec, tlabel, slabel, n)
-
-            title  = f"## Spot Market ({spec.market}) — {dmy(spec.start_date)} to {dmy(spec.end_date)}"
-            header = f"{title}\n\n{selection_card}"
-
-            # Data & fallback
-            kpi, body = "", ""
-            if spec.granularity == "hour":
-                rows: List[Dict] = []
-                for b1, b2 in _compress_ranges(spec.hours):
-                    rows += fetch_hourly(spec.market, spec.start_date, spec.end_date, b1, b2)
-                if rows:
-                    twap = twap_kwh(rows, "price_avg_rs_per_mwh", "duration_min")
-                    vwap = vwap_kwh(rows, "price_avg_rs_per_mwh", "scheduled_mw_sum", "duration_min")
-                    primary_label = _primary_metric_label(spec.stat)
-                    primary_value = vwap if spec.stat == "vwap" else twap
-                    kpi  = f"**{primary_label}: {money(primary_value)} /kWh**\n\n"
-                    body = rows_to_md_hour(rows) if spec.stat == "list" else ""
+        # Drop cached days a recent ingest changed (every ROLLUP_COVERAGE_SEC).
+        await INGEST_LOG.poll()
+
+        # Every spec's derivative companion starts with the last close as of its
+        # end date: fetch all distinct end dates in one batched query up front.
+        prefetch = DERIVS.prefetch_daily([sp.end_date for sp in specs])
+
+        # Fan specs out concurrently (bounded) and stream each section into the
+        # reply as soon as it and all earlier ones are ready, in request order.
+        # The progress message counts finished specs in whatever order they end.
+        # With "export csv|parquet" each spec also writes its full series to a
+        # file, attached to the reply in spec order.
+        exports: Dict[int, ExportResult] = {}
+        sem = asyncio.Semaphore(max(1, SPEC_CONCURRENCY))
+        done = 0
+
+        async def _bounded(i: int, sp: QuerySpec) -> str:
+            nonlocal done
+            async with sem:
+                if export_fmt:
+                    section, exports[i] = await asyncio.gather(render_spec_section(sp, s_norm),
+                                                               timed("export", export_spec(sp, export_fmt)))
+                    section += _export_line(exports[i])
                 else:
-                    qrows: List[Dict] = []
-                    for s1, s2 in _hour_blocks_to_slot_ranges(_compress_ranges(spec.hours)):
-                        qrows += fetch_quarter(spec.market, spec.start_date, spec.end_date, s1, s2)
-                    twap = twap_kwh(qrows, "price_rs_per_mwh", "duration_min")
-                    vwap = vwap_kwh(qrows, "price_rs_per_mwh", "scheduled_mw", "duration_min")
-                    primary_label = _primary_metric_label(spec.stat) + "*"
-                    primary_value = vwap if spec.stat == "vwap" else twap
-                    kpi  = f"**{primary_label}: {money(primary_value)} /kWh**  \n_Fallback via 15-min slots_\n\n"
-                    body = rows_to_md_quarter(qrows) if spec.stat == "list" else ""
-            else:
-                qrows: List[Dict] = []
-                for s1, s2 in _compress_ranges(spec.slots):
-                    qrows += fetch_quarter(spec.market, spec.start_date, spec.end_date, s1, s2)
-                twap = twap_kwh(qrows, "price_rs_per_mwh", "duration_min")
-                vwap = vwap_kwh(qrows, "price_rs_per_mwh", "scheduled_mw", "duration_min")
-                primary_label = _primary_metric_label(spec.stat)
-                primary_value = vwap if spec.stat == "vwap" else twap
-                kpi  = f"**{primary_label}: {money(primary_value)} /kWh**\n\n"
-                body = rows_to_md_quarter(qrows) if spec.stat == "list" else ""
-
-            deriv_block = ""
-
-            if spec.start_date == spec.end_date:
-                # Single day → last close as of that day (per exchange), DB handles fallback.
-                drows = fetch_deriv_daily_fallback(spec.end_date, None)
-                if drows:
-                    deriv_block = "\n" + render_deriv_companion_for_day(spec.end_date, drows)
-
-            elif _same_calendar_month(spec.start_date, spec.end_date) or is_month_intent(s_norm, spec.start_date, spec.end_date):
-                # Range fully inside one month:
-                # 1) Try daily close for the SAME contract month up to the end date.
-                drows = fetch_deriv_daily_fallback(spec.end_date, None)
-
-                filtered = []
-                seen_ex = set()
-                for r in drows:
-                    if _is_same_contract_month(spec.end_date, r['contract_month']):
-                        ex = r['exchange']
-                        if ex not in seen_ex:
-                            seen_ex.add(ex)
-                            filtered.append(r)
-
-                if filtered:
-                    deriv_block = "\n" + render_deriv_daily_for_contract_month(spec.end_date, filtered)
-                else:
-                    # 2) If no daily rows for that contract month → show that month’s EXPIRY,
-                    #    but as a single date (not 01–31) via the renderer above.
-                    cm_first = date(spec.end_date.year, spec.end_date.month, 1)
-                    mrows = fetch_deriv_month_expiry(cm_first, None)
-                    deriv_block = "\n" + render_deriv_expiry(cm_first, mrows)
-
-            else:
-                # Cross-month ranges → last close as of end date (per exchange).
-                drows = fetch_deriv_daily_fallback(spec.end_date, None)
-                if drows:
-                    deriv_block = "\n" + render_deriv_companion_for_day(spec.end_date, drows)
-
-
-            sections.append(header + "\n" + kpi + body + deriv_block)
+                    section = await render_spec_section(sp, s_norm)
+            done += 1
+            if len(specs) > 1 and done < len(specs):
+                await progress_update(progress, f"🧮 Querying … {done}/{len(specs)} periods ready")
+            return section
+
+        tasks = [asyncio.create_task(_bounded(i, sp)) for i, sp in enumerate(specs)]
+        reply = cl.Message(author=ASSISTANT_AUTHOR, content="")
+        try:
+            for i, task in enumerate(tasks):
+                section = await task
+                with stage("render"):
+                    section = highlight_gdam(section)
+                with stage("send"):
+                    await reply.stream_token(section if i == 0 else "\n\n---\n\n" + section)
+        except BaseException:
+            for t in tasks:
+                t.cancel()
+            # The batch is not cancelled: other messages may share its days.
+            await asyncio.gather(*tasks, *([prefetch] if prefetch else []), return_exceptions=True)
+            for r in exports.values():
+                discard(r.path)
+            if reply.content:
+                await reply.send()     # keep the sections already shown
+            raise
 
-        await progress_hide(progress)
-        final = "\n\n---\n\n".join(sections)
-        final = highlight_gdam(final)
-        await cl.Message(author=ASSISTANT_AUTHOR, content=final).send()
+        try:
+            if exports:
+                reply.elements = [cl.File(name=r.name, path=r.path, mime=r.mime, display="inline")
+                                  for _, r in sorted(exports.items()) if r.rows]
+            with stage("send"):
+                await progress_hide(progress)
+                await reply.send()     # attachments are copied into the session here
+        finally:
+            for r in exports.values():
+                discard(r.path)
 
     except Exception:
         traceback.print_exc()
+        annotate(error=True)
         try: await progress_hide(progress)
         except Exception: pass
         await cl.Message(author=ASSISTANT_AUTHOR, content="⚠️ Temporary data connection issue. Please try again.").send()
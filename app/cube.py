@@ -0,0 +1,198 @@
+"""
+Optional in-memory price cube for DAM/GDAM.
+
+The whole history (Aug 2022 onward) is small enough to hold as dense
+``[day × block]`` arrays per market and granularity: price, scheduled MW,
+duration and a presence mask. Once loaded, a QuerySpec is answered by array
+slicing and weighted sums instead of an RPC round-trip.
+
+The hour grid is built from the materialized hourly series (sql/008) when
+it exists. That series includes hours derived from 15-min slots, so the
+loader adds each row's VWAP price and derived flag. The cube then answers
+those days like the other hourly paths: same VWAP, and ``n_derived`` for the
+fallback note.
+
+The cube's arrays are only allocated with ``QUERY_ENGINE=cube``.
+"""
+import asyncio, time
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple
+
+from kernels import weighted_sums
+
+WIDTH = {"hour": 24, "quarter": 96}
+# Row shape returned by the RPCs, so cube rows render exactly like DB rows.
+ROW_KEYS = {
+    "hour":    ("block_index", "price_avg_rs_per_mwh", "scheduled_mw_sum"),
+    "quarter": ("slot_index", "price_rs_per_mwh", "scheduled_mw"),
+}
+
+# loader(market, gran, ds, de) -> async iterator of row chunks
+#   [(delivery_date, index, price, sched_mw, duration_min[, vwap_price, derived]), ...]
+Loader = Callable[[str, str, date, date], AsyncIterator[Sequence[Tuple]]]
+
+
+@dataclass
+class Grid:
+    day0: date
+    day1: date          # last day with any data
+    price: Any          # float64 [days, width]  ₹/MWh
+    mw: Any             # float64 [days, width]  scheduled MW (NULL → 0)
+    dur: Any            # float64 [days, width]  minutes
+    present: Any        # bool    [days, width]
+    vwap: Any = None    # float64 [days, width]  VWAP price (hourly series only)
+    derived: Any = None # bool    [days, width]  hour derived from 15-min slots
+
+
+class GridBuilder:
+    """
+    Fills a Grid for [day0, day_end] one chunk of rows at a time, so a load
+    holds the arrays plus one chunk instead of the whole result set.
+    ``finish`` trims it to the first/last day that had data.
+    """
+
+    def __init__(self, gran: str, day0: date, day_end: date):
+        import numpy as np
+        self.day0 = day0
+        shape = (max(0, (day_end - day0).days + 1), WIDTH[gran])
+        self.price = np.zeros(shape); self.mw = np.zeros(shape); self.dur = np.zeros(shape)
+        self.present = np.zeros(shape, dtype=bool)
+        self.vwap = self.derived = None      # allocated by the first 7-column chunk
+        self.first: Optional[int] = None
+        self.last: Optional[int] = None
+
+    def add(self, rows: Sequence[Tuple]) -> None:
+        import numpy as np
+        n = len(rows)
+        if not n:
+            return
+        di = np.fromiter(((r[0] - self.day0).days for r in rows), dtype=np.int64, count=n)
+        bi = np.fromiter((r[1] - 1 for r in rows), dtype=np.int64, count=n)
+        ok = (bi >= 0) & (bi < self.price.shape[1]) & (di >= 0) & (di < self.price.shape[0])
+        if not ok.any():
+            return
+        di, bi = di[ok], bi[ok]
+        self.price[di, bi] = np.fromiter((r[2] for r in rows), dtype=float, count=n)[ok]
+        self.mw[di, bi] = np.fromiter((0.0 if r[3] is None else r[3] for r in rows), dtype=float, count=n)[ok]
+        self.dur[di, bi] = np.fromiter((r[4] for r in rows), dtype=float, count=n)[ok]
+        self.present[di, bi] = True
+        if len(rows[0]) > 5:
+            if self.vwap is None:
+                self.vwap = np.zeros(self.price.shape)
+                self.derived = np.zeros(self.price.shape, dtype=bool)
+            self.vwap[di, bi] = np.fromiter((r[5] for r in rows), dtype=float, count=n)[ok]
+            self.derived[di, bi] = np.fromiter((bool(r[6]) for r in rows), dtype=bool, count=n)[ok]
+        lo, hi = int(di.min()), int(di.max())
+        self.first = lo if self.first is None else min(self.first, lo)
+        self.last = hi if self.last is None else max(self.last, hi)
+
+    def finish(self) -> Optional[Grid]:
+        if self.first is None:
+            return None
+        i0, i1 = self.first, self.last + 1
+        return Grid(self.day0 + timedelta(days=i0), self.day0 + timedelta(days=self.last),
+                    self.price[i0:i1], self.mw[i0:i1], self.dur[i0:i1], self.present[i0:i1],
+                    None if self.vwap is None else self.vwap[i0:i1],
+                    None if self.derived is None else self.derived[i0:i1])
+
+
+def build_grid(rows: Sequence[Tuple], gran: str) -> Optional[Grid]:
+    if not rows:
+        return None
+    b = GridBuilder(gran, min(r[0] for r in rows), max(r[0] for r in rows))
+    b.add(rows)
+    return b.finish()
+
+
+class PriceCube:
+    def __init__(self, markets: Sequence[str] = ("DAM", "GDAM"), start: date = date(2022, 8, 1)):
+        self.markets = tuple(markets)
+        self.start = start
+        self._grids: Dict[Tuple[str, str], Grid] = {}
+        self.loaded_at: Optional[float] = None
+        self.load_seconds: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.loaded_at is not None
+
+    def age(self) -> Optional[float]:
+        return None if self.loaded_at is None else time.monotonic() - self.loaded_at
+
+    async def load(self, loader: Loader, until: Optional[date] = None) -> None:
+        """(Re)build every grid from ``loader``; the old grids keep serving until the swap."""
+        async with self._lock:
+            t0 = time.monotonic()
+            end = until or (date.today() + timedelta(days=1))
+            grids: Dict[Tuple[str, str], Grid] = {}
+            for market in self.markets:
+                for gran in WIDTH:
+                    builder = GridBuilder(gran, self.start, end)
+                    async for chunk in loader(market, gran, self.start, end):
+                        await asyncio.to_thread(builder.add, chunk)
+                    grid = builder.finish()
+                    if grid is not None:
+                        grids[(market, gran)] = grid
+            self._grids = grids
+            self.loaded_at = time.monotonic()
+            self.load_seconds = self.loaded_at - t0
+
+    def covers(self, market: str, gran: str, ds: date, de: date) -> bool:
+        g = self._grids.get((market, gran))
+        return g is not None and g.day0 <= ds and de <= g.day1
+
+    def stats(self) -> Dict[str, Any]:
+        return {f"{m}/{g}": dict(days=grid.price.shape[0], first=str(grid.day0), last=str(grid.day1),
+                                 mb=round(sum(a.nbytes for a in (grid.price, grid.mw, grid.dur, grid.present,
+                                                                 grid.vwap, grid.derived) if a is not None) / 1e6, 2))
+                for (m, g), grid in self._grids.items()}
+
+    # ── queries ──────────────────────────────────────────────
+    def _window(self, market: str, gran: str, ds: date, de: date):
+        g = self._grids[(market, gran)]
+        return g, (ds - g.day0).days, (de - g.day0).days + 1
+
+    @staticmethod
+    def _cols(gran: str, ranges: List[Tuple[int, int]]):
+        import numpy as np
+        if not ranges:
+            return np.arange(WIDTH[gran])
+        return np.concatenate([np.arange(max(1, lo) - 1, min(WIDTH[gran], hi)) for lo, hi in ranges])
+
+    def sums(self, market: str, gran: str, ds: date, de: date, ranges: List[Tuple[int, int]]) -> Dict[str, float]:
+        """The PriceAgg fields for the selection (masked column kernels)."""
+        g, i0, i1 = self._window(market, gran, ds, de)
+        cols = self._cols(gran, ranges)
+        mask = g.present[i0:i1][:, cols]
+        vwap = None if g.vwap is None else g.vwap[i0:i1][:, cols][mask]
+        sums = weighted_sums(g.price[i0:i1][:, cols][mask], g.mw[i0:i1][:, cols][mask], g.dur[i0:i1][:, cols][mask],
+                             vwap_price=vwap)
+        sums["n_days"] = int(mask.any(axis=1).sum())
+        if g.derived is not None:
+            sums["n_derived"] = int(g.derived[i0:i1][:, cols][mask].sum())
+        return sums
+
+    def rows(self, market: str, gran: str, ds: date, de: date, ranges: List[Tuple[int, int]]) -> List[Dict]:
+        """Rows shaped like the RPC (or hourly series) output, ordered by range, then date, then index."""
+        import numpy as np
+        g, i0, i1 = self._window(market, gran, ds, de)
+        idx_key, price_key, mw_key = ROW_KEYS[gran]
+        out: List[Dict] = []
+        for lo, hi in (ranges or [(1, WIDTH[gran])]):
+            c0, c1 = max(1, lo) - 1, min(WIDTH[gran], hi)
+            for di, bi in np.argwhere(g.present[i0:i1, c0:c1]).tolist():
+                day, col = i0 + di, c0 + bi
+                row = {
+                    "delivery_date": g.day0 + timedelta(days=day),
+                    idx_key: col + 1,
+                    price_key: float(g.price[day, col]),
+                    mw_key: float(g.mw[day, col]),
+                    "duration_min": int(g.dur[day, col]),
+                }
+                if g.vwap is not None:
+                    row["price_vwap_rs_per_mwh"] = float(g.vwap[day, col])
+                    row["derived"] = bool(g.derived[day, col])
+                out.append(row)
+        return out
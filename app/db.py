@@ -0,0 +1,333 @@
+"""
+Shared, non-blocking Postgres access for the Chainlit handlers.
+
+psycopg2 is a blocking driver, so the pool hands out long-lived connections
+to worker threads and the coroutines only await the result. Connections are
+created through the app's own ``_connect`` factory (TLS, keepalives, default
+statement timeout), reused across sessions and health-checked on checkout.
+"""
+import asyncio, threading, time, uuid
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import psycopg2
+import psycopg2.extras
+
+
+# NUMERIC → float at parse time: prices/MW are NUMERIC(10,2)-ish, and every
+# consumer converts them to float anyway, so skip the Decimal round-trip.
+FLOAT_NUMERIC = psycopg2.extensions.new_type(
+    psycopg2.extensions.DECIMAL.values, "FLOAT_NUMERIC",
+    lambda value, cur: None if value is None else float(value),
+)
+
+
+def register_float_numeric(conn) -> None:
+    psycopg2.extensions.register_type(FLOAT_NUMERIC, conn)
+
+
+def iter_chunks(conn, sql: str, params: Optional[Sequence] = None, chunk_rows: int = 10_000,
+                dicts: bool = False, timeout_ms: Optional[int] = None) -> Iterator[List]:
+    """
+    Run ``sql`` through a named (server-side) cursor and yield its rows
+    ``chunk_rows`` at a time, so the client never holds more than one chunk.
+    Needs an open transaction on ``conn`` (the pool's default), blocking.
+    """
+    with conn.cursor() as cur:
+        if timeout_ms:
+            cur.execute("SET LOCAL statement_timeout = %s", (int(timeout_ms),))
+    factory = psycopg2.extras.RealDictCursor if dicts else None
+    with conn.cursor(name=f"chunks_{uuid.uuid4().hex}", cursor_factory=factory) as cur:
+        cur.itersize = chunk_rows
+        cur.execute(sql, params or ())
+        while True:
+            rows = cur.fetchmany(chunk_rows)
+            if not rows:
+                return
+            yield rows
+
+
+class PoolTimeout(Exception):
+    """No connection became available within the acquire timeout."""
+
+
+class ConnectionPool:
+    """
+    Bounded pool of psycopg2 connections.
+
+    - ``minconn`` connections are opened by ``open()`` and kept warm.
+    - At most ``maxconn`` connections exist; further callers wait up to
+      ``acquire_timeout`` seconds instead of failing immediately. Coroutines
+      (``run``/``stream``/``fetch_*``) wait on the event loop for one of
+      ``maxconn`` slots, so a burst of queries never parks worker threads.
+    - A connection idle for longer than ``check_idle_sec`` is pinged with
+      ``SELECT 1`` before being handed out; dead ones are replaced.
+    - ``statement_timeout_ms`` on a call overrides the session default for
+      that statement only (``SET LOCAL``).
+    - ``observer(seconds, result)``, if given, is called after every ``run``
+      (checkout wait included) on the calling coroutine, for tracing.
+    - ``on_statement(cur, sql, params, seconds, failed)``, if given, is called
+      on the worker thread after each ``fetch_*``/``execute`` statement with
+      its own execution time (e.g. ``SlowQueryLog.observe``); it must not raise.
+    """
+
+    def __init__(self, connect: Callable[[], Any], minconn: int = 1, maxconn: int = 10,
+                 acquire_timeout: float = 10.0, check_idle_sec: float = 30.0,
+                 observer: Optional[Callable[[float, Any], None]] = None,
+                 on_statement: Optional[Callable[..., None]] = None):
+        self._connect = connect
+        self.observer = observer
+        self.on_statement = on_statement
+        self.minconn = max(0, minconn)
+        self.maxconn = max(1, maxconn, self.minconn)
+        self.acquire_timeout = acquire_timeout
+        self.check_idle_sec = check_idle_sec
+        self._idle: List[Tuple[Any, float]] = []   # (conn, last_used monotonic)
+        self._size = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._gate_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._gate_sem: Optional[asyncio.Semaphore] = None
+        self.counters = dict(created=0, discarded=0, checkouts=0, waits=0, timeouts=0)
+
+    # ── lifecycle ────────────────────────────────────────────
+    def open(self) -> None:
+        """Fill the pool up to ``minconn`` (blocking)."""
+        with self._cond:
+            self._closed = False
+        while True:
+            with self._cond:
+                if self._size >= self.minconn:
+                    return
+                self._size += 1
+            try:
+                conn = self._new_conn()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    async def open_async(self) -> None:
+        await asyncio.to_thread(self.open)
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            try: conn.close()
+            except Exception: pass
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return dict(size=self._size, idle=len(self._idle), in_use=self._size - len(self._idle),
+                        maxconn=self.maxconn, **self.counters)
+
+    # ── checkout / checkin ───────────────────────────────────
+    def _new_conn(self):
+        conn = self._connect()
+        self.counters["created"] += 1
+        return conn
+
+    def _healthy(self, conn, last_used: float) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self.check_idle_sec:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, conn) -> None:
+        try: conn.close()
+        except Exception: pass
+        with self._cond:
+            self._size -= 1
+            self.counters["discarded"] += 1
+            self._cond.notify()
+
+    def _checkout(self):
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            with self._cond:
+                waited = False
+                while not self._idle and self._size >= self.maxconn:
+                    if self._closed:
+                        raise PoolTimeout("connection pool is closed")
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.counters["timeouts"] += 1
+                        raise PoolTimeout(f"no DB connection available within {self.acquire_timeout:.0f}s")
+                    waited = True
+                    self._cond.wait(remaining)
+                if waited:
+                    self.counters["waits"] += 1
+                self.counters["checkouts"] += 1
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                else:
+                    conn, last_used = None, 0.0
+                    self._size += 1
+            if conn is None:
+                try:
+                    return self._new_conn()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            if self._healthy(conn, last_used):
+                return conn
+            self._discard(conn)
+
+    def _checkin(self, conn, broken: bool = False) -> None:
+        if not broken and not conn.closed:
+            try:
+                if conn.status != psycopg2.extensions.STATUS_READY:
+                    conn.rollback()
+            except Exception:
+                broken = True
+        if broken or conn.closed or self._closed:
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Blocking checkout; commits on success, rolls back on error."""
+        conn = self._checkout()
+        try:
+            yield conn
+            conn.commit()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            self._checkin(conn, broken=True)
+            raise
+        except Exception:
+            self._checkin(conn)
+            raise
+        else:
+            self._checkin(conn)
+
+    # ── async query helpers ──────────────────────────────────
+    def _gate(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._gate_loop is not loop:
+            self._gate_loop, self._gate_sem = loop, asyncio.Semaphore(self.maxconn)
+        return self._gate_sem
+
+    @asynccontextmanager
+    async def _slot(self) -> AsyncIterator[None]:
+        """One of ``maxconn`` slots for a coroutine, waited for on the loop."""
+        gate = self._gate()
+        if not gate.locked():
+            await gate.acquire()        # free slot: returns without suspending
+        else:
+            self.counters["waits"] += 1
+            try:
+                await asyncio.wait_for(gate.acquire(), self.acquire_timeout)
+            except asyncio.TimeoutError:
+                self.counters["timeouts"] += 1
+                raise PoolTimeout(f"no DB connection available within {self.acquire_timeout:.0f}s") from None
+        try:
+            yield
+        finally:
+            gate.release()
+
+    async def run(self, fn: Callable[..., Any], *args) -> Any:
+        """Run ``fn(conn, *args)`` on a worker thread with a pooled connection."""
+        def _call():
+            with self.connection() as conn:
+                return fn(conn, *args)
+        t0, result = time.perf_counter(), None
+        try:
+            async with self._slot():
+                result = await asyncio.to_thread(_call)
+            return result
+        finally:
+            if self.observer is not None:
+                self.observer(time.perf_counter() - t0, result)
+
+    async def stream(self, sql: str, params: Optional[Sequence] = None, chunk_rows: int = 10_000,
+                     dicts: bool = False, timeout_ms: Optional[int] = None) -> AsyncIterator[List]:
+        """
+        ``iter_chunks`` for coroutines: each chunk is fetched on a worker thread
+        and the connection stays checked out until the iteration ends (close
+        the generator, e.g. with ``contextlib.aclosing``, when breaking early).
+        """
+        async with self._slot():
+            conn = await asyncio.to_thread(self._checkout)
+            broken = False
+            it = iter_chunks(conn, sql, params, chunk_rows, dicts, timeout_ms)
+            try:
+                while True:
+                    chunk = await asyncio.to_thread(next, it, None)
+                    if chunk is None:
+                        break
+                    yield chunk
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                broken = True
+                raise
+            finally:
+                try:
+                    it.close()
+                    if not broken:
+                        conn.rollback()     # read-only; ends the transaction holding the cursor
+                except Exception:
+                    broken = True
+                self._checkin(conn, broken=broken)
+
+    def _execute(self, cur, sql: str, params: Optional[Sequence], timeout_ms: Optional[int]) -> None:
+        if timeout_ms:
+            cur.execute("SET LOCAL statement_timeout = %s", (int(timeout_ms),))
+        if self.on_statement is None:
+            cur.execute(sql, params or ())
+            return
+        t0, failed = time.perf_counter(), True
+        try:
+            cur.execute(sql, params or ())
+            failed = False
+        finally:
+            self.on_statement(cur, sql, params, time.perf_counter() - t0, failed)
+
+    async def fetch_dicts(self, sql: str, params: Optional[Sequence] = None,
+                          timeout_ms: Optional[int] = None) -> List[Dict]:
+        def _q(conn):
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                self._execute(cur, sql, params, timeout_ms)
+                return cur.fetchall()
+        return await self.run(_q)
+
+    async def fetch_all(self, sql: str, params: Optional[Sequence] = None,
+                        timeout_ms: Optional[int] = None) -> List[Tuple]:
+        def _q(conn):
+            with conn.cursor() as cur:
+                self._execute(cur, sql, params, timeout_ms)
+                return cur.fetchall()
+        return await self.run(_q)
+
+    async def fetch_one(self, sql: str, params: Optional[Sequence] = None,
+                        timeout_ms: Optional[int] = None) -> Optional[Tuple]:
+        def _q(conn):
+            with conn.cursor() as cur:
+                self._execute(cur, sql, params, timeout_ms)
+                return cur.fetchone()
+        return await self.run(_q)
+
+    async def execute(self, sql: str, params: Optional[Sequence] = None,
+                      timeout_ms: Optional[int] = None) -> None:
+        def _q(conn):
+            with conn.cursor() as cur:
+                self._execute(cur, sql, params, timeout_ms)
+        await self.run(_q)
@@ -0,0 +1,168 @@
+"""
+Derivatives (MCX/NSE) lookups with memoization and batching.
+
+- ``daily_close(day)`` / ``month_expiry(cm_first)`` wrap
+  ``rpc_deriv_daily_with_fallback`` / ``rpc_deriv_expiry_for_month``.
+- Concurrent callers asking for the same key share one in-flight query, so
+  the specs of one message never repeat an RPC.
+- Results are cached across requests per (exchange, trading day) and
+  (exchange, contract month). Past days keep ``ttl_hist_sec``; today, future
+  days and empty answers (data not ingested yet) keep ``ttl_recent_sec``.
+- ``prefetch_daily(days)`` fetches the last close for many target days in a
+  single statement and feeds the same cache / in-flight table.
+- ``invalidate(exchange, since)`` drops what a load of new trading days may
+  have changed (the app calls it from app/ingest_log.py).
+"""
+import asyncio, time
+from collections import OrderedDict
+from datetime import date
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+_DAILY_SQL = "SELECT * FROM public.rpc_deriv_daily_with_fallback(%s,%s);"
+_EXPIRY_SQL = "SELECT * FROM public.rpc_deriv_expiry_for_month(%s,%s);"
+_DAILY_MANY_SQL = """
+SELECT t.target_day, r.*
+FROM unnest(%s::date[]) AS t(target_day)
+CROSS JOIN LATERAL public.rpc_deriv_daily_with_fallback(%s, t.target_day) WITH ORDINALITY AS r
+ORDER BY t.target_day, r.ordinality;
+"""
+
+Key = Tuple[str, Optional[str], date]      # (kind, exchange, day)
+
+
+class DerivativesService:
+    def __init__(self, pool, ttl_hist_sec: float = 6 * 3600, ttl_recent_sec: float = 300,
+                 max_entries: int = 2048, today: Callable[[], date] = date.today):
+        self.pool = pool
+        self.ttl_hist_sec = ttl_hist_sec
+        self.ttl_recent_sec = ttl_recent_sec
+        self.max_entries = max_entries
+        self._today = today
+        self._cache: "OrderedDict[Key, Tuple[float, List[Dict]]]" = OrderedDict()
+        self._inflight: Dict[Key, asyncio.Future] = {}
+        self._batches: Set[asyncio.Task] = set()   # the loop only holds weak refs to tasks
+        self.counters = dict(hits=0, misses=0, shared=0, batches=0, batched_days=0)
+
+    # ── cache ────────────────────────────────────────────────
+    def _lookup(self, key: Key) -> Optional[List[Dict]]:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return entry[1]
+
+    def _store(self, key: Key, rows: List[Dict]) -> None:
+        ttl = self.ttl_hist_sec if rows and key[2] < self._today() else self.ttl_recent_sec
+        if ttl <= 0:
+            return
+        self._cache[key] = (time.monotonic() + ttl, rows)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    def invalidate(self, exchange: Optional[str] = None, since: Optional[date] = None) -> int:
+        """
+        Drop answers that new trading days from ``since`` on may change (e.g.
+        after a load): closes for target days >= since (they fall back to the
+        nearest earlier day) and contract months from since's month. Entries
+        for all exchanges (None) go too. Returns the count dropped.
+        """
+        month = since.replace(day=1) if since is not None else None
+        victims = [k for k in self._cache
+                   if (exchange is None or k[1] in (exchange, None))
+                   and (since is None or k[2] >= (since if k[0] == "daily" else month))]
+        for k in victims:
+            del self._cache[k]
+        return len(victims)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return dict(entries=len(self._cache), inflight=len(self._inflight), **self.counters)
+
+    @staticmethod
+    def _settle(fut: asyncio.Future, rows: Optional[List[Dict]] = None, exc: Optional[BaseException] = None) -> None:
+        if fut.done():
+            return
+        if exc is None:
+            fut.set_result(rows)
+        else:
+            fut.set_exception(exc)
+            fut.exception()     # mark retrieved: nobody may be waiting on it
+
+    async def _get(self, key: Key, load: Callable[[], Awaitable[List[Dict]]]) -> List[Dict]:
+        rows = self._lookup(key)
+        if rows is not None:
+            self.counters["hits"] += 1
+            return rows
+        fut = self._inflight.get(key)
+        if fut is not None:
+            self.counters["shared"] += 1
+            return await asyncio.shield(fut)
+        self.counters["misses"] += 1
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        try:
+            rows = await load()
+        except BaseException as e:
+            self._settle(fut, exc=e)
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        self._store(key, rows)
+        self._settle(fut, rows)
+        return rows
+
+    # ── lookups ──────────────────────────────────────────────
+    async def daily_close(self, target_day: date, exchange: Optional[str] = None) -> List[Dict]:
+        """Close for the nearest trading day <= target_day, per exchange (empty before Jul 2025)."""
+        return await self._get(("daily", exchange, target_day),
+                               lambda: self.pool.fetch_dicts(_DAILY_SQL, (exchange, target_day)))
+
+    async def month_expiry(self, cm_first: date, exchange: Optional[str] = None) -> List[Dict]:
+        return await self._get(("expiry", exchange, cm_first),
+                               lambda: self.pool.fetch_dicts(_EXPIRY_SQL, (exchange, cm_first)))
+
+    def prefetch_daily(self, days: Iterable[date], exchange: Optional[str] = None) -> Optional[asyncio.Task]:
+        """
+        Start one batched query for every day not cached or already in flight.
+        Later ``daily_close`` calls for those days await the batch instead of
+        issuing their own RPC. Returns the task (None when nothing to batch).
+        """
+        missing = sorted({d for d in days
+                          if ("daily", exchange, d) not in self._inflight
+                          and self._lookup(("daily", exchange, d)) is None})
+        if len(missing) < 2:
+            return None
+        loop = asyncio.get_running_loop()
+        futs = {d: loop.create_future() for d in missing}
+        for d, fut in futs.items():
+            self._inflight[("daily", exchange, d)] = fut
+        self.counters["batches"] += 1
+        self.counters["batched_days"] += len(missing)
+        task = loop.create_task(self._load_daily_batch(futs, exchange))
+        self._batches.add(task)
+        task.add_done_callback(self._batches.discard)
+        return task
+
+    async def _load_daily_batch(self, futs: Dict[date, asyncio.Future], exchange: Optional[str]) -> None:
+        try:
+            rows = await self.pool.fetch_dicts(_DAILY_MANY_SQL, (list(futs), exchange))
+        except BaseException as e:
+            for d, fut in futs.items():
+                self._inflight.pop(("daily", exchange, d), None)
+                self._settle(fut, exc=e)
+            return
+        by_day: Dict[date, List[Dict]] = {d: [] for d in futs}
+        for r in rows:
+            day = r.pop("target_day")
+            r.pop("ordinality", None)
+            by_day[day].append(r)
+        for d, fut in futs.items():
+            self._inflight.pop(("daily", exchange, d), None)
+            self._store(("daily", exchange, d), by_day[d])
+            self._settle(fut, by_day[d])
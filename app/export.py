@@ -0,0 +1,174 @@
+"""
+Full-series export of a spec's rows as gzip CSV or Parquet.
+
+Rows stream from Postgres through a server-side (named) cursor, ``chunk_rows``
+at a time, straight into the file on a pool worker thread. Memory stays at
+one chunk whatever the range length, and the rows never reach the event
+loop. The file is attached to the reply and deleted once sent.
+
+pyarrow is imported lazily and is optional: without it ``export parquet``
+falls back to CSV (``ExportResult.note`` says so).
+"""
+import csv, gzip, os, tempfile, uuid
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, List, Optional, Sequence, Tuple
+
+import db
+
+# Columns are the same for every source of a granularity, so files from the
+# RPC path and from price_hourly line up. time_start is the block/slot start.
+COLUMNS = {
+    "hour":    ("market", "delivery_date", "block_index", "time_start", "price_rs_per_mwh", "scheduled_mw",
+                "duration_min", "derived"),
+    "quarter": ("market", "delivery_date", "slot_index", "time_start", "price_rs_per_mwh", "scheduled_mw",
+                "duration_min"),
+}
+
+MIME = {"csv": "application/gzip", "parquet": "application/vnd.apache.parquet"}
+
+# Chronological, not grouped per block range like the list tables.
+_RPC_EXPORT_SQL = """
+SELECT %s AS market, r.delivery_date, r.{idx},
+       to_char(TIME '00:00' + (r.{idx} - 1) * INTERVAL '{step} minutes', 'HH24:MI') AS time_start,
+       r.{price}::float8 AS price_rs_per_mwh, r.{mw}::float8 AS scheduled_mw, r.duration_min{derived}
+FROM unnest(%s::int[], %s::int[]) AS g(lo, hi)
+CROSS JOIN LATERAL public.{rpc}(%s, %s, %s, g.lo, g.hi) AS r
+ORDER BY r.delivery_date, r.{idx};
+"""
+HOURLY_RPC_SQL = _RPC_EXPORT_SQL.format(rpc="rpc_get_hourly_prices_range", idx="block_index", step=60,
+                                        price="price_avg_rs_per_mwh", mw="scheduled_mw_sum", derived=", false AS derived")
+QUARTER_RPC_SQL = _RPC_EXPORT_SQL.format(rpc="rpc_get_quarter_prices_range", idx="slot_index", step=15,
+                                         price="price_rs_per_mwh", mw="scheduled_mw", derived="")
+HOURLY_SERIES_SQL = """
+SELECT %s AS market, h.delivery_date, h.block_index,
+       to_char(TIME '00:00' + (h.block_index - 1) * INTERVAL '60 minutes', 'HH24:MI') AS time_start,
+       h.price_avg_rs_per_mwh AS price_rs_per_mwh, h.scheduled_mw_sum AS scheduled_mw, h.duration_min, h.derived
+FROM unnest(%s::int[], %s::int[]) AS g(lo, hi)
+JOIN price_hourly h ON g.lo IS NULL OR h.block_index BETWEEN g.lo AND g.hi
+WHERE h.market = %s AND h.delivery_date BETWEEN %s AND %s
+ORDER BY h.delivery_date, h.block_index;
+"""
+
+
+def statement_args(market: str, ds: date, de: date, ranges: List[Tuple[int, int]]) -> Tuple:
+    """Parameters for any of the export statements; no ranges = whole day."""
+    los = [a for a, _ in ranges] or [None]
+    his = [b for _, b in ranges] or [None]
+    return (market, los, his, market, ds, de)
+
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow, pyarrow.parquet  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+@dataclass
+class ExportResult:
+    path: str
+    name: str
+    fmt: str
+    rows: int
+    note: str = ""
+
+    @property
+    def mime(self) -> str:
+        return MIME[self.fmt]
+
+
+def _pa_schema(columns: Sequence[str]):
+    import pyarrow as pa
+    types = dict(market=pa.string(), delivery_date=pa.date32(), block_index=pa.int16(), slot_index=pa.int16(),
+                 time_start=pa.string(), price_rs_per_mwh=pa.float64(), scheduled_mw=pa.float64(),
+                 duration_min=pa.int16(), derived=pa.bool_())
+    return pa.schema([(c, types[c]) for c in columns])
+
+
+class _CsvSink:
+    def __init__(self, path: str, columns: Sequence[str]):
+        self._f = gzip.open(path, "wt", encoding="utf-8", newline="", compresslevel=6)
+        self._w = csv.writer(self._f)
+        self._w.writerow(columns)
+
+    def write(self, rows: List[Tuple]) -> None:
+        self._w.writerows(rows)
+
+    def close(self) -> None:
+        self._f.close()
+
+
+class _ParquetSink:
+    def __init__(self, path: str, columns: Sequence[str]):
+        import pyarrow.parquet as pq
+        self._schema = _pa_schema(columns)
+        self._w = pq.ParquetWriter(path, self._schema, compression="zstd")
+
+    def write(self, rows: List[Tuple]) -> None:
+        import pyarrow as pa
+        cols = list(zip(*rows))
+        self._w.write_table(pa.Table.from_arrays(
+            [pa.array(c, type=f.type) for c, f in zip(cols, self._schema)], schema=self._schema))
+
+    def close(self) -> None:
+        self._w.close()
+
+
+def write_rows(conn, sql: str, args: Sequence[Any], columns: Sequence[str], fmt: str, path: str,
+               chunk_rows: int = 20_000, timeout_ms: Optional[int] = None) -> int:
+    """Stream ``sql`` through a server-side cursor into ``path``; returns the row count (blocking)."""
+    sink = _ParquetSink(path, columns) if fmt == "parquet" else _CsvSink(path, columns)
+    n = 0
+    try:
+        for rows in db.iter_chunks(conn, sql, args, chunk_rows, timeout_ms=timeout_ms):
+            sink.write(rows)
+            n += len(rows)
+    finally:
+        sink.close()
+    return n
+
+
+class Exporter:
+    """Writes exports into ``directory`` (a fresh temp dir by default)."""
+
+    def __init__(self, pool, directory: str = "", chunk_rows: int = 20_000, timeout_ms: Optional[int] = None):
+        self.pool = pool
+        self.directory = directory
+        self.chunk_rows = chunk_rows
+        self.timeout_ms = timeout_ms
+        self.counters = dict(exports=0, rows=0, failures=0)
+
+    def _dir(self) -> str:
+        if not self.directory:
+            self.directory = tempfile.mkdtemp(prefix="emps_export_")
+        os.makedirs(self.directory, exist_ok=True)
+        return self.directory
+
+    async def export(self, sql: str, args: Sequence[Any], gran: str, fmt: str, name: str) -> ExportResult:
+        """``name`` without extension; a parquet request without pyarrow is written as CSV."""
+        note = ""
+        if fmt == "parquet" and not parquet_available():
+            fmt, note = "csv", "Parquet needs pyarrow on the server; sent CSV instead."
+        name = f"{name}.parquet" if fmt == "parquet" else f"{name}.csv.gz"
+        path = os.path.join(self._dir(), f"{uuid.uuid4().hex[:8]}_{name}")
+        try:
+            n = await self.pool.run(write_rows, sql, args, COLUMNS[gran], fmt, path, self.chunk_rows, self.timeout_ms)
+        except BaseException:          # incl. cancellation: the worker thread may still finish the file
+            self.counters["failures"] += 1
+            discard(path)
+            raise
+        self.counters["exports"] += 1
+        self.counters["rows"] += n
+        return ExportResult(path=path, name=name, fmt=fmt, rows=n, note=note)
+
+    def stats(self):
+        return dict(self.counters)
+
+
+def discard(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,66 @@
+"""
+Cache invalidation from the ingest change marker (sql/009_price_ingest_log.sql).
+
+Ingest appends (market, first_changed, last_changed) to ``price_ingest_log``
+once its refreshes are done. ``poll()`` reads the entries added since the
+previous poll, at most every ``poll_sec``, and hands each to ``on_change`` so
+the app can drop the cached days it covers. The first poll only records
+where the log ends: nothing cached before it can predate those entries.
+Until the migration is applied every poll is a single ``to_regclass`` probe.
+"""
+import asyncio, time, traceback
+from datetime import date
+from typing import Callable, Dict, Optional
+
+_LOG_EXISTS_SQL = "SELECT to_regclass('public.price_ingest_log') IS NOT NULL;"
+_LOG_END_SQL = "SELECT coalesce(max(id), 0) FROM price_ingest_log;"
+_LOG_SINCE_SQL = """
+SELECT id, market, first_changed, last_changed
+FROM price_ingest_log
+WHERE id > %s
+ORDER BY id;
+"""
+
+
+class IngestLog:
+    def __init__(self, pool, on_change: Callable[[str, date, date], None], poll_sec: float = 60.0):
+        self.pool = pool
+        self.on_change = on_change
+        self.poll_sec = poll_sec
+        self.available: Optional[bool] = None
+        self._last_id: Optional[int] = None
+        self._polled_at: Optional[float] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self.counters = dict(polls=0, changes=0)
+
+    def _due(self) -> bool:
+        return self._polled_at is None or time.monotonic() - self._polled_at >= self.poll_sec
+
+    async def poll(self) -> None:
+        """Apply the entries logged since the last poll; cheap when not due, never raises."""
+        if not self._due():
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not self._due():
+                return
+            self.counters["polls"] += 1
+            try:
+                if not self.available:
+                    row = await self.pool.fetch_one(_LOG_EXISTS_SQL)
+                    self.available = bool(row and row[0])
+                if self.available and self._last_id is None:
+                    self._last_id = (await self.pool.fetch_one(_LOG_END_SQL))[0]
+                elif self.available:
+                    for log_id, market, d0, d1 in await self.pool.fetch_all(_LOG_SINCE_SQL, (self._last_id,)):
+                        self.on_change(market, d0, d1)
+                        self._last_id = log_id
+                        self.counters["changes"] += 1
+            except Exception:
+                traceback.print_exc()
+                self.available = None       # probe again next time
+            self._polled_at = time.monotonic()
+
+    def stats(self) -> Dict:
+        return dict(available=self.available, last_id=self._last_id, **self.counters)
@@ -0,0 +1,87 @@
+"""
+Price math (₹/MWh in, ₹/kWh out).
+
+``twap_kwh`` / ``vwap_kwh`` are the original row-dict reductions and remain
+the reference definitions. The column kernels below compute the same numbers
+from float64 buffers (price, scheduled MW, minutes) in a single vectorized
+pass: count, TWAP, VWAP (TWAP fallback when there is no scheduled volume),
+min and max. ``scripts/bench_kernels.py`` compares both.
+
+NumPy is a required dependency: ``PriceAgg.from_rows`` runs these kernels on
+every cached or short-range aggregate and list. It is imported on first use
+so startup does not pay for it (the warm-up imports it in the background).
+"""
+from typing import Dict, List, Optional, Tuple
+
+
+# ── reference row-based reductions ───────────────────────────
+def twap_kwh(rows: List[Dict], price_key: str, minute_key: str) -> Optional[float]:
+    if not rows: return None
+    num = sum(float(r[price_key]) * float(r[minute_key]) for r in rows)
+    den = sum(float(r[minute_key]) for r in rows)
+    return None if den==0 else (num/den)/1000.0
+
+
+def vwap_kwh(rows: List[Dict], price_key: str, sched_key: str, minute_key: str) -> Optional[float]:
+    if not rows: return None
+    weights = [float(r.get(sched_key) or 0) * float(r[minute_key]) for r in rows]
+    num = sum(float(r[price_key]) * w for r, w in zip(rows, weights))
+    den = sum(weights)
+    if den>0: return (num/den)/1000.0
+    return twap_kwh(rows, price_key, minute_key)
+
+
+# ── column kernels ───────────────────────────────────────────
+def columns(rows: List[Dict], price_key: str, sched_key: str, minute_key: str = "duration_min") -> Tuple:
+    """Row dicts → (price, mw, minutes) float64 arrays; NULL scheduled MW becomes 0."""
+    import numpy as np
+    n = len(rows)
+    price = np.fromiter((r[price_key] for r in rows), dtype=np.float64, count=n)
+    mw = np.fromiter((r.get(sched_key) or 0.0 for r in rows), dtype=np.float64, count=n)
+    minutes = np.fromiter((r[minute_key] for r in rows), dtype=np.float64, count=n)
+    return price, mw, minutes
+
+
+def vwap_prices(rows: List[Dict], vwap_key: str, price_key: str):
+    """
+    Per-row VWAP price for rows that carry one (hours derived from 15-min
+    slots, sql/008), else the row's price; None when no row has the key.
+    """
+    import numpy as np
+    if not any(vwap_key in r for r in rows):
+        return None
+    return np.fromiter((r.get(vwap_key, r[price_key]) for r in rows), dtype=np.float64, count=len(rows))
+
+
+def weighted_sums(price, mw, minutes, vwap_price=None) -> Dict[str, float]:
+    """
+    Additive sums over column buffers (the PriceAgg fields plus min/max price).
+    ``vwap_price`` replaces ``price`` in Σ price × MW × minutes when given.
+    """
+    import numpy as np
+    n = int(price.shape[0])
+    if n == 0:
+        return dict(n_rows=0, minutes=0.0, price_min=0.0, mw_min=0.0, price_mw_min=0.0,
+                    min_price=None, max_price=None)
+    w = mw * minutes
+    return dict(
+        n_rows=n,
+        minutes=float(minutes.sum()),
+        price_min=float(np.dot(price, minutes)),
+        mw_min=float(w.sum()),
+        price_mw_min=float(np.dot(price if vwap_price is None else vwap_price, w)),
+        min_price=float(price.min()),
+        max_price=float(price.max()),
+    )
+
+
+def price_stats(price, mw, minutes) -> Dict[str, Optional[float]]:
+    """count, twap, vwap, min, max in ₹/kWh from column buffers."""
+    s = weighted_sums(price, mw, minutes)
+    twap = None if not s["n_rows"] or s["minutes"] == 0 else (s["price_min"] / s["minutes"]) / 1000.0
+    vwap = (s["price_mw_min"] / s["mw_min"]) / 1000.0 if s["mw_min"] > 0 else twap
+    return dict(
+        count=s["n_rows"], twap=twap, vwap=vwap,
+        min=None if s["min_price"] is None else s["min_price"] / 1000.0,
+        max=None if s["max_price"] is None else s["max_price"] / 1000.0,
+    )
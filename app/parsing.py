@@ -0,0 +1,471 @@
+"""
+Deterministic natural-language query parser: text → market, stat, periods
+and hour/slot groups (the inputs of ``QuerySpec``).
+
+Every pattern is compiled once at import. A message is normalized once,
+clock ranges ("10:00 to 14:30", "6pm-9pm") are scanned once and shared by
+the explicit-group and fallback range readers, and the date cascade runs
+each pattern at most once.
+
+``QueryParser.parse`` memoizes the whole result in an LRU keyed on the
+normalized text. Results that depended on the current date ("yesterday",
+"this month", a day without a year) are keyed by that date too, so they
+roll over at midnight while absolute queries stay cached.
+"""
+import calendar, functools, re
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+DATE_MIN_GUARD = date(2010, 1, 1)
+
+MONTHS = {
+    "jan":1,"january":1,"feb":2,"february":2,"mar":3,"march":3,"apr":4,"april":4,
+    "may":5,"jun":6,"june":6,"jul":7,"july":7,"aug":8,"august":8,"sep":9,"sept":9,"september":9,
+    "oct":10,"october":10,"nov":11,"november":11,"dec":12,"december":12
+}
+# Prefix-factored so a failed match backtracks less; matches the same words as the plain list.
+MONTH_WORDS = r"(jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)"
+
+# normalize
+_WS_RE      = re.compile(r"\s+")
+_BETWEEN_RE = re.compile(r"\bbetween\s+(\S.*?)\s+and\s+(\S.*?)\b", re.I)
+_UPTO_RE    = re.compile(r"\b(upto|through|till|until)\b", re.I)
+_MON_YY_RE  = re.compile(rf"\b({MONTH_WORDS})\s*[-']\s*(\d{{2}})\b", re.I)
+
+# market / stat
+_GDAM_RE      = re.compile(r"\b(gdam|green day\.?\s*ahead)\b", re.I)
+_DAM_RE       = re.compile(r"\b(dam)\b", re.I)
+_VWAP_RE      = re.compile(r"\b(vwap|weighted)\b")
+_DAILY_AVG_RE = re.compile(r"\bdaily\s+(avg|average)\b")
+_LIST_RE      = re.compile(r"\b(list|table|rows|detailed)\b")
+_TWAP_RE      = re.compile(r"\b(avg|average|mean|twap)\b")
+_EXPORT_RE    = re.compile(r"\bexport\b(?:\s+(?:as|to|in))?(?:\s+(csv|parquet))?")
+
+# periods
+_MULTI_YEAR_RE = re.compile(rf"\b({MONTH_WORDS})\s+(\d{{4}})\b(?:\s*,\s*(?:and\s+)?(\d{{4}}))+", re.I)
+_YEAR4_RE       = re.compile(r"\b\d{4}\b")
+# "24 September to 24 October 2025" (one year for both ends)
+_DM_DM_Y_RE  = re.compile(
+    rf"(?:from\s+)?(\d{{1,2}})\s+{MONTH_WORDS}\s+(?:to|until|till|-)\s+(\d{{1,2}})\s+{MONTH_WORDS}\s+(\d{{2,4}})", re.I)
+# "1 Aug 2024 to 5 Sep 2025"
+_DMY_DMY_RE  = re.compile(
+    rf"\b(?:from\s*)?(\d{{1,2}})\s+{MONTH_WORDS}\s+(\d{{2,4}})\s*(?:to|-)\s*(\d{{1,2}})\s+{MONTH_WORDS}\s+(\d{{2,4}})\b", re.I)
+# "10-15 Aug 2025"
+_DD_MON_RE   = re.compile(rf"\b(\d{{1,2}})\s*(?:to|-)\s*(\d{{1,2}})\s+{MONTH_WORDS}(?:\s+(\d{{2,4}}))?\b", re.I)
+_NUM_RANGE_RE = re.compile(r"\b(\d{1,2})[/-](\d{1,2})[/-](\d{2,4})\s*(?:to|-)\s*(\d{1,2})[/-](\d{1,2})[/-](\d{2,4})\b", re.I)
+_NUM_DATE_RE = re.compile(r"\b(\d{1,2})[/-](\d{1,2})[/-](\d{2,4})\b")
+_D_MON_RE    = re.compile(rf"\b(\d{{1,2}})\s+{MONTH_WORDS}(?:\s+(\d{{2,4}}))?\b", re.I)
+_MON_Y_RE    = re.compile(rf"\b{MONTH_WORDS}\s+(\d{{2,4}})\b", re.I)
+_YEAR_RE     = re.compile(r"\b(20\d{2})\b")
+_YEAR_CUE_RE = re.compile(r"\b(in|for|year|full\s+year)\b")
+_YYYYMM_RE   = re.compile(r"\b20\d{2}-(0[1-9]|1[0-2])\b")
+_MONTH_WORD_RE = re.compile(MONTH_WORDS, re.I)
+
+# hours / slots
+_CLOCK_RE     = re.compile(r"\b(\d{1,2})(?::(\d{2}))?\s*(am|pm)?\s*(?:to|-)\s*(\d{1,2})(?::(\d{2}))?\s*(am|pm)?\b", re.I)
+_HRS_RE       = re.compile(r"\b(\d{1,2})\s*(?:to|-)\s*(\d{1,2})\s*(?:hours?|hrs?)\b", re.I)
+_BLOCKS_RE    = re.compile(r"\b(\d{1,2})\s*(?:to|-)\s*(\d{1,2})\s*(?:blocks?|slots?|quarters?)\b", re.I)
+_NAKED_RE     = re.compile(r"\b(\d{1,2})\s*(?:to|-)\s*(\d{1,2})\b", re.I)
+_NUM_DATE_SCRUB_RE = re.compile(r"\b\d{1,2}[/-]\d{1,2}[/-]\d{2,4}\b")
+_QUARTER_WORD_RE = re.compile(r"\b(blocks?|slots?|quarters?)\b")
+_HOUR_WORD_RE    = re.compile(r"\b(hours?|hrs?)\b")
+_WHOLE_DAY_RE    = re.compile(r"\b(full day|all 24|entire day|whole day)\b")
+
+Period = Tuple[date, date]
+# (sb, eb) hour blocks, (ss, es) 15-min slots, any minutes given
+Clock = Tuple[Tuple[int, int], Tuple[int, int], bool]
+
+
+def normalize(text: str) -> str:
+    s = text.strip()
+    s = s.replace("–", "-").replace("—", "-")
+    s = _WS_RE.sub(" ", s)
+    s = _BETWEEN_RE.sub(r"\1 to \2", s)
+    s = _UPTO_RE.sub("to", s)
+    s = _MON_YY_RE.sub(lambda m: f"{m.group(1)} 20{m.group(2)}", s)
+    return s
+
+def parse_market(text: str) -> str:
+    if _GDAM_RE.search(text): return "GDAM"
+    if _DAM_RE.search(text): return "DAM"
+    return "DAM"
+
+def parse_stat(text: str, default: str = "twap") -> str:
+    s = text.lower()
+    if _VWAP_RE.search(s): return "vwap"
+    if _DAILY_AVG_RE.search(s): return "daily_avg"
+    if _LIST_RE.search(s): return "list"
+    if _TWAP_RE.search(s): return "twap"
+    return default
+
+
+def parse_export(text: str) -> Optional[str]:
+    """'export csv' / 'export parquet' / bare 'export' (csv) → file format, else None."""
+    m = _EXPORT_RE.search(text.lower())
+    return None if m is None else (m.group(1) or "csv")
+
+
+def _month_span(year: int, month: int) -> Period:
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+def parse_multi_year_months(text: str) -> List[Period]:
+    """
+    One month across several years, one (start, end) per year:
+    "November 2022, 2023, 2024", "Nov 2022, 2023, and 2024".
+    Returns [] unless at least two valid periods are found; anything else
+    ("Nov 2022, Dec 2023", "1 Jan 2024 to 5 Mar 2025") is left to the date parser.
+    """
+    m = _MULTI_YEAR_RE.search(text.lower().strip())
+    if not m:
+        return []
+    month_num = MONTHS[m.group(1).lower()]
+    years = [int(y) for y in _YEAR4_RE.findall(m.group(0))]
+    results = [_month_span(y, month_num) for y in years if 2000 <= y <= 2100]
+    return results if len(results) > 1 else []
+
+
+def _year(y: int) -> int:
+    return y + 2000 if y < 100 else y
+
+def _parse_dates(text: str, today: date) -> Tuple[Optional[date], Optional[date], bool]:
+    """(start, end, relative): relative is True when ``today`` decided the answer."""
+    s = " " + text.lower().strip() + " "
+
+    if " yesterday " in s:
+        d = today - timedelta(days=1); return (d, d, True)
+    if " today " in s:
+        return (today, today, True)
+    if " this month " in s:
+        return (*_month_span(today.year, today.month), True)
+    if " last month " in s:
+        y, m = today.year, today.month - 1
+        if m == 0: y, m = y - 1, 12
+        return (*_month_span(y, m), True)
+
+    # Month-day to month-day in the same year: "24 September to 24 October 2025"
+    m = _DM_DM_Y_RE.search(s)
+    if m:
+        yr = _year(int(m.group(5)))
+        start = date(yr, MONTHS[m.group(2).lower()], int(m.group(1)))
+        end   = date(yr, MONTHS[m.group(4).lower()], int(m.group(3)))
+        if start > end: start, end = end, start
+        return (start, end, False)
+
+    # word-date RANGE
+    m = _DMY_DMY_RE.search(s)
+    if m:
+        start = date(_year(int(m.group(3))), MONTHS[m.group(2).lower()], int(m.group(1)))
+        end   = date(_year(int(m.group(6))), MONTHS[m.group(5).lower()], int(m.group(4)))
+        if start > end: start, end = end, start
+        return (start, end, False)
+
+    # day range within SAME month (e.g., 10-15 Aug 2025)
+    m = _DD_MON_RE.search(s)
+    if m:
+        d1, d2 = int(m.group(1)), int(m.group(2))
+        mon = MONTHS[m.group(3).lower()]
+        yr  = _year(int(m.group(4))) if m.group(4) else today.year
+        return (date(yr, mon, min(d1, d2)), date(yr, mon, max(d1, d2)), not m.group(4))
+
+    # numeric date RANGE
+    m = _NUM_RANGE_RE.search(s)
+    if m:
+        start = date(_year(int(m.group(3))), int(m.group(2)), int(m.group(1)))
+        end   = date(_year(int(m.group(6))), int(m.group(5)), int(m.group(4)))
+        if start > end: start, end = end, start
+        return (start, end, False)
+
+    # single numeric date
+    m = _NUM_DATE_RE.search(s)
+    if m:
+        d = date(_year(int(m.group(3))), int(m.group(2)), int(m.group(1)))
+        if d >= DATE_MIN_GUARD:
+            return (d, d, False)
+
+    # single day with month word
+    m = _D_MON_RE.search(s)
+    if m:
+        y0 = _year(int(m.group(3))) if m.group(3) else today.year
+        d = date(y0, MONTHS[m.group(2).lower()], int(m.group(1)))
+        if d >= DATE_MIN_GUARD:
+            return (d, d, not m.group(3))
+
+    # month + year
+    m = _MON_Y_RE.search(s)
+    if m:
+        s1, s2 = _month_span(_year(int(m.group(2))), MONTHS[m.group(1).lower()])
+        if s1 >= DATE_MIN_GUARD:
+            return (s1, s2, False)
+
+    # year only (if phrased)
+    m = _YEAR_RE.search(s)
+    if m and _YEAR_CUE_RE.search(s):
+        y = int(m.group(1)); return (date(y, 1, 1), date(y, 12, 31), False)
+
+    return (None, None, False)
+
+def parse_date_or_range(text: str, today: Optional[date] = None) -> Tuple[Optional[date], Optional[date]]:
+    start, end, _ = _parse_dates(text, today or date.today())
+    return start, end
+
+
+def is_month_intent(text: str, start: Optional[date], end: Optional[date]) -> bool:
+    if not start or not end:
+        return False
+    whole_month = (start, end) == _month_span(start.year, start.month)
+    yyyymm = bool(_YYYYMM_RE.search(text or ""))
+    has_month_word = bool(_MONTH_WORD_RE.search(text or ""))
+    return whole_month and has_month_word or yyyymm
+
+
+def _to24(h: int, ampm: Optional[str]) -> int:
+    if ampm:
+        h = h % 12
+        if ampm.lower() == "pm":
+            h += 12
+    return max(0, min(23, h))
+
+def _scan_clock(s: str) -> List[Clock]:
+    """Every "HH[:MM][am/pm] to HH[:MM][am/pm]" as inclusive hour-block and slot spans (may be empty)."""
+    out: List[Clock] = []
+    for m in _CLOCK_RE.finditer(s):
+        h1, m1, a1 = int(m.group(1)), int(m.group(2) or 0), m.group(3)
+        h2, m2, a2 = int(m.group(4)), int(m.group(5) or 0), m.group(6)
+        H1, H2 = _to24(h1, a1), _to24(h2, a2)
+        to_24 = h2 == 24 and a2 is None and m2 == 0   # "... to 24" → include 23–24
+
+        # hour blocks 1..24
+        sb = min(24, H1 + 1 + (1 if m1 > 0 else 0))
+        eb = max(1, H2) if m2 == 0 else min(24, H2 + 1)
+        if to_24:
+            eb = 24
+
+        # 15-min slots 1..96
+        ss = max(1, min(96, (H1 * 60 + m1 + 14) // 15 + 1))
+        es = max(1, min(96, (H2 * 60 + m2) // 15))
+        if to_24:
+            es = 96
+        out.append(((sb, eb), (ss, es), m1 > 0 or m2 > 0))
+    return out
+
+def _hrs_span(m: "re.Match") -> Tuple[int, int]:
+    """"H to H hrs/hours" as hour blocks (24 allowed on the right)."""
+    h1 = max(0, min(23, int(m.group(1))))
+    h2 = max(0, min(24, int(m.group(2))))
+    return min(24, h1 + 1), 24 if h2 == 24 else max(1, min(24, h2))
+
+def _block_span(m: "re.Match") -> Tuple[int, int]:
+    lo, hi = sorted((int(m.group(1)), int(m.group(2))))
+    return max(1, lo), min(96, hi)
+
+def _dedupe(pairs: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    seen, out = set(), []
+    for a, b in pairs:
+        key = (min(a, b), max(a, b))
+        if key not in seen:
+            seen.add(key)
+            out.append(key)
+    return out
+
+def _explicit_groups(s: str, clock: List[Clock]) -> Dict[str, List[Tuple[int, int]]]:
+    hours = [h for h, _, _ in clock if h[1] >= h[0]]
+    slots = [q for _, q, _ in clock if q[1] >= q[0]]
+    hours += [sp for sp in map(_hrs_span, _HRS_RE.finditer(s)) if sp[1] >= sp[0]]
+    slots += [_block_span(m) for m in _BLOCKS_RE.finditer(s)]
+    # Explicit hour groups and no mention of slots/blocks/quarters: drop the slot view.
+    if hours and not _QUARTER_WORD_RE.search(s):
+        slots = []
+    return {"hours": _dedupe(hours), "slots": _dedupe(slots)}
+
+def _ranges(s: str, clock: List[Clock]) -> dict:
+    hours: List[int] = []
+    quarters: List[int] = []
+    prefer_quarter = bool(_QUARTER_WORD_RE.search(s))
+    prefer_hour    = bool(_HOUR_WORD_RE.search(s))
+    any_minute_nonzero = any(minutes for _, _, minutes in clock)
+
+    if _WHOLE_DAY_RE.search(s):
+        hours = list(range(1, 25))
+    for (sb, eb), (ss, es), _ in clock:
+        hours.extend(range(sb, eb + 1))
+        quarters.extend(range(ss, es + 1))
+
+    # scrub numeric dates so "10-12" inside dates don't become time ranges
+    clean = _NUM_DATE_SCRUB_RE.sub(" ", s)
+    for m in _HRS_RE.finditer(clean):
+        sb, eb = _hrs_span(m)
+        hours.extend(range(sb, eb + 1))
+    for m in _BLOCKS_RE.finditer(clean):
+        lo, hi = _block_span(m)
+        quarters.extend(range(lo, hi + 1))
+        prefer_quarter = True
+
+    # Fallback: naked "a-b" when we didn't already capture any clock-range
+    if not clock:
+        for m in _NAKED_RE.finditer(clean):
+            lo, hi = sorted((int(m.group(1)), int(m.group(2))))
+            if prefer_quarter or hi > 24:
+                quarters.extend(range(max(1, lo), min(96, hi) + 1))
+            else:
+                hours.extend(range(max(1, lo), min(24, hi) + 1))
+
+    hours    = sorted({h for h in hours    if 1 <= h <= 24})
+    quarters = sorted({q for q in quarters if 1 <= q <= 96})
+
+    if prefer_quarter or any_minute_nonzero:
+        gran = "quarter"
+    elif prefer_hour:
+        gran = "hour"
+    else:
+        gran = "hour" if hours else "quarter"
+    return {"hours": hours, "quarters": quarters, "granularity": gran}
+
+def parse_ranges(text: str) -> dict:
+    s = normalize(text).lower()
+    return _ranges(s, _scan_clock(s))
+
+def extract_explicit_time_groups(text: str) -> Dict[str, List[Tuple[int, int]]]:
+    """Explicit hour/slot groups in order of appearance (overlaps kept, duplicates dropped)."""
+    s = normalize(text).lower()
+    return _explicit_groups(s, _scan_clock(s))
+
+
+@dataclass(frozen=True)
+class ParsedQuery:
+    text: str                                   # normalized
+    market: str
+    stat: str
+    periods: Tuple[Period, ...]                 # () when no date was found
+    groups: Tuple[Tuple[str, Tuple[int, ...]], ...]   # ("hour", blocks) / ("quarter", slots)
+    relative: bool = False                      # depends on today's date
+
+
+def parse_query(text: str, today: Optional[date] = None, default_stat: str = "twap") -> ParsedQuery:
+    """The full pipeline for one message, uncached."""
+    today = today or date.today()
+    s_norm = normalize(text)
+    market = parse_market(s_norm)
+    stat = parse_stat(s_norm, default_stat)
+
+    relative = False
+    periods = parse_multi_year_months(s_norm)
+    if not periods:
+        start, end, relative = _parse_dates(s_norm, today)
+        periods = [(start, end)] if start and end else []
+
+    s = s_norm.lower()                          # normalize() is idempotent
+    clock = _scan_clock(s)
+    explicit = _explicit_groups(s, clock)
+    groups = [("hour", tuple(range(sb, eb + 1))) for sb, eb in explicit["hours"]]
+    groups += [("quarter", tuple(range(s1, s2 + 1))) for s1, s2 in explicit["slots"]]
+    if not groups:
+        parsed = _ranges(s, clock)
+        key = "hours" if parsed["granularity"] == "hour" else "quarters"
+        groups = [(parsed["granularity"], tuple(parsed[key]))]
+    return ParsedQuery(s_norm, market, stat, tuple(periods), tuple(groups), relative)
+
+
+@dataclass
+class QuerySpec:
+    market: str
+    start_date: date
+    end_date: date
+    granularity: str            # 'hour' | 'quarter'
+    hours: Optional[List[int]]
+    slots: Optional[List[int]]
+    stat: str                   # 'list' | 'twap' | 'vwap' | 'daily_avg'
+    area: str = "ALL"
+
+
+def _compress_ranges(indices: List[int]) -> List[Tuple[int, int]]:
+    if not indices:
+        return []
+    b = sorted(set(indices))
+    out = []
+    s = p = b[0]
+    for x in b[1:]:
+        if x == p + 1:
+            p = x
+        else:
+            out.append((s, p))
+            s = p = x
+    out.append((s, p))
+    return out
+
+
+def canonicalize(market: str, start: Optional[date], end: Optional[date], gran: str, hours: List[int], slots: List[int], stat: str) -> Optional[QuerySpec]:
+    if not start or not end:
+        return None
+    if start > end:
+        start, end = end, start
+    market = "GDAM" if market.upper()=="GDAM" else "DAM"
+    gran = "hour" if gran=="hour" else "quarter"
+    if gran == "hour":
+        hs = sorted(set([h for h in hours if 1<=h<=24])) or list(range(1,25))
+        return QuerySpec(market, start, end, "hour", hs, None, stat if stat in ("list","twap","vwap","daily_avg") else "list")
+    else:
+        qs = sorted(set([q for q in slots if 1<=q<=96])) or list(range(1,97))
+        return QuerySpec(market, start, end, "quarter", None, qs, stat if stat in ("list","twap","vwap","daily_avg") else "list")
+
+
+def build_specs(pq: "ParsedQuery") -> List[QuerySpec]:
+    """One QuerySpec per period × time group, in order, without duplicates or pre-2010 periods."""
+    specs: List[QuerySpec] = []
+    seen = set()
+    for ps, pe in pq.periods:
+        if ps and ps < DATE_MIN_GUARD:
+            continue
+        for gran, ix in pq.groups:
+            spec = canonicalize(pq.market, ps, pe, gran, list(ix), list(ix), pq.stat)
+            if spec is None:
+                continue
+            key = (spec.market, spec.start_date, spec.end_date, spec.granularity,
+                   tuple(_compress_ranges(spec.hours or [])), tuple(_compress_ranges(spec.slots or [])),
+                   spec.stat, spec.area)
+            if key not in seen:
+                seen.add(key)
+                specs.append(spec)
+    return specs
+
+
+class QueryParser:
+    """``parse_query`` behind an LRU keyed on normalized text (plus the date, for relative results)."""
+
+    def __init__(self, max_entries: int = 4096, default_stat: str = "twap",
+                 today: Callable[[], date] = date.today):
+        self.max_entries = max_entries
+        self.default_stat = default_stat
+        self._today = today
+        # raw text → cache key, so a hit skips normalize() as well
+        self._normalize = functools.lru_cache(maxsize=max_entries)(normalize) if max_entries > 0 else normalize
+        self._entries: "OrderedDict[Tuple[str, Optional[date]], ParsedQuery]" = OrderedDict()
+        self.counters = dict(hits=0, misses=0, evictions=0)
+
+    def parse(self, text: str) -> ParsedQuery:
+        key, today = self._normalize(text), self._today()
+        for k in ((key, None), (key, today)):
+            hit = self._entries.get(k)
+            if hit is not None:
+                self._entries.move_to_end(k)
+                self.counters["hits"] += 1
+                return hit
+        self.counters["misses"] += 1
+        pq = parse_query(key, today, self.default_stat)
+        if self.max_entries > 0:
+            self._entries[(key, today if pq.relative else None)] = pq
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.counters["evictions"] += 1
+        return pq
+
+    def warm(self, samples: Tuple[str, ...]) -> int:
+        """Run ``samples`` through the uncached pipeline once (first-call costs); the cache is untouched."""
+        today = self._today()
+        for text in samples:
+            build_specs(parse_query(normalize(text), today, self.default_stat))
+        return len(samples)
+
+    def stats(self) -> Dict:
+        return dict(entries=len(self._entries), max_entries=self.max_entries, **self.counters)
@@ -0,0 +1,165 @@
+"""
+Request-scoped latency tracing for the chat handlers.
+
+``PerfRecorder.trace()`` binds a ``Trace`` to the current message (a
+contextvar, so the spec tasks and DB calls it spawns record into it too).
+``stage(name)`` times a block into the current trace; ``db_call`` is the
+pool's per-round-trip hook. When the message ends its stage totals go into
+per-stage histograms since startup and, optionally, one JSON log line.
+
+Stage times are summed per message: concurrent specs each add their own
+time, and stages nest (``spot`` includes its ``db`` and ``aggregate`` time).
+Histograms are log-bucketed (5% wide) with fixed memory, so percentiles are
+bucket upper bounds, capped at the largest value seen.
+"""
+import contextvars, json, math, time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+
+_CURRENT: contextvars.ContextVar = contextvars.ContextVar("perf_trace", default=None)
+
+
+class Trace:
+    def __init__(self, **meta):
+        self.meta: Dict[str, Any] = meta
+        self.stages: Dict[str, List[float]] = {}     # name -> [seconds, calls]
+        self.db_calls = 0
+        self.db_rows = 0
+        self.total = 0.0
+
+    def add(self, name: str, seconds: float) -> None:
+        st = self.stages.setdefault(name, [0.0, 0])
+        st[0] += seconds
+        st[1] += 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        return dict(self.meta, total_ms=round(self.total * 1000, 2), db_calls=self.db_calls, db_rows=self.db_rows,
+                    stages={k: dict(ms=round(s * 1000, 2), n=n) for k, (s, n) in self.stages.items()})
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time the block into the current message's trace (no-op outside one)."""
+    tr = _CURRENT.get()
+    if tr is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        tr.add(name, time.perf_counter() - t0)
+
+
+async def timed(name: str, aw: Awaitable) -> Any:
+    """``await aw`` inside ``stage(name)``."""
+    with stage(name):
+        return await aw
+
+
+def annotate(**meta) -> None:
+    tr = _CURRENT.get()
+    if tr is not None:
+        tr.meta.update(meta)
+
+
+def db_call(seconds: float, result: Any) -> None:
+    """ConnectionPool observer: one round-trip of ``seconds`` returning ``result``."""
+    tr = _CURRENT.get()
+    if tr is None:
+        return
+    tr.db_calls += 1
+    tr.db_rows += len(result) if isinstance(result, list) else int(result is not None)
+    tr.add("db", seconds)
+
+
+class Histogram:
+    GROWTH = 1.05
+    FLOOR = 1e-5            # seconds; everything below lands in bucket 0
+
+    def __init__(self):
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        i = 0 if seconds <= self.FLOOR else math.ceil(math.log(seconds / self.FLOOR, self.GROWTH))
+        self.buckets[i] = self.buckets.get(i, 0) + 1
+        self.count += 1
+        self.max = max(self.max, seconds)
+
+    def percentile(self, p: float) -> float:
+        if not self.count:
+            return 0.0
+        rank, seen = max(1, math.ceil(p / 100 * self.count)), 0
+        for i in sorted(self.buckets):
+            seen += self.buckets[i]
+            if seen >= rank:
+                return min(self.max, self.FLOOR * self.GROWTH ** i)
+        return self.max
+
+
+class PerfRecorder:
+    """Per-stage histograms since startup; optional JSON line per message via ``log``."""
+
+    # /perf row order; unknown stages follow alphabetically.
+    ORDER = ("total", "progress", "progress_delay", "parse", "spot", "db", "aggregate", "deriv", "render",
+             "export", "send", "analytics", "stats")
+
+    def __init__(self, log: Optional[Callable[[str], None]] = print):
+        self.log = log
+        self.hists: Dict[str, Histogram] = {}
+        self.started_at = time.time()
+        self.messages = 0
+        self.db_calls = 0
+        self.db_rows = 0
+
+    @contextmanager
+    def trace(self, **meta) -> Iterator[Trace]:
+        tr = Trace(**meta)
+        token = _CURRENT.set(tr)
+        t0 = time.perf_counter()
+        try:
+            yield tr
+        finally:
+            tr.total = time.perf_counter() - t0
+            _CURRENT.reset(token)
+            self.record(tr)
+
+    def _hist(self, name: str) -> Histogram:
+        h = self.hists.get(name)
+        if h is None:
+            h = self.hists[name] = Histogram()
+        return h
+
+    def record(self, tr: Trace) -> None:
+        self.messages += 1
+        self.db_calls += tr.db_calls
+        self.db_rows += tr.db_rows
+        self._hist("total").add(tr.total)
+        for name, (seconds, _) in tr.stages.items():
+            self._hist(name).add(seconds)
+        if self.log:
+            try:
+                self.log("[perf] " + json.dumps(tr.as_dict(), default=str, separators=(",", ":")))
+            except Exception:
+                pass
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        names = sorted(self.hists, key=lambda n: (self.ORDER.index(n) if n in self.ORDER else len(self.ORDER), n))
+        return {n: dict(n=self.hists[n].count, p50=self.hists[n].percentile(50), p95=self.hists[n].percentile(95),
+                        p99=self.hists[n].percentile(99), max=self.hists[n].max) for n in names}
+
+    def render_md(self) -> str:
+        up = time.time() - self.started_at
+        lines = ["## Latency by stage (since startup)",
+                 f"_{self.messages} messages in {up / 3600:.1f} h; "
+                 f"{self.db_calls / max(1, self.messages):.1f} DB round-trips and "
+                 f"{self.db_rows / max(1, self.messages):,.0f} rows per message._", "",
+                 "| Stage | Messages | p50 ms | p95 ms | p99 ms | max ms |", "|---|---:|---:|---:|---:|---:|"]
+        for name, s in self.stats().items():
+            lines.append(f"| {name} | {s['n']} | {s['p50'] * 1000:.1f} | {s['p95'] * 1000:.1f} | "
+                         f"{s['p99'] * 1000:.1f} | {s['max'] * 1000:.1f} |")
+        if not self.messages:
+            lines.append("| — | 0 | — | — | — | — |")
+        return "\n".join(lines)
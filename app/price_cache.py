@@ -0,0 +1,163 @@
+"""
+In-process cache of spot price rows at day × market × granularity resolution.
+
+Each entry is one delivery day of one market at one granularity ('hour' or
+'quarter'), holding every block/slot row the RPC returned for that day.
+Requests for arbitrary date ranges and block subsets are assembled from the
+cached day-slices; only the missing days go to the database, one query per
+contiguous run of them, run concurrently (heavily fragmented gaps are merged
+down to ``MAX_LOAD_RUNS`` queries, re-reading the few cached days between).
+
+Past delivery days rarely change after ingestion and are kept for
+``ttl_hist_sec``; today, future days and days that came back empty (not yet
+ingested) use the short ``ttl_recent_sec``. Days an ingest corrects are
+dropped early through ``invalidate`` (app/ingest_log.py). The cache is
+bounded by total row count and evicts least-recently-used days first.
+"""
+import asyncio, time
+from collections import OrderedDict
+from datetime import date, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+# (market, granularity, delivery_date)
+DayKey = Tuple[str, str, date]
+
+# Rough heap cost of one row dict (5 keys, float/date values) for stats.
+APPROX_ROW_BYTES = 600
+
+INDEX_KEYS = {"hour": "block_index", "quarter": "slot_index"}
+
+MAX_LOAD_RUNS = 4
+
+
+def missing_runs(days: List[date], max_runs: int = MAX_LOAD_RUNS) -> List[Tuple[date, date]]:
+    """Sorted ``days`` as (first, last) runs of consecutive days; the smallest gaps are bridged past ``max_runs``."""
+    runs: List[List[date]] = []
+    for d in days:
+        if runs and (d - runs[-1][1]).days == 1:
+            runs[-1][1] = d
+        else:
+            runs.append([d, d])
+    while len(runs) > max(1, max_runs):
+        i = min(range(len(runs) - 1), key=lambda j: (runs[j + 1][0] - runs[j][1]).days)
+        runs[i][1] = runs.pop(i + 1)[1]
+    return [(a, b) for a, b in runs]
+
+
+class PriceDayCache:
+    def __init__(self, max_rows: int = 250_000, ttl_hist_sec: float = 24 * 3600,
+                 ttl_recent_sec: float = 300, today: Callable[[], date] = date.today):
+        self.max_rows = max_rows
+        self.ttl_hist_sec = ttl_hist_sec
+        self.ttl_recent_sec = ttl_recent_sec
+        self._today = today
+        self._days: "OrderedDict[DayKey, Tuple[float, List[Dict]]]" = OrderedDict()   # key -> (expires_at, rows)
+        self._rows = 0
+        self.counters = dict(hits=0, misses=0, evictions=0, expirations=0, loads=0)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_rows > 0
+
+    # ── bookkeeping ──────────────────────────────────────────
+    def _ttl(self, day: date, rows: List[Dict]) -> float:
+        if rows and day < self._today():
+            return self.ttl_hist_sec
+        return self.ttl_recent_sec
+
+    def _get_day(self, key: DayKey, now: float) -> Optional[List[Dict]]:
+        entry = self._days.get(key)
+        if entry is None:
+            return None
+        expires_at, rows = entry
+        if expires_at <= now:
+            self._drop(key)
+            self.counters["expirations"] += 1
+            return None
+        self._days.move_to_end(key)
+        return rows
+
+    def _drop(self, key: DayKey) -> None:
+        _, rows = self._days.pop(key)
+        self._rows -= len(rows)
+
+    def put_day(self, market: str, gran: str, day: date, rows: List[Dict]) -> None:
+        key = (market, gran, day)
+        if key in self._days:
+            self._drop(key)
+        self._days[key] = (time.monotonic() + self._ttl(day, rows), rows)
+        self._rows += len(rows)
+        while self._rows > self.max_rows and len(self._days) > 1:
+            oldest = next(iter(self._days))
+            self._drop(oldest)
+            self.counters["evictions"] += 1
+
+    def invalidate(self, market: Optional[str] = None, gran: Optional[str] = None,
+                   ds: Optional[date] = None, de: Optional[date] = None) -> int:
+        """Drop matching day-slices (e.g. after ingest touched ``ds..de``); returns count dropped."""
+        victims = [k for k in self._days
+                   if (market is None or k[0] == market) and (gran is None or k[1] == gran)
+                   and (ds is None or k[2] >= ds) and (de is None or k[2] <= de)]
+        for k in victims:
+            self._drop(k)
+        return len(victims)
+
+    def clear(self) -> None:
+        self._days.clear()
+        self._rows = 0
+
+    def stats(self) -> Dict[str, float]:
+        return dict(days=len(self._days), rows=self._rows, max_rows=self.max_rows,
+                    approx_mb=round(self._rows * APPROX_ROW_BYTES / 1e6, 1), **self.counters)
+
+    # ── lookups ──────────────────────────────────────────────
+    async def get_rows(self, market: str, gran: str, ds: date, de: date,
+                       ranges: List[Tuple[int, int]],
+                       load: Callable[[date, date], Awaitable[List[Dict]]]) -> List[Dict]:
+        """
+        Rows for ``ds..de`` restricted to the (lo, hi) index ranges, ordered by
+        range, then date, then index (same order as the range-set SQL).
+        ``load(a, b)`` must return all rows (every block/slot) for days a..b.
+        """
+        now = time.monotonic()
+        n_days = (de - ds).days + 1
+        slices: Dict[date, List[Dict]] = {}
+        missing: List[date] = []
+        for i in range(n_days):
+            d = ds + timedelta(days=i)
+            rows = self._get_day((market, gran, d), now)
+            if rows is None:
+                missing.append(d)
+            else:
+                slices[d] = rows
+        self.counters["hits"] += n_days - len(missing)
+        self.counters["misses"] += len(missing)
+
+        if missing:
+            runs = missing_runs(missing)
+            self.counters["loads"] += len(runs)
+            fetched = await asyncio.gather(*(load(a, b) for a, b in runs))
+            by_day: Dict[date, List[Dict]] = {d: [] for d in missing}
+            for r in (r for chunk in fetched for r in chunk):
+                d = r["delivery_date"]
+                if d in by_day:
+                    by_day[d].append(r)
+            idx_key = INDEX_KEYS[gran]
+            for d, rows in by_day.items():
+                rows.sort(key=lambda r: r[idx_key])
+                self.put_day(market, gran, d, rows)
+                slices[d] = rows
+
+        return assemble(slices, ds, de, ranges, INDEX_KEYS[gran])
+
+
+def assemble(slices: Dict[date, List[Dict]], ds: date, de: date,
+             ranges: List[Tuple[int, int]], idx_key: str) -> List[Dict]:
+    days = [ds + timedelta(days=i) for i in range((de - ds).days + 1)]
+    if not ranges:
+        return [r for d in days for r in slices.get(d, ())]
+    out: List[Dict] = []
+    for lo, hi in ranges:
+        for d in days:
+            out.extend(r for r in slices.get(d, ()) if lo <= r[idx_key] <= hi)
+    return out
@@ -0,0 +1,205 @@
+"""
+Derived price tables as query engines:
+
+- ``PriceRollups``: daily/monthly rollups (sql/007_price_rollups.sql) for
+  TWAP/VWAP. A spec's date range is split into whole calendar months, read
+  from ``price_rollup_monthly``, and the edge days around them, read from
+  ``price_rollup_daily``; both are filtered to the spec's blocks/slots and
+  reduced to the PriceAgg sums in one statement. "in 2024" touches 12×24
+  rows instead of 8,784 hourly ones.
+- ``HourlySeries``: the materialized hourly series (sql/008_price_hourly.sql),
+  native hours plus hours derived from 15-min slots, with a ``derived`` flag
+  so the 15-min fallback needs no second query.
+
+Each is used only for days it holds: its first/last day per key is re-read
+every ``coverage_sec`` and ranges outside it go to the RPC paths. Until the
+migration is applied ``covers`` is always False.
+"""
+import asyncio, time, traceback
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+_REGCLASS_SQL = "SELECT to_regclass(%s) IS NOT NULL, to_regclass('public.price_hourly') IS NOT NULL"
+
+_ROLLUP_COVERAGE_SQL = """
+SELECT k.market, k.gran,
+       (SELECT min(d.delivery_date) FROM price_rollup_daily d WHERE d.market = k.market AND d.gran = k.gran),
+       (SELECT max(d.delivery_date) FROM price_rollup_daily d WHERE d.market = k.market AND d.gran = k.gran)
+FROM unnest(%s::text[], %s::text[]) AS k(market, gran)
+"""
+# Months in [m0, m1) from the monthly table; every other day of [ds, de] from the daily one.
+# {derived} is n_derived once sql/008 is applied, 0 before.
+_ROLLUP_SUMS_SQL = """
+SELECT coalesce(sum(n_rows), 0)::int       AS n_rows,
+       coalesce(sum(n_days), 0)::int       AS n_days,
+       coalesce(sum(minutes), 0)           AS minutes,
+       coalesce(sum(price_min), 0)         AS price_min,
+       coalesce(sum(mw_min), 0)            AS mw_min,
+       coalesce(sum(price_mw_min), 0)      AS price_mw_min,
+       min(min_price)                      AS min_price,
+       max(max_price)                      AS max_price,
+       coalesce(sum(n_derived), 0)::int    AS n_derived
+FROM (
+  SELECT sum(n_rows) AS n_rows, max(n_days) AS n_days, sum(minutes) AS minutes, sum(price_min) AS price_min,
+         sum(mw_min) AS mw_min, sum(price_mw_min) AS price_mw_min, min(min_price) AS min_price,
+         max(max_price) AS max_price, sum({derived}) AS n_derived
+  FROM price_rollup_monthly
+  WHERE market = %(market)s AND gran = %(gran)s AND month >= %(m0)s AND month < %(m1)s
+    AND (%(blocks)s::int[] IS NULL OR block_index = ANY(%(blocks)s::int[]))
+  GROUP BY month
+  UNION ALL
+  SELECT sum(n_rows), 1, sum(minutes), sum(price_min),
+         sum(mw_min), sum(price_mw_min), min(min_price), max(max_price), sum({derived})
+  FROM price_rollup_daily
+  WHERE market = %(market)s AND gran = %(gran)s AND delivery_date BETWEEN %(ds)s AND %(de)s
+    AND NOT (delivery_date >= %(m0)s AND delivery_date < %(m1)s)
+    AND (%(blocks)s::int[] IS NULL OR block_index = ANY(%(blocks)s::int[]))
+  GROUP BY delivery_date
+) x
+"""
+
+_HOURLY_COVERAGE_SQL = """
+SELECT k.market, 'hour',
+       (SELECT min(h.delivery_date) FROM price_hourly h WHERE h.market = k.market),
+       (SELECT max(h.delivery_date) FROM price_hourly h WHERE h.market = k.market)
+FROM unnest(%s::text[], %s::text[]) AS k(market, gran)
+"""
+# Same row shape and order as the range-set RPC query, plus the two extra columns.
+_HOURLY_ROWS_SQL = """
+SELECT h.delivery_date, h.block_index, h.price_avg_rs_per_mwh, h.scheduled_mw_sum, h.duration_min,
+       h.price_vwap_rs_per_mwh, h.derived
+FROM unnest(%s::int[], %s::int[]) WITH ORDINALITY AS g(lo, hi, ord)
+JOIN price_hourly h ON h.block_index BETWEEN g.lo AND g.hi
+WHERE h.market = %s AND h.delivery_date BETWEEN %s AND %s
+ORDER BY g.ord, h.delivery_date, h.block_index;
+"""
+# The first/last %s rows of that order, plus the total count.
+_HOURLY_WINDOW_SQL = """
+SELECT * FROM (
+  SELECT h.delivery_date, h.block_index, h.price_avg_rs_per_mwh, h.scheduled_mw_sum, h.duration_min,
+         h.price_vwap_rs_per_mwh, h.derived,
+         row_number() OVER (ORDER BY g.ord, h.delivery_date, h.block_index) AS rn_, count(*) OVER () AS n_
+  FROM unnest(%s::int[], %s::int[]) WITH ORDINALITY AS g(lo, hi, ord)
+  JOIN price_hourly h ON h.block_index BETWEEN g.lo AND g.hi
+  WHERE h.market = %s AND h.delivery_date BETWEEN %s AND %s
+) x
+WHERE rn_ <= %s OR rn_ > n_ - %s
+ORDER BY rn_;
+"""
+_HOURLY_AGG_SQL = """
+SELECT count(*)::int                                                   AS n_rows,
+       count(DISTINCT h.delivery_date)::int                            AS n_days,
+       coalesce(sum(h.duration_min::float8), 0)                        AS minutes,
+       coalesce(sum(h.price_avg_rs_per_mwh * h.duration_min), 0)       AS price_min,
+       coalesce(sum(coalesce(h.scheduled_mw_sum, 0) * h.duration_min), 0) AS mw_min,
+       coalesce(sum(h.price_vwap_rs_per_mwh * coalesce(h.scheduled_mw_sum, 0) * h.duration_min), 0) AS price_mw_min,
+       min(h.price_avg_rs_per_mwh)                                     AS min_price,
+       max(h.price_avg_rs_per_mwh)                                     AS max_price,
+       count(*) FILTER (WHERE h.derived)::int                          AS n_derived
+FROM unnest(%s::int[], %s::int[]) AS g(lo, hi)
+JOIN price_hourly h ON h.block_index BETWEEN g.lo AND g.hi
+WHERE h.market = %s AND h.delivery_date BETWEEN %s AND %s;
+"""
+
+
+def full_months(ds: date, de: date) -> Tuple[date, date]:
+    """[m0, m1): the whole calendar months inside [ds, de] (m0 == m1 when there are none)."""
+    m0 = ds if ds.day == 1 else (ds.replace(day=1) + timedelta(days=32)).replace(day=1)
+    m1 = (de + timedelta(days=1)).replace(day=1)
+    return m0, max(m0, m1)
+
+
+class _CoveredTable:
+    """A derived table plus the (first, last) day it holds per (market, gran)."""
+    table = ""
+    grans: Tuple[str, ...] = ()
+    coverage_sql = ""
+
+    def __init__(self, pool, markets: Tuple[str, ...] = ("DAM", "GDAM"), coverage_sec: float = 60.0):
+        self.pool = pool
+        self.markets = markets
+        self.coverage_sec = coverage_sec
+        self.available: Optional[bool] = None
+        self.has_hourly: bool = False           # sql/008 applied
+        self._coverage: Dict[Tuple[str, str], Tuple[date, date]] = {}
+        self._checked_at: Optional[float] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self.counters = dict(queries=0, coverage_checks=0)
+
+    async def refresh_coverage(self) -> None:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._checked_at is not None and time.monotonic() - self._checked_at < self.coverage_sec:
+                return
+            self.counters["coverage_checks"] += 1
+            try:
+                row = await self.pool.fetch_one(_REGCLASS_SQL, (f"public.{self.table}",))
+                self.available, self.has_hourly = bool(row and row[0]), bool(row and row[1])
+                coverage = {}
+                if self.available:
+                    keys = [(m, g) for m in self.markets for g in self.grans]
+                    rows = await self.pool.fetch_all(self.coverage_sql, ([m for m, _ in keys], [g for _, g in keys]))
+                    coverage = {(m, g): (d0, d1) for m, g, d0, d1 in rows if d0 is not None}
+                self._coverage = coverage
+            except Exception:
+                traceback.print_exc()
+                self.available, self._coverage = False, {}
+            self._checked_at = time.monotonic()
+
+    async def covers(self, market: str, gran: str, ds: date, de: date) -> bool:
+        if self._checked_at is None or time.monotonic() - self._checked_at >= self.coverage_sec:
+            await self.refresh_coverage()
+        span = self._coverage.get((market, gran))
+        return span is not None and span[0] <= ds and de <= span[1]
+
+    def stats(self) -> Dict:
+        return dict(available=self.available,
+                    coverage={f"{m}/{g}": f"{d0}..{d1}" for (m, g), (d0, d1) in self._coverage.items()},
+                    **self.counters)
+
+
+class PriceRollups(_CoveredTable):
+    table = "price_rollup_monthly"
+    grans = ("hour", "quarter")
+    coverage_sql = _ROLLUP_COVERAGE_SQL
+
+    async def sums(self, market: str, gran: str, ds: date, de: date, ranges: List[Tuple[int, int]]) -> Dict:
+        """The PriceAgg fields for the selection."""
+        m0, m1 = full_months(ds, de)
+        blocks = sorted({b for lo, hi in ranges for b in range(lo, hi + 1)}) or None
+        sql = _ROLLUP_SUMS_SQL.format(derived="n_derived" if self.has_hourly else "0")
+        self.counters["queries"] += 1
+        rows = await self.pool.fetch_dicts(sql, dict(market=market, gran=gran, ds=ds, de=de,
+                                                     m0=m0, m1=m1, blocks=blocks))
+        return rows[0]
+
+
+class HourlySeries(_CoveredTable):
+    table = "price_hourly"
+    grans = ("hour",)
+    coverage_sql = _HOURLY_COVERAGE_SQL
+
+    @staticmethod
+    def _bounds(ranges: List[Tuple[int, int]]) -> Tuple[List[int], List[int]]:
+        ranges = ranges or [(1, 24)]
+        return [a for a, _ in ranges], [b for _, b in ranges]
+
+    async def rows(self, market: str, ds: date, de: date, ranges: List[Tuple[int, int]]) -> List[Dict]:
+        los, his = self._bounds(ranges)
+        self.counters["queries"] += 1
+        return await self.pool.fetch_dicts(_HOURLY_ROWS_SQL, (los, his, market, ds, de))
+
+    async def rows_window(self, market: str, ds: date, de: date, ranges: List[Tuple[int, int]],
+                          edge: int) -> Tuple[List[Dict], int]:
+        """First and last ``edge`` rows of ``rows()`` and its total length."""
+        los, his = self._bounds(ranges)
+        self.counters["queries"] += 1
+        rows = await self.pool.fetch_dicts(_HOURLY_WINDOW_SQL, (los, his, market, ds, de, edge, edge))
+        return rows, (int(rows[0]["n_"]) if rows else 0)
+
+    async def sums(self, market: str, ds: date, de: date, ranges: List[Tuple[int, int]]) -> Dict:
+        los, his = self._bounds(ranges)
+        self.counters["queries"] += 1
+        rows = await self.pool.fetch_dicts(_HOURLY_AGG_SQL, (los, his, market, ds, de))
+        return rows[0]
@@ -0,0 +1,173 @@
+"""
+Slow-query capture for statements that call the rpc_* functions.
+
+The pool reports every statement's duration to ``SlowQueryLog.observe`` from
+its worker thread. One slower than ``threshold_ms`` (or failing after it,
+e.g. on statement_timeout) is logged with its parameters. Its fully bound
+text is queued for ``EXPLAIN (ANALYZE, BUFFERS)``, which runs on this
+module's own thread and connection, never on a pooled one. The explain runs
+READ ONLY and is rolled back, and each distinct statement is explained at
+most once per ``cooldown_sec`` so a slow database is not hammered.
+
+The last ``max_entries`` captures are kept in memory and dumped as JSON lines.
+"""
+import json, queue, re, threading, time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence
+
+_RPC_RE = re.compile(r"\b(rpc_\w+)\s*\(")
+_EXEC_TIME_RE = re.compile(r"Execution Time: ([\d.]+) ms")
+_READ_RE = re.compile(r"^\s*(SELECT|WITH)\b", re.I)
+
+
+def _jsonable(params: Any) -> Any:
+    return json.loads(json.dumps(params, default=str)) if params is not None else None
+
+
+class SlowQueryLog:
+    def __init__(self, connect: Callable[[], Any], threshold_ms: float = 1000, max_entries: int = 200,
+                 explain: bool = True, explain_timeout_ms: int = 60000, cooldown_sec: float = 300,
+                 log: Optional[Callable[[str], None]] = print):
+        self._connect = connect
+        self.threshold_ms = threshold_ms
+        self.explain = explain
+        self.explain_timeout_ms = explain_timeout_ms
+        self.cooldown_sec = cooldown_sec
+        self.log = log
+        self._entries: Deque[Dict[str, Any]] = deque(maxlen=max(1, max_entries))
+        self._explained_at: Dict[str, float] = {}
+        self._queue: "queue.Queue" = queue.Queue(maxsize=16)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._conn = None
+        self._seq = 0
+        self.counters = dict(captured=0, explained=0, explain_failed=0, explain_skipped=0)
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold_ms > 0
+
+    # ── capture (pool worker threads) ────────────────────────
+    def observe(self, cur, sql: str, params: Optional[Sequence], seconds: float, failed: bool = False) -> None:
+        """Pool hook; cheap unless the statement is slow and calls an rpc_* function. Never raises."""
+        if not self.enabled or seconds * 1000 < self.threshold_ms:
+            return
+        try:
+            rpcs = sorted(set(_RPC_RE.findall(sql)))
+            if not rpcs:
+                return
+            bound = cur.mogrify(sql, params or ()).decode("utf-8", "replace")
+            with self._lock:
+                self._seq += 1
+                entry = dict(id=self._seq, at=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                             ms=round(seconds * 1000, 1), failed=failed, rpcs=rpcs, params=_jsonable(params),
+                             sql=" ".join(sql.split()), plan=None, plan_ms=None, plan_error=None)
+                self._entries.append(entry)
+                self.counters["captured"] += 1
+                key = entry["sql"]
+                due = self.explain and _READ_RE.match(sql) and \
+                    time.monotonic() - self._explained_at.get(key, -self.cooldown_sec) >= self.cooldown_sec
+                if due:
+                    self._explained_at[key] = time.monotonic()
+            if self.log:
+                self.log(f"[slow] {entry['ms']:.0f} ms {','.join(rpcs)} params={json.dumps(entry['params'])}"
+                         + (" (failed)" if failed else ""))
+            if not due:
+                self.counters["explain_skipped"] += 1
+                return
+            self._ensure_thread()
+            self._queue.put_nowait((entry, bound))
+        except queue.Full:
+            self.counters["explain_skipped"] += 1
+        except Exception:
+            pass
+
+    # ── EXPLAIN (own thread, own connection) ─────────────────
+    def _ensure_thread(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="slowlog-explain", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            entry, bound = item
+            try:
+                plan = self._explain(bound)
+                m = _EXEC_TIME_RE.search(plan)
+                with self._lock:
+                    entry["plan"] = plan
+                    entry["plan_ms"] = float(m.group(1)) if m else None
+                self.counters["explained"] += 1
+            except Exception as e:
+                with self._lock:
+                    entry["plan_error"] = f"{type(e).__name__}: {e}".strip()
+                self.counters["explain_failed"] += 1
+                self._drop_conn()
+
+    def _explain(self, bound: str) -> str:
+        if self._conn is None or self._conn.closed:
+            self._conn = self._connect()
+        conn = self._conn
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SET TRANSACTION READ ONLY")
+                cur.execute("SET LOCAL statement_timeout = %s", (int(self.explain_timeout_ms),))
+                cur.execute("EXPLAIN (ANALYZE, BUFFERS) " + bound)
+                return "\n".join(r[0] for r in cur.fetchall())
+        finally:
+            if not conn.closed:
+                conn.rollback()
+
+    def _drop_conn(self) -> None:
+        try:
+            if self._conn is not None:
+                self._conn.close()
+        except Exception:
+            pass
+        self._conn = None
+
+    def close(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                pass
+        self._drop_conn()
+
+    # ── reading ──────────────────────────────────────────────
+    def entries(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(e) for e in self._entries]
+
+    def dump_jsonl(self) -> str:
+        return "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in self.entries())
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(threshold_ms=self.threshold_ms, kept=len(self._entries), **self.counters)
+
+    def render_md(self, last: int = 10) -> str:
+        if not self.enabled:
+            return "Slow-query capture is off (`SLOW_QUERY_MS=0`)."
+        rows = self.entries()[-last:][::-1]
+        lines = [f"## Slow queries (≥ {self.threshold_ms:g} ms, newest first)",
+                 f"_{self.counters['captured']} captured since startup, {len(self._entries)} kept, "
+                 f"{self.counters['explained']} explained. `/slowlog dump` attaches all kept entries with plans._", ""]
+        if not rows:
+            lines.append("_None yet._")
+            return "\n".join(lines)
+        lines += ["| At (UTC) | ms | Function | Parameters | Plan |", "|---|---:|---|---|---|"]
+        for e in rows:
+            if e["plan"]:
+                plan = f"{e['plan_ms']:.0f} ms on re-run" if e["plan_ms"] is not None else "captured"
+            else:
+                plan = "error" if e["plan_error"] else ("pending" if self.explain else "—")
+            params = json.dumps(e["params"])
+            params = params if len(params) <= 80 else params[:77] + "…"
+            lines.append(f"| {e['at'][11:19]} | {e['ms']:.0f}{' ⚠️' if e['failed'] else ''} | {', '.join(e['rpcs'])} | "
+                         f"`{params}` | {plan} |")
+        return "\n".join(lines)
@@ -0,0 +1,134 @@
+"""
+Startup warm-up: named steps run once per process, off the request path.
+
+Steps that need no event loop (opening the pool, exercising the parser,
+importing NumPy) run on a daemon thread as soon as app.py is imported.
+Chainlit loads the module before its loop starts. Steps that touch
+loop-bound state (coverage probes, cache preloads) run as one task, started
+by the first chat session. Requests are served throughout; a request that
+arrives before a step finishes takes the normal cold path.
+
+Each step records its state, duration and a short detail. ``/ready`` shows
+them, and the process is "ready" once every registered step has finished.
+A failed step is reported but never retried here; the lazy paths recover.
+"""
+import asyncio, threading, time, traceback
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+SyncStep = Tuple[str, Callable[[], Any]]
+AsyncStep = Tuple[str, Callable[[], Awaitable[Any]]]
+
+
+class Warmup:
+    def __init__(self, log: Optional[Callable[[str], None]] = print):
+        self.log = log
+        self.t0 = time.monotonic()
+        self.steps: Dict[str, Dict[str, Any]] = {}     # name -> state, ms, detail (registration order)
+        self.ready_after: Optional[float] = None        # seconds from t0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._task: Optional[asyncio.Task] = None
+        self._async_steps: List[AsyncStep] = []
+
+    # ── registration / start ─────────────────────────────────
+    def _register(self, names: List[str]) -> None:
+        with self._lock:
+            for n in names:
+                self.steps.setdefault(n, dict(state="pending", ms=None, detail=""))
+            self.ready_after = None
+
+    def start_thread(self, steps: List[SyncStep]) -> None:
+        """Run blocking ``steps`` in order on a daemon thread (no event loop needed)."""
+        self._register([n for n, _ in steps])
+
+        def _run():
+            for name, fn in steps:
+                self._call(name, fn)
+        self._thread = threading.Thread(target=_run, name="warmup", daemon=True)
+        self._thread.start()
+
+    def defer(self, steps: List[AsyncStep]) -> None:
+        """Register coroutine ``steps``; they run concurrently on the first ``start()``."""
+        self._register([n for n, _ in steps])
+        self._async_steps.extend(steps)
+
+    def start(self) -> Optional[asyncio.Task]:
+        """Start the deferred steps once (call from the event loop; later calls are no-ops)."""
+        if self._task is None and self._async_steps:
+            steps, self._async_steps = self._async_steps, []
+            self._task = asyncio.create_task(self._run_async(steps))
+        return self._task
+
+    async def _run_async(self, steps: List[AsyncStep]) -> None:
+        await asyncio.gather(*(self._acall(name, fn) for name, fn in steps))
+
+    # ── step bookkeeping ─────────────────────────────────────
+    def _begin(self, name: str) -> float:
+        with self._lock:
+            self.steps[name]["state"] = "running"
+        return time.perf_counter()
+
+    def _end(self, name: str, t: float, result: Any = None, exc: Optional[BaseException] = None) -> None:
+        ms = (time.perf_counter() - t) * 1000
+        with self._lock:
+            st = self.steps[name]
+            st["ms"] = ms
+            if exc is not None:
+                st["state"], st["detail"] = "failed", f"{type(exc).__name__}: {exc}".strip()
+            else:
+                st["state"] = "skipped" if result is False else "ok"
+                st["detail"] = result if isinstance(result, str) else ""
+            done = all(s["state"] not in ("pending", "running") for s in self.steps.values())
+            if done and self.ready_after is None:
+                self.ready_after = time.monotonic() - self.t0
+        if self.log:
+            self.log(f"[warmup] {name}: {st['state']} in {ms:.0f} ms" + (f" ({st['detail']})" if st["detail"] else ""))
+            if done:
+                self.log(f"[warmup] ready {self.ready_after:.2f}s after start")
+
+    def _call(self, name: str, fn: Callable[[], Any]) -> None:
+        t = self._begin(name)
+        try:
+            result = fn()
+        except Exception as e:
+            traceback.print_exc()
+            self._end(name, t, exc=e)
+        else:
+            self._end(name, t, result)
+
+    async def _acall(self, name: str, fn: Callable[[], Awaitable[Any]]) -> None:
+        t = self._begin(name)
+        try:
+            result = await fn()
+        except Exception as e:
+            traceback.print_exc()
+            self._end(name, t, exc=e)
+        else:
+            self._end(name, t, result)
+
+    # ── reading ──────────────────────────────────────────────
+    @property
+    def ready(self) -> bool:
+        return self.ready_after is not None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(ready=self.ready, ready_after=self.ready_after,
+                        steps={n: dict(s) for n, s in self.steps.items()})
+
+    def render_md(self) -> str:
+        s = self.stats()
+        up = time.monotonic() - self.t0
+        if s["ready"]:
+            head = f"**Ready** — warm-up finished {s['ready_after']:.2f}s after start (up {up / 60:.0f} min)."
+        elif not s["steps"]:
+            head = "Warm-up is off (`WARMUP=0`)."
+        else:
+            head = f"**Warming up** — {up:.1f}s since start; queries are served meanwhile."
+        lines = ["## Startup", head, ""]
+        if s["steps"]:
+            lines += ["| Step | State | ms | Detail |", "|---|---|---:|---|"]
+            for name, st in s["steps"].items():
+                ms = f"{st['ms']:.0f}" if st["ms"] is not None else "—"
+                lines.append(f"| {name} | {st['state']} | {ms} | {st['detail'] or '—'} |")
+        return "\n".join(lines)
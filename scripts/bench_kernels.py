@@ -0,0 +1,67 @@
+"""
+Micro-benchmark: row-dict TWAP/VWAP (app/kernels.py twap_kwh + vwap_kwh)
+versus the column kernels, at 1k / 35k / 350k rows.
+
+    python scripts/bench_kernels.py [--sizes 1000,35000,350000] [--repeat 5]
+
+Rows are synthetic 15-min quarter rows. "legacy/Decimal" is what the app did
+with psycopg2's default NUMERIC → Decimal decoding; "legacy/float" is the same
+functions on float rows (NUMERIC now decodes to float); "columns+kernel"
+includes building the arrays from the row dicts; "kernel" is the reduction on
+prebuilt buffers (the cube path).
+"""
+import argparse, os, random, sys, time
+from datetime import date, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+from kernels import columns, price_stats, twap_kwh, vwap_kwh  # noqa: E402
+
+PRICE, MW, MIN = "price_rs_per_mwh", "scheduled_mw", "duration_min"
+
+
+def make_rows(n: int, as_decimal: bool):
+    rnd = random.Random(42)
+    d0 = date(2022, 8, 1)
+    conv = (lambda v: Decimal(f"{v:.2f}")) if as_decimal else (lambda v: round(v, 2))
+    return [{
+        "delivery_date": d0 + timedelta(days=i // 96),
+        "slot_index": i % 96 + 1,
+        PRICE: conv(rnd.uniform(1500, 10000)),
+        MW: None if rnd.random() < 0.01 else conv(rnd.uniform(0, 3000)),
+        MIN: 15,
+    } for i in range(n)]
+
+
+def best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter(); fn(); best = min(best, time.perf_counter() - t)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="1000,35000,350000")
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    print(f"{'rows':>8}  {'legacy/Decimal':>15}  {'legacy/float':>13}  {'columns+kernel':>15}  {'kernel':>10}  {'speedup':>8}")
+    for n in (int(x) for x in args.sizes.split(",")):
+        drows, frows = make_rows(n, True), make_rows(n, False)
+        cols = columns(frows, PRICE, MW, MIN)
+
+        ref = (twap_kwh(drows, PRICE, MIN), vwap_kwh(drows, PRICE, MW, MIN))
+        got = price_stats(*cols)
+        assert abs(ref[0] - got["twap"]) < 1e-9 and abs(ref[1] - got["vwap"]) < 1e-9, (ref, got)
+
+        t_dec = best_of(lambda: (twap_kwh(drows, PRICE, MIN), vwap_kwh(drows, PRICE, MW, MIN)), args.repeat)
+        t_flt = best_of(lambda: (twap_kwh(frows, PRICE, MIN), vwap_kwh(frows, PRICE, MW, MIN)), args.repeat)
+        t_col = best_of(lambda: price_stats(*columns(frows, PRICE, MW, MIN)), args.repeat)
+        t_ker = best_of(lambda: price_stats(*cols), args.repeat)
+        print(f"{n:>8}  {t_dec*1e3:>12.2f} ms  {t_flt*1e3:>10.2f} ms  {t_col*1e3:>12.2f} ms  "
+              f"{t_ker*1e3:>7.3f} ms  {t_dec/t_col:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
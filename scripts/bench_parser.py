@@ -0,0 +1,317 @@
+"""
+Query-parser benchmark and golden corpus (app/parsing.py; no DB, no Chainlit).
+
+    python scripts/bench_parser.py check [--corpus scripts/parser_corpus.jsonl]
+    python scripts/bench_parser.py bench [--repeat 3]
+    python scripts/bench_parser.py regen [--n 4000] [--seed 7] [--today 2025-11-15] [--from-analytics 500]
+
+check  re-parses every corpus query with the ``today`` recorded next to it and
+       compares the resulting QuerySpecs (or the exception) with the recorded
+       ones; prints each difference and exits 1 if there is any.
+bench  times each front-end function over the corpus, one call at a time:
+       calls/s, p50 and p99 per call. ``QueryParser.parse (hit)`` is the
+       memoized path the app takes for a repeated message.
+regen  rewrites the corpus from the current parser. Run it only for an
+       intended behaviour change and review the diff before committing.
+
+The corpus is the hand-written examples below plus seeded template queries in
+the phrasings users type (markets, stats, word/numeric dates and ranges,
+relative days, multi-year months, clock/hour/slot windows). ``--from-analytics N``
+adds up to N distinct logged messages from analytics_usage_events (needs
+DATABASE_URL; previews are cut at 120 chars, so longer ones are skipped).
+"""
+import argparse, json, os, random, statistics, sys, time
+from datetime import date
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+from parsing import (QueryParser, _compress_ranges, build_specs, canonicalize, extract_explicit_time_groups,  # noqa: E402
+                     normalize, parse_date_or_range, parse_market, parse_multi_year_months, parse_query,
+                     parse_ranges, parse_stat)
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "parser_corpus.jsonl")
+
+EXAMPLES = [
+    "dam 15 Jan 2024",
+    "gdam yesterday",
+    "dam Oct 2025",
+    "dam Nov 2022, 2023, 2024 6-9, 12-14, 18-22 hrs",
+    "dam 10-15 Aug 2025 list",
+    "gdam vwap 1 Jul 2025 to 30 Sep 2025",
+    "dam 20 Oct 2025 slots 10-20 list",
+    "dam in 2024 vwap",
+    "dam 24 September to 24 October 2025 7:30 to 9:15",
+    "dam 5 Aug 2025 6pm to 9pm",
+    "dam Sep 2025 daily avg",
+    "gdam 01/03/2023 to 15/03/2023 list 6-9, 18-22 hrs",
+    "31/10/2025",
+    "30 Sep 2025",
+    "Oct 2025",
+    "10–15 Aug 2025",
+    "yesterday",
+    "today",
+    "this month",
+    "last month",
+    "GDAM price between 1 Aug 2025 and 15 Aug 2025",
+    "Green Day Ahead average for Oct'25",
+    "dam weighted average jan-24 full day",
+    "dam 3 Mar 2024 blocks 33-40",
+    "what was the DAM price on 12/05/2024 from 10:00 to 14:30",
+    "dam twap 1 jan 2025 till 31 mar 2025 18 to 24 hrs",
+    "Nov 2022, 2023, and 2024 gdam vwap",
+    "dam 31 Feb 2025",
+]
+
+MARKETS = ["", "dam", "DAM", "gdam", "GDAM", "Green Day Ahead", "green day-ahead", "IEX DAM"]
+STATS = ["", "", "avg", "average price", "mean", "twap", "vwap", "weighted average", "list", "show table",
+         "rows", "detailed", "daily average", "daily avg"]
+MONTH_NAMES = ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "sept", "oct", "nov", "dec",
+               "January", "February", "March", "April", "June", "July", "August", "September", "October",
+               "November", "December"]
+LEADS = ["", "", "", "for", "on", "price", "what was the", "show me", "give"]
+
+
+def _year(r: random.Random, short: bool = True) -> str:
+    y = r.choice(["2022", "2023", "2024", "2025", "2025", "2026"])
+    return y[2:] if short and r.random() < 0.1 else y
+
+
+def _period(r: random.Random) -> str:
+    mon = lambda: r.choice(MONTH_NAMES)
+    day = lambda: r.randint(1, 28)
+    c = r.randint(0, 15)
+    if c == 0:
+        return r.choice(["yesterday", "today", "this month", "last month"])
+    if c == 1:
+        return f"{day()} {mon()} {_year(r)}"
+    if c == 2:
+        return f"{day()} {mon()}"
+    if c == 3:
+        return f"{mon()} {_year(r)}"
+    if c == 4:
+        return f"{mon()}{r.choice(['-', chr(39)])}{_year(r, False)[2:]}"
+    if c == 5:
+        a = r.randint(1, 20)
+        return f"{a}{r.choice(['-', ' to ', '–'])}{r.randint(a, 28)} {mon()} {r.choice([_year(r), ''])}".strip()
+    if c == 6:
+        return (f"{r.choice(['', 'from '])}{day()} {mon()} {_year(r)} {r.choice(['to', '-', 'till', 'until', 'upto'])} "
+                f"{day()} {mon()} {_year(r)}")
+    if c == 7:
+        return f"{r.choice(['', 'from '])}{day()} {mon()} to {day()} {mon()} {_year(r)}"
+    if c == 8:
+        return f"between {day()} {mon()} {_year(r)} and {day()} {mon()} {_year(r)}"
+    if c == 9:
+        sep = r.choice(["/", "-"])
+        return f"{day():02d}{sep}{r.randint(1, 12):02d}{sep}{_year(r)}"
+    if c == 10:
+        sep = r.choice(["/", "-"])
+        return (f"{day():02d}{sep}{r.randint(1, 12):02d}{sep}{_year(r)} to "
+                f"{day():02d}{sep}{r.randint(1, 12):02d}{sep}{_year(r)}")
+    if c == 11:
+        return f"{r.choice(['in', 'for', 'full year', 'year'])} {_year(r, False)}"
+    if c == 12:
+        ys = sorted(r.sample(["2022", "2023", "2024", "2025"], r.randint(2, 4)))
+        tail = f"{', '.join(ys[1:-1])}{', ' if len(ys) > 2 else ''}{r.choice(['', 'and '])}{ys[-1]}"
+        return f"{mon()} {ys[0]}, {tail}"
+    if c == 13:
+        return f"{mon()} {_year(r, False)}, {mon()} {_year(r, False)}"
+    if c == 14:
+        return f"{r.randint(1, 31)} {mon()} {_year(r)}"      # may be an invalid day
+    return r.choice(["", "latest", "recently"])
+
+
+def _window(r: random.Random) -> str:
+    c = r.randint(0, 11)
+    if c <= 1:
+        return ""
+    if c == 2:
+        return f"{r.randint(0, 23):02d}:{r.choice(['00', '15', '30', '45'])} to {r.randint(1, 24):02d}:{r.choice(['00', '15', '30'])}"
+    if c == 3:
+        return f"{r.randint(1, 12)}{r.choice(['am', 'pm'])} {r.choice(['to', '-'])} {r.randint(1, 12)}{r.choice(['am', 'pm'])}"
+    if c == 4:
+        a = r.randint(0, 22)
+        return f"{a} to {r.randint(a + 1, 24)} {r.choice(['hrs', 'hours', 'hr'])}"
+    if c == 5:
+        a = r.randint(1, 90)
+        return f"{r.choice(['slots', 'blocks', 'quarters'])} {a}-{r.randint(a, 96)}"
+    if c == 6:
+        a = r.randint(1, 90)
+        return f"{a}-{r.randint(a, 99)} {r.choice(['slots', 'blocks'])}"
+    if c == 7:
+        a = r.randint(0, 20)
+        return f"{a}-{r.randint(a + 1, 24)}"
+    if c == 8:
+        return r.choice(["full day", "whole day", "entire day", "all 24 hours"])
+    if c == 9:
+        return ", ".join(f"{a}-{a + r.randint(1, 3)}" for a in sorted(r.sample(range(0, 20), r.randint(2, 3)))) + " hrs"
+    if c == 10:
+        return f"{r.randint(6, 9)}-{r.randint(10, 12)} hours and {r.randint(17, 19)}-{r.randint(20, 23)} hours"
+    return f"{r.randint(0, 11)}:30 to {r.randint(12, 23)}:00 and slots {r.randint(1, 40)}-{r.randint(41, 96)}"
+
+
+def make_queries(n: int, seed: int) -> List[str]:
+    r = random.Random(seed)
+    out = []
+    for _ in range(n):
+        parts = [r.choice(LEADS), r.choice(MARKETS), r.choice(STATS), _period(r), _window(r)]
+        if r.random() < 0.25:
+            head, tail = parts[:2], parts[2:]
+            r.shuffle(tail)
+            parts = head + tail
+        q = " ".join(p for p in parts if p)
+        if r.random() < 0.1:
+            q = q.upper() if r.random() < 0.3 else q.title()
+        out.append(q or "dam")
+    return out
+
+
+def analytics_queries(limit: int) -> List[str]:
+    import psycopg2
+    from dotenv import find_dotenv, load_dotenv
+    load_dotenv(find_dotenv(usecwd=True), override=True)
+    conn = psycopg2.connect(os.environ["DATABASE_URL"])
+    try:
+        with conn, conn.cursor() as cur:
+            cur.execute("""
+                SELECT DISTINCT payload->>'text_preview' FROM analytics_usage_events
+                WHERE type = 'message' AND length(payload->>'text_preview') < 120
+                  AND payload->>'text_preview' NOT IN ('/stats', 'stats')
+                LIMIT %s""", (limit,))
+            return [q for (q,) in cur.fetchall() if q and q.strip()]
+    finally:
+        conn.close()
+
+
+def expected(q: str, today: date) -> Dict:
+    """What the app builds for ``q``: its QuerySpecs (ranges compressed), or the exception raised."""
+    try:
+        specs = build_specs(parse_query(q, today))
+    except Exception as e:
+        return {"error": type(e).__name__}
+    return {"specs": [{"market": s.market, "start": s.start_date.isoformat(), "end": s.end_date.isoformat(),
+                       "gran": s.granularity, "hours": _compress_ranges(s.hours or []),
+                       "slots": _compress_ranges(s.slots or []), "stat": s.stat} for s in specs]}
+
+
+def load(path: str) -> List[Dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def regen(args) -> None:
+    queries = EXAMPLES + make_queries(args.n, args.seed)
+    if args.from_analytics:
+        queries += analytics_queries(args.from_analytics)
+    seen, rows = set(), []
+    for q in queries:
+        if q not in seen:
+            seen.add(q)
+            rows.append({"q": q, "today": args.today, **expected(q, date.fromisoformat(args.today))})
+    with open(args.corpus, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False, separators=(",", ":")) + "\n")
+    n_err = sum(1 for row in rows if "error" in row)
+    n_none = sum(1 for row in rows if row.get("specs") == [])
+    print(f"wrote {len(rows):,} queries to {args.corpus} ({n_err:,} raise, {n_none:,} build no spec)")
+
+
+def check(args) -> int:
+    rows = load(args.corpus)
+    bad = 0
+    for row in rows:
+        got = expected(row["q"], date.fromisoformat(row["today"]))
+        want = {k: row[k] for k in ("specs", "error") if k in row}
+        got = json.loads(json.dumps(got))           # tuples → lists, like the file
+        if got != want:
+            bad += 1
+            if bad <= args.show:
+                print(f"- {row['q']!r}\n    want {json.dumps(want, ensure_ascii=False)}\n    got  {json.dumps(got, ensure_ascii=False)}")
+    print(f"{len(rows):,} queries, {bad:,} differ")
+    return 1 if bad else 0
+
+
+def _time_calls(fn: Callable, inputs: List, repeat: int) -> List[float]:
+    samples = []
+    clock = time.perf_counter_ns
+    for _ in range(repeat):
+        for x in inputs:
+            t = clock()
+            try:
+                fn(x)
+            except Exception:
+                pass
+            samples.append(clock() - t)
+    return samples
+
+
+def bench(args) -> None:
+    rows = load(args.corpus)
+    cases = [(row["q"], date.fromisoformat(row["today"])) for row in rows]
+    norm = [(normalize(q), today) for q, today in cases]
+
+    # canonicalize inputs: one per (period, group) the app would build
+    canon = []
+    for q, today in cases:
+        try:
+            pq = parse_query(q, today)
+        except Exception:
+            continue
+        canon += [(pq.market, ps, pe, g, list(ix), pq.stat) for ps, pe in pq.periods for g, ix in pq.groups]
+
+    warm = QueryParser(max_entries=len(cases) + 1, today=lambda: cases[0][1])
+    for q, _ in cases:
+        try:
+            warm.parse(q)
+        except Exception:
+            pass
+
+    suite = [
+        ("normalize",                    lambda c: normalize(c[0]), cases),
+        ("parse_market",                 lambda c: parse_market(c[0]), norm),
+        ("parse_stat",                   lambda c: parse_stat(c[0]), norm),
+        ("parse_multi_year_months",      lambda c: parse_multi_year_months(c[0]), norm),
+        ("parse_date_or_range",          lambda c: parse_date_or_range(c[0], c[1]), norm),
+        ("parse_ranges",                 lambda c: parse_ranges(c[0]), norm),
+        ("extract_explicit_time_groups", lambda c: extract_explicit_time_groups(c[0]), norm),
+        ("canonicalize",                 lambda c: canonicalize(c[0], c[1], c[2], c[3], c[4], c[4], c[5]), canon),
+        ("parse_query (uncached)",       lambda c: parse_query(c[0], c[1]), cases),
+        ("parse_query + build_specs",    lambda c: build_specs(parse_query(c[0], c[1])), cases),
+        ("QueryParser.parse (hit)",      lambda c: warm.parse(c[0]), cases),
+    ]
+    print(f"{len(cases):,} corpus queries, best of {args.repeat} passes\n")
+    print(f"{'function':<30} {'calls':>8} {'calls/s':>11} {'p50 us':>8} {'p99 us':>8}")
+    for name, fn, inputs in suite:
+        samples = _time_calls(fn, inputs, args.repeat)
+        per_pass = len(inputs)
+        passes = [samples[i:i + per_pass] for i in range(0, len(samples), per_pass)]
+        best = min(sum(p) for p in passes) or 1
+        q = statistics.quantiles(samples, n=100) if len(samples) > 1 else samples * 99
+        print(f"{name:<30} {per_pass:>8,} {per_pass / (best / 1e9):>11,.0f} {q[49] / 1e3:>8.2f} {q[98] / 1e3:>8.2f}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    for name in ("check", "bench", "regen"):
+        p = sub.add_parser(name)
+        p.add_argument("--corpus", default=CORPUS)
+        if name == "check":
+            p.add_argument("--show", type=int, default=20, help="differences to print")
+        if name == "bench":
+            p.add_argument("--repeat", type=int, default=3)
+        if name == "regen":
+            p.add_argument("--n", type=int, default=4000, help="template queries")
+            p.add_argument("--seed", type=int, default=7)
+            p.add_argument("--today", default="2025-11-15", help="date relative phrases resolve against")
+            p.add_argument("--from-analytics", type=int, default=0, metavar="N")
+    args = ap.parse_args()
+    if args.cmd == "check":
+        sys.exit(check(args))
+    if args.cmd == "bench":
+        bench(args)
+    else:
+        regen(args)
+
+
+if __name__ == "__main__":
+    main()
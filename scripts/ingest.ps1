@@ -0,0 +1,4 @@
+param([Parameter(Mandatory=$true)][string[]]$Paths, [int]$Jobs = 4, [ValidateSet("binary","text")][string]$Format = "binary")
+. "$PSScriptRoot\_load-env.ps1"
+python "$PSScriptRoot\ingest.py" -j $Jobs --format $Format @Paths
+if ($LASTEXITCODE -ne 0) { throw "ingest failed" }
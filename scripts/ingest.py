@@ -0,0 +1,353 @@
+"""
+Parallel bulk loader for IEX price CSVs (replaces one-file-at-a-time `make load`).
+
+    python scripts/ingest.py data/inputs/                  # every *.csv in a directory
+    python scripts/ingest.py "data/inputs/dam_*.csv" -j 8  # glob
+    python scripts/ingest.py a.csv b.csv --no-merge        # stage only
+
+CSV columns (header row, any order):
+    market, delivery_date, block_index, duration_min, area, price_rs_per_mwh[, source_file]
+
+Each worker process parses and validates its files on the client (dates as
+YYYY-MM-DD, DD-MM-YYYY or DD/MM/YYYY, >= 2010-01-01; integer block/duration;
+numeric price) and streams the good rows with COPY straight into the typed
+``stage_prices`` table (binary COPY by default, ``--format text`` otherwise),
+skipping the TEXT staging table and the convert step of 002/003. Once all
+files are staged, ``price_points`` is merged in batches of delivery dates,
+writing only rows that actually changed; the changed date span per market is
+printed, the hourly series (sql/008, when applied) and the daily/monthly
+rollups (sql/007) are recomputed over exactly that span, and the span is
+logged to price_ingest_log (sql/009) so running apps drop those cached days.
+"""
+import argparse, csv, glob, io, os, re, struct, sys, time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import psycopg2
+from dotenv import find_dotenv, load_dotenv
+
+DATE_MIN_GUARD = date(2010, 1, 1)
+COLUMNS = ("market", "delivery_date", "block_index", "duration_min", "area", "price_rs_per_mwh", "source_file")
+
+STAGE_DDL = """
+CREATE TABLE IF NOT EXISTS stage_prices (
+  market TEXT,
+  delivery_date DATE,
+  block_index INT,
+  duration_min INT,
+  area TEXT,
+  price_rs_per_mwh NUMERIC(10,5),
+  source_file TEXT
+);
+"""
+
+# Change-aware merge, one batch of delivery dates per transaction (sql/005_merge_stage_prices.sql).
+PARTITIONS_SQL = """
+SELECT ensure_price_points_partitions(MIN(delivery_date), MAX(delivery_date))
+FROM stage_prices WHERE delivery_date >= DATE '2010-01-01';
+"""
+BATCHES_SQL = "SELECT batch_from, batch_to FROM stage_price_batches(%s);"
+MERGE_SQL = "SELECT * FROM merge_stage_prices(%s, %s);"
+ROLLUP_SQL = "SELECT refresh_price_rollups(%s, %s, %s, %s);"        # sql/007: market, gran, from, to
+HOURLY_EXISTS_SQL = "SELECT to_regclass('public.price_hourly') IS NOT NULL;"
+HOURLY_SQL = "SELECT refresh_price_hourly(%s, %s, %s);"              # sql/008
+LOG_EXISTS_SQL = "SELECT to_regclass('public.price_ingest_log') IS NOT NULL;"
+LOG_SQL = "INSERT INTO price_ingest_log (market, first_changed, last_changed) VALUES (%s, %s, %s);"   # sql/009
+
+
+def dsn() -> str:
+    load_dotenv(find_dotenv(usecwd=True), override=True)
+    url = os.getenv("DATABASE_URL", "").strip()
+    if not url:
+        sys.exit("DATABASE_URL not set (see .env.example)")
+    return url
+
+
+# ── parsing / validation ─────────────────────────────────────
+_ISO = re.compile(r"^(\d{4})-(\d{2})-(\d{2})$")
+_DMY = re.compile(r"^(\d{1,2})[-/](\d{1,2})[-/](\d{4})$")
+
+
+def parse_date(s: str) -> Optional[date]:
+    s = s.strip()
+    m = _ISO.match(s)
+    try:
+        if m:
+            d = date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+        else:
+            m = _DMY.match(s)
+            if not m:
+                return None
+            d = date(int(m.group(3)), int(m.group(2)), int(m.group(1)))
+    except ValueError:
+        return None
+    return d if d >= DATE_MIN_GUARD else None
+
+
+def _opt_int(s: str) -> Optional[int]:
+    s = (s or "").strip()
+    return int(float(s)) if s else None
+
+
+def read_rows(path: str, rejects: List[int]) -> Iterator[Tuple]:
+    """Validated (market, date, block, duration, area, price, source_file) tuples; bad rows counted in rejects[0]."""
+    base = os.path.basename(path)
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        rdr = csv.DictReader(f)
+        missing = {"market", "delivery_date", "block_index", "area", "price_rs_per_mwh"} - set(rdr.fieldnames or ())
+        if missing:
+            raise ValueError(f"{base}: missing columns {sorted(missing)}")
+        for r in rdr:
+            try:
+                d = parse_date(r["delivery_date"] or "")
+                block = int(float(r["block_index"]))
+                price = Decimal(r["price_rs_per_mwh"].strip())
+                if d is None or not price.is_finite():
+                    raise ValueError
+                yield (r["market"].strip().upper(), d, block, _opt_int(r.get("duration_min")),
+                       r["area"].strip(), price, (r.get("source_file") or "").strip() or base)
+            except (ValueError, TypeError, AttributeError, InvalidOperation):
+                rejects[0] += 1
+
+
+# ── COPY encoders ────────────────────────────────────────────
+_PG_EPOCH = date(2000, 1, 1).toordinal()
+
+
+def _numeric_bin(v: Decimal) -> bytes:
+    """Postgres binary NUMERIC: base-10000 digits with weight/sign/dscale header."""
+    sign, digits, exp = v.as_tuple()
+    dscale = max(0, -exp)
+    s = "".join(map(str, digits))
+    if exp > 0:
+        s, exp = s + "0" * exp, 0
+    s = s.rjust(1 - exp, "0")
+    int_part, frac_part = s[:len(s) + exp], s[len(s) + exp:]
+    int_part = int_part.lstrip("0")
+    int_part = "0" * (-len(int_part) % 4) + int_part
+    frac_part = frac_part + "0" * (-len(frac_part) % 4)
+    groups = [int(int_part[i:i + 4]) for i in range(0, len(int_part), 4)]
+    weight = len(groups) - 1
+    groups += [int(frac_part[i:i + 4]) for i in range(0, len(frac_part), 4)]
+    while groups and groups[-1] == 0:
+        groups.pop()
+    while groups and groups[0] == 0:
+        groups.pop(0)
+        weight -= 1
+    if not groups:
+        weight, sign = 0, 0
+    return struct.pack(f"!hhhh{len(groups)}h", len(groups), weight, 0x4000 if sign else 0, dscale, *groups)
+
+
+def _field(b: Optional[bytes]) -> bytes:
+    return b"\xff\xff\xff\xff" if b is None else struct.pack("!i", len(b)) + b
+
+
+def encode_binary(rows: Iterator[Tuple]) -> Iterator[bytes]:
+    yield b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+    for market, d, block, dur, area, price, src in rows:
+        yield b"".join((
+            struct.pack("!h", 7),
+            _field(market.encode()),
+            _field(struct.pack("!i", d.toordinal() - _PG_EPOCH)),
+            _field(struct.pack("!i", block)),
+            _field(None if dur is None else struct.pack("!i", dur)),
+            _field(area.encode()),
+            _field(_numeric_bin(price)),
+            _field(src.encode()),
+        ))
+    yield struct.pack("!h", -1)
+
+
+def _text(v) -> str:
+    if v is None:
+        return r"\N"
+    return str(v).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def encode_text(rows: Iterator[Tuple]) -> Iterator[bytes]:
+    for r in rows:
+        yield ("\t".join(_text(v) for v in r) + "\n").encode()
+
+
+class IterStream(io.RawIOBase):
+    """File-like view over an iterator of byte chunks, for cursor.copy_expert."""
+    def __init__(self, chunks: Iterator[bytes]):
+        self._chunks, self._buf = chunks, b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._buf:
+            try:
+                self._buf = next(self._chunks)
+            except StopIteration:
+                return 0
+        n = min(len(b), len(self._buf))
+        b[:n], self._buf = self._buf[:n], self._buf[n:]
+        return n
+
+
+# ── workers ──────────────────────────────────────────────────
+def stage_file(url: str, path: str, fmt: str) -> Tuple[str, int, int, float]:
+    """Worker: parse + COPY one file into stage_prices; returns (path, rows, rejected, seconds)."""
+    t0 = time.perf_counter()
+    rejects = [0]
+    counted = [0]
+
+    def counting(rows):
+        for r in rows:
+            counted[0] += 1
+            yield r
+
+    rows = counting(read_rows(path, rejects))
+    if fmt == "binary":
+        stream, sql = encode_binary(rows), f"COPY stage_prices ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT binary)"
+    else:
+        stream, sql = encode_text(rows), f"COPY stage_prices ({', '.join(COLUMNS)}) FROM STDIN"
+    conn = psycopg2.connect(url)
+    try:
+        with conn, conn.cursor() as cur:
+            cur.copy_expert(sql, io.BufferedReader(IterStream(stream), buffer_size=1 << 20), size=1 << 20)
+    finally:
+        conn.close()
+    return path, counted[0], rejects[0], time.perf_counter() - t0
+
+
+def expand(inputs: List[str]) -> List[str]:
+    files: List[str] = []
+    for p in inputs:
+        if os.path.isdir(p):
+            files += sorted(glob.glob(os.path.join(p, "**", "*.csv"), recursive=True))
+        else:
+            files += sorted(glob.glob(p)) or [p]
+    seen = set()
+    return [f for f in files if not (f in seen or seen.add(f))]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("inputs", nargs="+", help="CSV files, globs or directories")
+    ap.add_argument("-j", "--workers", type=int, default=min(4, os.cpu_count() or 1))
+    ap.add_argument("--format", choices=("binary", "text"), default="binary", help="COPY wire format")
+    ap.add_argument("--no-merge", action="store_true", help="stage only; skip the merge into price_points")
+    ap.add_argument("--no-rollups", action="store_true", help="skip refreshing the daily/monthly rollups")
+    ap.add_argument("--batch-days", type=int, default=31, help="delivery dates merged per transaction")
+    args = ap.parse_args()
+
+    files = expand(args.inputs)
+    if not files:
+        sys.exit("no CSV files matched")
+    url = dsn()
+
+    with psycopg2.connect(url) as conn, conn.cursor() as cur:
+        cur.execute(STAGE_DDL)
+        cur.execute("TRUNCATE stage_prices;")
+    conn.close()
+
+    t0 = time.perf_counter()
+    total = rejected = 0
+    failed: List[str] = []
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as ex:
+        futs = {ex.submit(stage_file, url, f, args.format): f for f in files}
+        for fut in as_completed(futs):
+            try:
+                path, n, bad, secs = fut.result()
+            except Exception as e:
+                failed.append(futs[fut])
+                print(f"  FAILED {futs[fut]}: {e}", file=sys.stderr)
+                continue
+            total += n; rejected += bad
+            print(f"  {os.path.basename(path)}: {n:,} rows ({bad:,} rejected) in {secs:.1f}s = {n / max(secs, 1e-9):,.0f} rows/s")
+    t_copy = time.perf_counter() - t0
+    print(f"staged {total:,} rows from {len(files) - len(failed)}/{len(files)} files in {t_copy:.1f}s "
+          f"= {total / max(t_copy, 1e-9):,.0f} rows/s ({rejected:,} rejected, {args.workers} workers, {args.format} COPY)")
+    if failed:
+        sys.exit(f"{len(failed)} file(s) failed; stage left in place, merge skipped")
+
+    if args.no_merge:
+        return
+    t1 = time.perf_counter()
+    per_market = merge(url, args.batch_days)
+    t_merge = time.perf_counter() - t1
+    tot = [sum(v[k] for v in per_market.values()) for k in ("inserted", "updated", "unchanged", "skipped")]
+    print(f"merged in {t_merge:.1f}s: {tot[0]:,} inserted, {tot[1]:,} updated, {tot[2]:,} unchanged, {tot[3]:,} skipped; "
+          f"total {t_copy + t_merge:.1f}s = {total / max(t_copy + t_merge, 1e-9):,.0f} rows/s")
+    for market, v in sorted(per_market.items()):
+        span = f"{v['first']} .. {v['last']}" if v["first"] else "none"
+        skipped = f", {v['skipped']:,} skipped" if v["skipped"] else ""
+        print(f"  {market}: changed {span} ({v['inserted']:,} ins, {v['updated']:,} upd, {v['unchanged']:,} same{skipped})")
+    if not args.no_rollups:
+        t2 = time.perf_counter()
+        n = refresh_rollups(url, per_market)
+        print(f"rollups: {n:,} day-block/slot rows refreshed in {time.perf_counter() - t2:.1f}s")
+    if log_changes(url, per_market):
+        print("changed spans logged to price_ingest_log")
+
+
+def refresh_rollups(url: str, per_market: Dict[str, Dict]) -> int:
+    """Recompute the hourly series (if migrated), then the hour and quarter TWAP/VWAP rollups, over each market's changed span."""
+    n = 0
+    conn = psycopg2.connect(url)
+    try:
+        with conn, conn.cursor() as cur:
+            cur.execute(HOURLY_EXISTS_SQL)
+            has_hourly = cur.fetchone()[0]
+            for market, v in sorted(per_market.items()):
+                if v["first"] is not None:
+                    if has_hourly:
+                        cur.execute(HOURLY_SQL, (market, v["first"], v["last"]))
+                    for gran in ("hour", "quarter"):
+                        cur.execute(ROLLUP_SQL, (market, gran, v["first"], v["last"]))
+                        n += cur.fetchone()[0]
+    finally:
+        conn.close()
+    return n
+
+
+def log_changes(url: str, per_market: Dict[str, Dict]) -> int:
+    """Record each market's changed span in price_ingest_log (if migrated) so running apps drop those cached days."""
+    n = 0
+    conn = psycopg2.connect(url)
+    try:
+        with conn, conn.cursor() as cur:
+            cur.execute(LOG_EXISTS_SQL)
+            if not cur.fetchone()[0]:
+                return 0
+            for market, v in sorted(per_market.items()):
+                if v["first"] is not None:
+                    cur.execute(LOG_SQL, (market, v["first"], v["last"]))
+                    n += 1
+    finally:
+        conn.close()
+    return n
+
+
+def merge(url: str, batch_days: int) -> Dict[str, Dict]:
+    """Run merge_stage_prices batch by batch (one commit each); totals + changed date span per market."""
+    out: Dict[str, Dict] = {}
+    conn = psycopg2.connect(url)
+    try:
+        with conn, conn.cursor() as cur:
+            cur.execute("ANALYZE stage_prices;")
+            cur.execute(PARTITIONS_SQL)       # new yearly partitions (sql/006)
+            cur.execute(BATCHES_SQL, (batch_days,))
+            batches = cur.fetchall()
+        for d0, d1 in batches:
+            with conn, conn.cursor() as cur:
+                cur.execute(MERGE_SQL, (d0, d1))
+                for market, ins, upd, same, skipped, first, last in cur.fetchall():
+                    v = out.setdefault(market, dict(inserted=0, updated=0, unchanged=0, skipped=0, first=None, last=None))
+                    v["inserted"] += ins; v["updated"] += upd; v["unchanged"] += same; v["skipped"] += skipped
+                    if first is not None:
+                        v["first"] = first if v["first"] is None else min(v["first"], first)
+                        v["last"] = last if v["last"] is None else max(v["last"], last)
+    finally:
+        conn.close()
+    return out
+
+if __name__ == "__main__":
+    main()
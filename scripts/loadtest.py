@@ -0,0 +1,354 @@
+"""
+Concurrent-session load test of the chat handlers against a local Postgres
+stand-in (scripts/loadtest_seed.sql: synthetic DAM/GDAM prices, MCX/NSE
+closes, stub rpc_* functions). Never point it at Supabase.
+
+    python scripts/loadtest.py seed --url postgresql://localhost/emps_load [--from 2022-08-01] [--to 2025-11-15]
+    python scripts/loadtest.py run  --url postgresql://localhost/emps_load [--sessions 1,10,50] [--duration 30]
+                                    [--config default --config PRICE_CACHE_MAX_ROWS=0,USE_ROLLUPS=0 ...] [--think 0]
+
+seed  creates the stubs and fills them for [from, to] (hourly rows stop 30 days
+      before ``to`` so the 15-min fallback is exercised). Run ``make schema
+      migrate`` against the same URL afterwards to load-test with the rollups
+      and the hourly series too.
+run   for every config × session count starts a fresh worker process (cold
+      caches, own pool) with the config's env overrides, which imports
+      app/app.py with stand-in Chainlit messages/sessions and drives N
+      concurrent sessions: ``_start`` once, then messages from a weighted mix
+      of realistic queries dated inside the seeded span, for ``--duration``
+      seconds. Reports msg/s, per-message latency percentiles (from the
+      handler call to the final reply), handler errors, the peak number of
+      server backends (total / active) sampled from pg_stat_activity, and
+      the pool's wait/timeout counters.
+
+``--url`` defaults to $LOADTEST_DATABASE_URL. Only local hosts (localhost,
+127.0.0.1, ::1 or a unix socket directory) are accepted unless
+``--allow-remote`` is given; the repo's .env is never read.
+"""
+import argparse, asyncio, contextvars, importlib.util, json, os, random, statistics, subprocess, sys, threading, time
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+SEED_SQL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "loadtest_seed.sql")
+ERROR_TEXT = "Temporary data connection issue"
+
+# (weight, template); {d}/{d2} are days, {m} a month, {y} a year inside the seeded span.
+QUERY_MIX: List[Tuple[int, str]] = [
+    (14, "{mkt} {d:%d %b %Y}"),
+    (8, "{d:%d/%m/%Y}"),
+    (6, "{mkt} {d:%d %b %Y} 6pm to 9pm"),
+    (6, "{mkt} {d:%d %b %Y} 18-22 hrs"),
+    (4, "{mkt} {d:%d %b %Y} slots 10-20 list"),
+    (12, "{mkt} {m:%b %Y}"),
+    (6, "{mkt} vwap {m:%b %Y}"),
+    (4, "{mkt} {m:%b %Y} daily avg"),
+    (8, "{mkt} {d:%d %b %Y} to {d2:%d %b %Y}"),
+    (4, "{mkt} vwap {d:%d %b %Y} to {d2:%d %b %Y} 6-9, 18-22 hrs"),
+    (4, "{mkt} {d:%d %b %Y} to {d2:%d %b %Y} list"),
+    (3, "{mkt} in {y}"),
+    (3, "{mkt} {m:%b} {y0}, {y} 6-9, 18-22 hrs"),
+    (5, "{mkt} {d:%d %b %Y} MCX"),
+    (6, "yesterday"),
+    (4, "{mkt} yesterday"),
+    (2, "last month"),
+    (1, "/stats"),
+]
+MARKETS = ["dam", "dam", "gdam", ""]
+
+
+# ─────────────────────────────────────────────────────────────
+# Safety
+# ─────────────────────────────────────────────────────────────
+
+def is_local(url: str) -> bool:
+    u = urlparse(url)
+    host = parse_qs(u.query).get("host", [u.hostname or ""])[0]
+    return host in ("", "localhost", "127.0.0.1", "::1") or host.startswith("/")
+
+
+def _url(args) -> str:
+    url = args.url or os.getenv("LOADTEST_DATABASE_URL", "")
+    if not url:
+        sys.exit("set --url or LOADTEST_DATABASE_URL to a local Postgres")
+    if not is_local(url) and not args.allow_remote:
+        sys.exit(f"refusing non-local database {urlparse(url).hostname!r} (use --allow-remote if you really mean it)")
+    return url
+
+
+def _connect(url: str):
+    import psycopg2
+    return psycopg2.connect(url, sslmode=os.getenv("LOADTEST_SSLMODE", "disable"))
+
+
+# ─────────────────────────────────────────────────────────────
+# seed
+# ─────────────────────────────────────────────────────────────
+
+def seed(args) -> None:
+    url = _url(args)
+    d_to = date.fromisoformat(args.to) if args.to else date.today()
+    d_hourly = date.fromisoformat(args.hourly_until) if args.hourly_until else d_to - timedelta(days=30)
+    conn = _connect(url)
+    conn.autocommit = True
+    t = time.perf_counter()
+    with conn.cursor() as cur:
+        with open(SEED_SQL, encoding="utf-8") as f:
+            cur.execute(f.read())
+        cur.execute("CALL loadtest_seed(%s, %s, %s);", (date.fromisoformat(args.from_), d_to, d_hourly))
+        cur.execute("SELECT (SELECT count(*) FROM lt_quarter), (SELECT count(*) FROM lt_hourly), "
+                    "(SELECT count(*) FROM lt_deriv);")
+        nq, nh, nd = cur.fetchone()
+    conn.close()
+    print(f"seeded {args.from_}..{d_to} (hourly until {d_hourly}): {nq:,} slot rows, {nh:,} hourly rows, "
+          f"{nd:,} derivative closes in {time.perf_counter() - t:.1f}s")
+
+
+# ─────────────────────────────────────────────────────────────
+# run (parent): one worker process per config × session count
+# ─────────────────────────────────────────────────────────────
+
+def _parse_config(spec: str) -> Dict[str, str]:
+    if spec in ("", "default"):
+        return {}
+    env = {}
+    for part in spec.split(","):
+        k, sep, v = part.partition("=")
+        if not sep:
+            sys.exit(f"bad --config {spec!r}: expected KEY=VALUE[,KEY=VALUE...]")
+        env[k.strip()] = v.strip()
+    return env
+
+
+def run(args) -> int:
+    url = _url(args)
+    sessions = [int(s) for s in args.sessions.split(",") if s.strip()]
+    configs = args.config or ["default"]
+    head = (f"{'config':<34} {'sess':>4} {'msgs':>6} {'err':>4} {'msg/s':>7} {'p50 ms':>7} {'p90 ms':>7} "
+            f"{'p99 ms':>7} {'max ms':>7} {'conns':>9} {'waits':>6} {'tmo':>4}")
+    print(head)
+    print("-" * len(head))
+    failed = 0
+    for cfg in configs:
+        overrides = _parse_config(cfg)
+        for n in sessions:
+            env = dict(os.environ, **overrides)
+            cmd = [sys.executable, os.path.abspath(__file__), "_worker", "--url", url, "--sessions", str(n),
+                   "--duration", str(args.duration), "--think", str(args.think), "--seed", str(args.seed)]
+            if args.allow_remote:
+                cmd.append("--allow-remote")
+            p = subprocess.run(cmd, env=env, capture_output=True, text=True)
+            res = next((json.loads(line[7:]) for line in p.stdout.splitlines() if line.startswith("RESULT ")), None)
+            if res is None:
+                failed += 1
+                print(f"{cfg[:34]:<34} {n:>4}  worker failed (exit {p.returncode}):")
+                print("\n".join(p.stderr.strip().splitlines()[-15:]))
+                continue
+            lat = res["latency_ms"]
+            print(f"{cfg[:34]:<34} {n:>4} {res['messages']:>6} {res['errors']:>4} {res['msg_per_sec']:>7.1f} "
+                  f"{lat['p50']:>7.0f} {lat['p90']:>7.0f} {lat['p99']:>7.0f} {lat['max']:>7.0f} "
+                  f"{res['db_conns_max']:>4}/{res['db_active_max']:<4} {res['pool']['waits']:>6} "
+                  f"{res['pool']['timeouts']:>4}")
+            if args.verbose:
+                print("   ", json.dumps({k: res[k] for k in ("pool", "caches")}))
+    return 1 if failed else 0
+
+
+# ─────────────────────────────────────────────────────────────
+# _worker: N sessions in one event loop, like one Chainlit server
+# ─────────────────────────────────────────────────────────────
+
+_SESSION: contextvars.ContextVar = contextvars.ContextVar("loadtest_session")
+
+
+class _Session:
+    """cl.user_session stand-in: one dict per session task (tasks copy the context)."""
+    def get(self, key, default=None):
+        return _SESSION.get().get(key, default)
+
+    def set(self, key, value):
+        _SESSION.get()[key] = value
+
+
+_REPLIES: contextvars.ContextVar = contextvars.ContextVar("loadtest_replies")
+
+
+class _Message:
+    """cl.Message stand-in: keeps what a session was sent, renders nothing."""
+    def __init__(self, content: str = "", author: Optional[str] = None, **kw):
+        self.content = content
+        self.author = author
+
+    async def send(self):
+        _REPLIES.get().append(self.content)
+        return self
+
+    async def update(self, **kw):
+        return True
+
+    async def remove(self):
+        return True
+
+    async def stream_token(self, token: str, is_sequence: bool = False):
+        self.content = token if is_sequence else self.content + token
+
+
+def _load_app(url: str):
+    os.environ["DATABASE_URL"] = url
+    os.environ.setdefault("DB_SSLMODE", os.getenv("LOADTEST_SSLMODE", "disable"))
+    import dotenv
+    dotenv.load_dotenv = lambda *a, **kw: False     # never pick up the repo's .env
+    import chainlit as cl
+    cl.Message, cl.user_session = _Message, _Session()
+    sys.path.insert(0, APP_DIR)
+    spec = importlib.util.spec_from_file_location("app", os.path.join(APP_DIR, "app.py"))
+    app = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(app)
+    if app.DB_URL != url or not is_local(app.DB_URL) and "--allow-remote" not in sys.argv:
+        raise SystemExit(f"app resolved DATABASE_URL to {app.DB_URL!r}, not the load-test database")
+    return app
+
+
+def _seeded_span(url: str) -> Tuple[date, date]:
+    conn = _connect(url)
+    with conn.cursor() as cur:
+        cur.execute("SELECT min(delivery_date), max(delivery_date) FROM lt_quarter;")
+        d0, d1 = cur.fetchone()
+    conn.close()
+    if d0 is None:
+        raise SystemExit("lt_quarter is empty: run `loadtest.py seed` first")
+    return d0, d1
+
+
+def make_query(rnd: random.Random, d0: date, d1: date) -> str:
+    weights = [w for w, _ in QUERY_MIX]
+    tpl = rnd.choices([t for _, t in QUERY_MIX], weights)[0]
+    span = (d1 - d0).days
+    d = d0 + timedelta(days=rnd.randrange(max(1, span - 31)))
+    d2 = min(d1, d + timedelta(days=rnd.choice([1, 2, 6, 13, 30])))
+    m = d.replace(day=1)
+    y = rnd.randrange(d0.year + 1, d1.year) if d1.year - d0.year > 1 else d0.year
+    return tpl.format(mkt=rnd.choice(MARKETS), d=d, d2=d2, m=m, y=y, y0=y - 1).strip()
+
+
+class _Sampler(threading.Thread):
+    """Peak server backends (all / active) on the test database, every 0.2 s."""
+    SQL = ("SELECT count(*), count(*) FILTER (WHERE state = 'active') FROM pg_stat_activity "
+           "WHERE datname = current_database() AND pid <> pg_backend_pid();")
+
+    def __init__(self, url: str):
+        super().__init__(daemon=True)
+        self.url = url
+        self.stop = threading.Event()
+        self.max_total = self.max_active = 0
+
+    def run(self):
+        conn = _connect(self.url)
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            while not self.stop.wait(0.2):
+                cur.execute(self.SQL)
+                total, active = cur.fetchone()
+                self.max_total, self.max_active = max(self.max_total, total), max(self.max_active, active)
+        conn.close()
+
+
+def _pct(xs: List[float], p: float) -> float:
+    if not xs:
+        return 0.0
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(round(p / 100 * (len(xs) - 1))))]
+
+
+async def _session(app, rnd: random.Random, span: Tuple[date, date], deadline: float, think: float,
+                   lat: List[float], errors: List[str]) -> None:
+    _SESSION.set({})
+    replies: List[str] = []
+    _REPLIES.set(replies)
+    await app._start()
+    while time.perf_counter() < deadline:
+        q = make_query(rnd, *span)
+        replies.clear()
+        t = time.perf_counter()
+        try:
+            await app.on_message(_Message(content=q))
+        except Exception as e:
+            errors.append(f"{q}: {e!r}")
+        else:
+            if not replies or any(ERROR_TEXT in r for r in replies):
+                errors.append(q)
+        lat.append((time.perf_counter() - t) * 1000)
+        if think:
+            await asyncio.sleep(rnd.expovariate(1 / think))
+
+
+async def _drive(app, url: str, n: int, duration: float, think: float, seed: int) -> Dict:
+    span = _seeded_span(url)
+    sampler = _Sampler(url)
+    sampler.start()
+    lat: List[float] = []
+    errors: List[str] = []
+    t0 = time.perf_counter()
+    await asyncio.gather(*(_session(app, random.Random(seed * 1000 + i), span, t0 + duration, think, lat, errors)
+                           for i in range(n)))
+    elapsed = time.perf_counter() - t0
+    await app.ANALYTICS.flush()
+    sampler.stop.set()
+    sampler.join()
+    for e in errors[:5]:
+        print("error:", e, file=sys.stderr)
+    return dict(
+        sessions=n, seconds=round(elapsed, 2), messages=len(lat), errors=len(errors),
+        msg_per_sec=len(lat) / elapsed if elapsed else 0.0,
+        latency_ms=dict(p50=_pct(lat, 50), p90=_pct(lat, 90), p99=_pct(lat, 99), max=max(lat, default=0.0),
+                        mean=statistics.fmean(lat) if lat else 0.0),
+        db_conns_max=sampler.max_total, db_active_max=sampler.max_active,
+        pool=app.POOL.stats(),
+        caches=dict(price=app.PRICE_CACHE.stats(), derivs=app.DERIVS.stats(), parser=app.PARSER.stats()),
+    )
+
+
+def worker(args) -> None:
+    url = _url(args)
+    app = _load_app(url)
+    res = asyncio.run(_drive(app, url, args.sessions, args.duration, args.think, args.seed))
+    print("RESULT " + json.dumps(res, default=str))
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    def common(p):
+        p.add_argument("--url", default="")
+        p.add_argument("--allow-remote", action="store_true")
+
+    p = sub.add_parser("seed")
+    common(p)
+    p.add_argument("--from", dest="from_", default="2022-08-01")
+    p.add_argument("--to", default="", help="last day (default today)")
+    p.add_argument("--hourly-until", default="", help="last day with hourly rows (default to − 30 days)")
+    p.set_defaults(fn=seed)
+
+    for name, fn in (("run", run), ("_worker", worker)):
+        p = sub.add_parser(name)
+        common(p)
+        p.add_argument("--duration", type=float, default=30.0, help="seconds per configuration")
+        p.add_argument("--think", type=float, default=0.0, help="mean pause between a session's messages (s)")
+        p.add_argument("--seed", type=int, default=7)
+        if name == "run":
+            p.add_argument("--sessions", default="1,10,50")
+            p.add_argument("--config", action="append",
+                           help="env overrides KEY=VALUE[,KEY=VALUE...]; repeat to compare (default: 'default')")
+            p.add_argument("-v", "--verbose", action="store_true", help="also print pool and cache stats")
+        else:
+            p.add_argument("--sessions", type=int, default=1)
+        p.set_defaults(fn=fn)
+
+    args = ap.parse_args()
+    return args.fn(args) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+-- Local stand-in for the Supabase database, for scripts/loadtest.py only.
+-- NEVER apply this to a real database: it replaces the public.rpc_* functions.
+--
+-- Synthetic DAM/GDAM prices (lt_quarter: 15-min slots; lt_hourly: the hourly
+-- average of those slots, ending before the 15-min data so the app's
+-- "Fallback via 15-min slots" path is exercised), MCX/NSE derivative closes
+-- (lt_deriv) and the analytics tables, plus stub rpc_* functions with the
+-- column names the app reads. Load with:
+--   CALL loadtest_seed(p_from, p_to, p_hourly_to);
+-- which rebuilds the lt_* tables and is safe to re-run.
+-- Apply `make schema migrate` afterwards to exercise the rollups (007) and
+-- the hourly series (008); their backfills read these stubs.
+
+CREATE TABLE IF NOT EXISTS analytics_usage_sessions (
+  id TEXT PRIMARY KEY,
+  user_agent TEXT,
+  referer TEXT,
+  ip TEXT,
+  started_at TIMESTAMPTZ DEFAULT now(),
+  last_seen TIMESTAMPTZ DEFAULT now(),
+  ended_at TIMESTAMPTZ
+);
+CREATE TABLE IF NOT EXISTS analytics_usage_events (
+  id BIGSERIAL PRIMARY KEY,
+  session_id TEXT,
+  type TEXT,
+  payload JSONB,
+  ts TIMESTAMPTZ DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS lt_quarter (
+  market TEXT NOT NULL, delivery_date DATE NOT NULL, slot_index INT NOT NULL,
+  price NUMERIC(10,2) NOT NULL, mw NUMERIC(12,2), duration_min INT NOT NULL DEFAULT 15,
+  PRIMARY KEY (market, delivery_date, slot_index)
+);
+CREATE TABLE IF NOT EXISTS lt_hourly (
+  market TEXT NOT NULL, delivery_date DATE NOT NULL, block_index INT NOT NULL,
+  price NUMERIC(10,2) NOT NULL, mw NUMERIC(12,2), duration_min INT NOT NULL DEFAULT 60,
+  PRIMARY KEY (market, delivery_date, block_index)
+);
+CREATE TABLE IF NOT EXISTS lt_deriv (
+  exchange TEXT NOT NULL, commodity TEXT NOT NULL, contract_month DATE NOT NULL,
+  trading_date DATE NOT NULL, close NUMERIC(10,2) NOT NULL,
+  PRIMARY KEY (exchange, contract_month, trading_date)
+);
+
+CREATE OR REPLACE FUNCTION rpc_get_hourly_prices_range(p_market TEXT, p_start DATE, p_end DATE, p_b1 INT, p_b2 INT)
+RETURNS TABLE (delivery_date DATE, block_index INT, price_avg_rs_per_mwh NUMERIC, scheduled_mw_sum NUMERIC, duration_min INT)
+LANGUAGE sql STABLE AS $$
+  SELECT h.delivery_date, h.block_index, h.price, h.mw, h.duration_min
+  FROM lt_hourly h
+  WHERE h.market = p_market AND h.delivery_date BETWEEN p_start AND p_end
+    AND (p_b1 IS NULL OR h.block_index BETWEEN p_b1 AND p_b2)
+  ORDER BY 1, 2;
+$$;
+
+CREATE OR REPLACE FUNCTION rpc_get_quarter_prices_range(p_market TEXT, p_start DATE, p_end DATE, p_s1 INT, p_s2 INT)
+RETURNS TABLE (delivery_date DATE, slot_index INT, price_rs_per_mwh NUMERIC, scheduled_mw NUMERIC, duration_min INT)
+LANGUAGE sql STABLE AS $$
+  SELECT q.delivery_date, q.slot_index, q.price, q.mw, q.duration_min
+  FROM lt_quarter q
+  WHERE q.market = p_market AND q.delivery_date BETWEEN p_start AND p_end
+    AND (p_s1 IS NULL OR q.slot_index BETWEEN p_s1 AND p_s2)
+  ORDER BY 1, 2;
+$$;
+
+-- Last close on or before p_day per exchange (front month of that trading day).
+CREATE OR REPLACE FUNCTION rpc_deriv_daily_with_fallback(p_exchange TEXT, p_day DATE)
+RETURNS TABLE (exchange TEXT, commodity TEXT, contract_month DATE, trading_date DATE,
+               used_trading_date DATE, close_price_rs_per_mwh NUMERIC)
+LANGUAGE sql STABLE AS $$
+  SELECT DISTINCT ON (d.exchange) d.exchange, d.commodity, d.contract_month, d.trading_date, d.trading_date, d.close
+  FROM lt_deriv d
+  WHERE (p_exchange IS NULL OR d.exchange = p_exchange) AND d.trading_date <= p_day
+  ORDER BY d.exchange, d.trading_date DESC, d.contract_month;
+$$;
+
+-- Last trading day (and close) of contract month p_cm per exchange.
+CREATE OR REPLACE FUNCTION rpc_deriv_expiry_for_month(p_exchange TEXT, p_cm DATE)
+RETURNS TABLE (exchange TEXT, commodity TEXT, contract_month DATE, expiry_date DATE, expiry_close NUMERIC)
+LANGUAGE sql STABLE AS $$
+  SELECT DISTINCT ON (d.exchange) d.exchange, d.commodity, d.contract_month, d.trading_date, d.close
+  FROM lt_deriv d
+  WHERE (p_exchange IS NULL OR d.exchange = p_exchange) AND d.contract_month = p_cm
+  ORDER BY d.exchange, d.trading_date DESC;
+$$;
+
+-- Prices follow a day shape (night base, solar dip 09–16h, evening peak
+-- 18–22h, capped at the ₹10,000/MWh ceiling) with seasonal drift and noise.
+CREATE OR REPLACE PROCEDURE loadtest_seed(p_from DATE, p_to DATE, p_hourly_to DATE)
+LANGUAGE plpgsql AS $$
+BEGIN
+  PERFORM setseed(0.42);
+  TRUNCATE lt_quarter, lt_hourly, lt_deriv;
+
+  INSERT INTO lt_quarter (market, delivery_date, slot_index, price, mw, duration_min)
+  SELECT m.market, d::DATE, s,
+         round(LEAST(10000, GREATEST(100,
+           m.base
+           * (1 + 0.15 * sin(2 * pi() * extract(doy FROM d) / 365.0))
+           * CASE WHEN s BETWEEN 37 AND 64 THEN 0.65
+                  WHEN s BETWEEN 73 AND 88 THEN 1.6
+                  ELSE 1.0 END
+           * (0.85 + 0.3 * random())))::NUMERIC, 2),
+         round((m.mw * (0.6 + 0.8 * random()))::NUMERIC, 2),
+         15
+  FROM (VALUES ('DAM', 4200.0, 5000.0), ('GDAM', 4500.0, 700.0)) AS m(market, base, mw)
+  CROSS JOIN generate_series(p_from, p_to, INTERVAL '1 day') AS d
+  CROSS JOIN generate_series(1, 96) AS s;
+
+  INSERT INTO lt_hourly (market, delivery_date, block_index, price, mw, duration_min)
+  SELECT market, delivery_date, (slot_index - 1) / 4 + 1, round(avg(price), 2), round(avg(mw), 2), 60
+  FROM lt_quarter
+  WHERE delivery_date <= p_hourly_to
+  GROUP BY 1, 2, 3;
+
+  INSERT INTO lt_deriv (exchange, commodity, contract_month, trading_date, close)
+  SELECT e, 'ELEC', date_trunc('month', d)::DATE, d::DATE, round((4000 + 3000 * random())::NUMERIC, 2)
+  FROM unnest(ARRAY['MCX', 'NSE']) AS e
+  CROSS JOIN generate_series(p_from, p_to, INTERVAL '1 day') AS d
+  WHERE extract(isodow FROM d) <= 5;
+
+  ANALYZE lt_quarter;
+  ANALYZE lt_hourly;
+  ANALYZE lt_deriv;
+END $$;
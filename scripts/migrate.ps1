@@ -0,0 +1,15 @@
+param()
+. "$PSScriptRoot\_load-env.ps1"
+$migrations = @(
+  "sql\004_analytics_rollup.sql",
+  "sql\005_merge_stage_prices.sql",
+  "sql\006_partition_price_points.sql",
+  "sql\007_price_rollups.sql",
+  "sql\008_price_hourly.sql",
+  "sql\009_price_ingest_log.sql"
+)
+foreach ($f in $migrations) {
+  Write-Host "-> $f"
+  psql "$env:DATABASE_URL" -v ON_ERROR_STOP=1 -f $f
+  if ($LASTEXITCODE -ne 0) { throw "migration failed: $f" }
+}
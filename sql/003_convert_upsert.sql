@@ -11,44 +11,39 @@ SELECT
   source_file
 FROM stage_prices_text
 WHERE delivery_date ~ '^\d{4}-\d{2}-\d{2}$';
-WITH s AS (
-  SELECT
-    market, area, delivery_date, block_index,
-    MAX(duration_min)     AS duration_min,
-    MAX(price_rs_per_mwh) AS price_rs_per_mwh,
-    MAX(source_file)      AS source_file
-  FROM stage_prices
-  WHERE delivery_date >= DATE '2010-01-01'
-  GROUP BY market, area, delivery_date, block_index
-),
-lk AS (
-  SELECT
-    m.id  AS market_id,
-    a.id  AS area_id,
-    tb.id AS block_id,
-    s.delivery_date,
-    COALESCE(s.duration_min, tb.duration_min) AS duration_min,
-    s.price_rs_per_mwh,
-    s.source_file
-  FROM s
-  JOIN markets m      ON m.code = s.market
-  JOIN areas   a      ON a.code = s.area
-  JOIN time_blocks tb ON tb.block_index = s.block_index
-),
-upsert AS (
-  INSERT INTO price_points (
-    market_id, area_id, delivery_date, block_id, duration_min, price_rs_per_mwh, source_file
-  )
-  SELECT market_id, area_id, delivery_date, block_id, duration_min, price_rs_per_mwh, source_file
-  FROM lk
-  ON CONFLICT (market_id, area_id, delivery_date, block_id)
-  DO UPDATE SET
-    price_rs_per_mwh = EXCLUDED.price_rs_per_mwh,
-    duration_min      = EXCLUDED.duration_min,
-    source_file       = EXCLUDED.source_file
-  RETURNING xmax = 0 AS inserted
-)
+-- Yearly partitions for the staged dates (006_partition_price_points.sql).
+SELECT ensure_price_points_partitions(MIN(delivery_date), MAX(delivery_date)) AS partitions_created
+FROM stage_prices WHERE delivery_date >= DATE '2010-01-01';
+-- Change-aware merge in batches of delivery dates (functions from 005_merge_stage_prices.sql).
+-- The per-market result is kept so the refreshes below only touch what changed.
+DROP TABLE IF EXISTS pg_temp.stage_price_changes;
+CREATE TEMP TABLE stage_price_changes AS
 SELECT
-  COUNT(*) AS affected_rows,
-  COUNT(*) FILTER (WHERE inserted) AS inserted_rows,
-  COUNT(*) FILTER (WHERE NOT inserted) AS updated_rows;
+  b.market,
+  SUM(b.inserted)       AS inserted_rows,
+  SUM(b.updated)        AS updated_rows,
+  SUM(b.unchanged)      AS unchanged_rows,
+  SUM(b.skipped)        AS skipped_rows,
+  MIN(b.first_changed)  AS first_changed,
+  MAX(b.last_changed)   AS last_changed
+FROM stage_price_batches() d
+CROSS JOIN LATERAL merge_stage_prices(d.batch_from, d.batch_to) b
+GROUP BY b.market;
+SELECT * FROM stage_price_changes ORDER BY market;
+-- Refresh the hourly series (008_price_hourly.sql), then the hour TWAP/VWAP
+-- rollups (007_price_rollups.sql) that read it and the quarter rollups, over
+-- each market's changed span. Markets with no inserted/updated rows are skipped.
+SELECT c.market, refresh_price_hourly(c.market, c.first_changed, c.last_changed) AS hourly_rows
+FROM stage_price_changes c
+WHERE c.first_changed IS NOT NULL
+ORDER BY c.market;
+SELECT c.market, g.gran, refresh_price_rollups(c.market, g.gran, c.first_changed, c.last_changed) AS rollup_rows
+FROM stage_price_changes c
+CROSS JOIN (VALUES ('hour'), ('quarter')) AS g(gran)
+WHERE c.first_changed IS NOT NULL
+ORDER BY c.market, g.gran;
+-- Tell running apps which days changed (009_price_ingest_log.sql).
+INSERT INTO price_ingest_log (market, first_changed, last_changed)
+SELECT c.market, c.first_changed, c.last_changed
+FROM stage_price_changes c
+WHERE c.first_changed IS NOT NULL;
@@ -0,0 +1,27 @@
+-- Per-day usage counters for /stats, maintained by the app's analytics flush
+-- (app/analytics.py) in the same transaction as the raw inserts.
+-- Idempotent: safe to re-run; the backfill recomputes every day from scratch.
+-- Restart the app after applying so it starts maintaining the rollup.
+CREATE TABLE IF NOT EXISTS analytics_usage_daily (
+  day      DATE PRIMARY KEY,
+  sessions BIGINT NOT NULL DEFAULT 0,
+  messages BIGINT NOT NULL DEFAULT 0
+);
+
+-- "Active now" scans only recently seen sessions.
+CREATE INDEX IF NOT EXISTS analytics_usage_sessions_last_seen_idx
+  ON analytics_usage_sessions (last_seen);
+
+INSERT INTO analytics_usage_daily (day, sessions, messages)
+SELECT day, SUM(sessions), SUM(messages)
+FROM (
+  SELECT started_at::date AS day, COUNT(*) AS sessions, 0 AS messages
+  FROM analytics_usage_sessions GROUP BY 1
+  UNION ALL
+  SELECT ts::date, 0, COUNT(*)
+  FROM analytics_usage_events WHERE type = 'message' GROUP BY 1
+) x
+WHERE day IS NOT NULL
+GROUP BY day
+ON CONFLICT (day) DO UPDATE
+  SET sessions = EXCLUDED.sessions, messages = EXCLUDED.messages;
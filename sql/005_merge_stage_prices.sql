@@ -0,0 +1,117 @@
+-- Change-aware merge of stage_prices into price_points, one batch of
+-- delivery dates at a time. Used by 003_convert_upsert.sql and scripts/ingest.py.
+-- Rows whose price, duration and source are unchanged are left alone (no new
+-- tuple version, no bloat), and the changed date range is reported per market
+-- so caches can refresh exactly those days. Inserts are told apart from
+-- updates by a pre-check rather than xmax, which partitioned tables (006)
+-- cannot return.
+-- Idempotent: safe to re-run.
+CREATE TABLE IF NOT EXISTS stage_prices (
+  market TEXT,
+  delivery_date DATE,
+  block_index INT,
+  duration_min INT,
+  area TEXT,
+  price_rs_per_mwh NUMERIC(10,5),
+  source_file TEXT
+);
+CREATE INDEX IF NOT EXISTS stage_prices_date_idx ON stage_prices (delivery_date);
+
+-- Distinct staged dates cut into batches of p_days dates each.
+CREATE OR REPLACE FUNCTION stage_price_batches(p_days INT DEFAULT 31)
+RETURNS TABLE (batch_from DATE, batch_to DATE)
+LANGUAGE sql STABLE AS $$
+  SELECT MIN(d), MAX(d)
+  FROM (
+    SELECT d, (ROW_NUMBER() OVER (ORDER BY d) - 1) / GREATEST(p_days, 1) AS g
+    FROM (SELECT DISTINCT delivery_date AS d FROM stage_prices
+          WHERE delivery_date >= DATE '2010-01-01') x
+  ) y
+  GROUP BY g
+  ORDER BY 1;
+$$;
+
+-- Merge staged rows with p_from <= delivery_date <= p_to.
+--   inserted / updated : rows written
+--   unchanged          : matched an identical row, nothing written
+--   skipped            : unknown market, area or block index
+--   first/last_changed : delivery dates spanned by inserted + updated rows
+CREATE OR REPLACE FUNCTION merge_stage_prices(p_from DATE, p_to DATE)
+RETURNS TABLE (market TEXT, inserted BIGINT, updated BIGINT, unchanged BIGINT, skipped BIGINT,
+               first_changed DATE, last_changed DATE)
+LANGUAGE sql VOLATILE AS $$
+WITH s AS (
+  SELECT
+    sp.market, sp.area, sp.delivery_date, sp.block_index,
+    MAX(sp.duration_min)     AS duration_min,
+    MAX(sp.price_rs_per_mwh) AS price_rs_per_mwh,
+    MAX(sp.source_file)      AS source_file
+  FROM stage_prices sp
+  WHERE sp.delivery_date BETWEEN p_from AND p_to
+    AND sp.delivery_date >= DATE '2010-01-01'
+  GROUP BY sp.market, sp.area, sp.delivery_date, sp.block_index
+),
+lk AS (
+  SELECT
+    s.market,
+    m.id  AS market_id,
+    a.id  AS area_id,
+    tb.id AS block_id,
+    s.delivery_date,
+    COALESCE(s.duration_min, tb.duration_min) AS duration_min,
+    s.price_rs_per_mwh,
+    s.source_file,
+    EXISTS (SELECT 1 FROM price_points e
+            WHERE e.market_id = m.id AND e.area_id = a.id
+              AND e.delivery_date = s.delivery_date AND e.block_id = tb.id) AS existed
+  FROM s
+  LEFT JOIN markets m      ON m.code = s.market
+  LEFT JOIN areas   a      ON a.code = s.area
+  LEFT JOIN time_blocks tb ON tb.block_index = s.block_index
+),
+upsert AS (
+  INSERT INTO price_points AS pp (
+    market_id, area_id, delivery_date, block_id, duration_min, price_rs_per_mwh, source_file
+  )
+  SELECT market_id, area_id, delivery_date, block_id, duration_min, price_rs_per_mwh, source_file
+  FROM lk
+  WHERE market_id IS NOT NULL AND area_id IS NOT NULL AND block_id IS NOT NULL
+  ON CONFLICT (market_id, area_id, delivery_date, block_id)
+  DO UPDATE SET
+    price_rs_per_mwh = EXCLUDED.price_rs_per_mwh,
+    duration_min      = EXCLUDED.duration_min,
+    source_file       = EXCLUDED.source_file
+  WHERE (pp.price_rs_per_mwh, pp.duration_min, pp.source_file)
+        IS DISTINCT FROM (EXCLUDED.price_rs_per_mwh, EXCLUDED.duration_min, EXCLUDED.source_file)
+  RETURNING pp.market_id, pp.area_id, pp.delivery_date, pp.block_id
+),
+changed AS (
+  SELECT lk.market,
+         COUNT(*) FILTER (WHERE NOT lk.existed) AS inserted,
+         COUNT(*) FILTER (WHERE lk.existed)     AS updated,
+         MIN(u.delivery_date) AS first_changed,
+         MAX(u.delivery_date) AS last_changed
+  FROM upsert u
+  JOIN lk ON lk.market_id = u.market_id AND lk.area_id = u.area_id
+         AND lk.delivery_date = u.delivery_date AND lk.block_id = u.block_id
+  GROUP BY lk.market
+),
+staged AS (
+  SELECT lk.market,
+         COUNT(*) FILTER (WHERE lk.market_id IS NOT NULL AND lk.area_id IS NOT NULL AND lk.block_id IS NOT NULL) AS matched,
+         COUNT(*) FILTER (WHERE lk.market_id IS NULL OR lk.area_id IS NULL OR lk.block_id IS NULL) AS skipped
+  FROM lk
+  GROUP BY lk.market
+)
+SELECT
+  st.market,
+  COALESCE(c.inserted, 0),
+  COALESCE(c.updated, 0),
+  st.matched - COALESCE(c.inserted, 0) - COALESCE(c.updated, 0),
+  st.skipped,
+  c.first_changed,
+  c.last_changed
+FROM staged st
+LEFT JOIN changed c ON c.market = st.market
+ORDER BY st.market;
+$$;
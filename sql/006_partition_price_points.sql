@@ -0,0 +1,167 @@
+-- Range-partition price_points by delivery_date (one partition per year) with
+-- query-shaped indexes, migrating the existing heap without downtime:
+--
+--   1. build the partitioned twin price_points_p and mirror every write on
+--      price_points into it with a trigger;
+--   2. backfill month by month, committing each step (readers and the
+--      loader keep working);
+--   3. reconcile under a write lock (reads continue), then swap names in one
+--      short ACCESS EXCLUSIVE transaction.
+--
+-- The old heap is kept as price_points_old for rollback; drop it once checked.
+-- Views bound to the old table follow it on rename and must be recreated.
+-- Yearly partitions: even 15-min data for both markets is ~70k rows/year.
+-- Partitions are created on demand by ensure_price_points_partitions(), which
+-- 003_convert_upsert.sql and scripts/ingest.py call before merging, and which
+-- also puts a BRIN index on every partition whose year has closed.
+-- Idempotent: safe to re-run (does nothing once price_points is partitioned).
+-- Run with psql outside an explicit transaction (the backfill commits).
+
+CREATE OR REPLACE FUNCTION ensure_price_points_partitions(p_from DATE, p_to DATE)
+RETURNS INT
+LANGUAGE plpgsql AS $$
+DECLARE
+  parent TEXT;
+  part   TEXT;
+  yr     INT;
+  made   INT := 0;
+  r      RECORD;
+BEGIN
+  FOREACH parent IN ARRAY ARRAY['price_points', 'price_points_p'] LOOP
+    CONTINUE WHEN NOT EXISTS (
+      SELECT 1 FROM pg_class WHERE oid = to_regclass('public.' || parent) AND relkind = 'p');
+    IF p_from IS NOT NULL AND p_to IS NOT NULL THEN
+      FOR yr IN EXTRACT(YEAR FROM p_from)::INT .. EXTRACT(YEAR FROM p_to)::INT LOOP
+        part := format('%s_y%s', parent, yr);
+        CONTINUE WHEN to_regclass('public.' || part) IS NOT NULL;
+        EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                       part, parent, make_date(yr, 1, 1), make_date(yr + 1, 1, 1));
+        made := made + 1;
+      END LOOP;
+    END IF;
+    -- Closed years only grow by corrections: a BRIN on delivery_date is tiny.
+    CONTINUE WHEN parent <> 'price_points';
+    FOR r IN
+      SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+      WHERE i.inhparent = to_regclass('public.' || parent)
+        AND substring(c.relname FROM '_y(\d{4})$')::INT < EXTRACT(YEAR FROM current_date)
+    LOOP
+      EXECUTE format('CREATE INDEX IF NOT EXISTS %I ON %I USING brin (delivery_date)',
+                     r.relname || '_date_brin', r.relname);
+    END LOOP;
+  END LOOP;
+  RETURN made;
+END $$;
+
+-- 1. Partitioned twin + write mirror.
+DO $$
+DECLARE d0 DATE; d1 DATE;
+BEGIN
+  IF EXISTS (SELECT 1 FROM pg_class WHERE oid = to_regclass('public.price_points') AND relkind = 'p') THEN
+    RETURN;
+  END IF;
+  CREATE TABLE IF NOT EXISTS price_points_p (
+    id BIGINT NOT NULL DEFAULT nextval('price_points_id_seq'),
+    market_id INT NOT NULL REFERENCES markets(id),
+    area_id   INT NOT NULL REFERENCES areas(id),
+    delivery_date DATE NOT NULL,
+    block_id  INT NOT NULL REFERENCES time_blocks(id),
+    duration_min INT NOT NULL DEFAULT 60,
+    price_rs_per_mwh NUMERIC(10,2) NOT NULL,
+    source_file TEXT,
+    ingested_at TIMESTAMPTZ DEFAULT now(),
+    CONSTRAINT price_points_natural_key UNIQUE (market_id, area_id, delivery_date, block_id),
+    CONSTRAINT price_points_delivery_date_check CHECK (delivery_date >= DATE '2010-01-01')
+  ) PARTITION BY RANGE (delivery_date);
+  CREATE INDEX IF NOT EXISTS price_points_market_date_block_idx
+    ON price_points_p (market_id, delivery_date, block_id);
+
+  SELECT MIN(delivery_date), MAX(delivery_date) INTO d0, d1 FROM price_points;
+  PERFORM ensure_price_points_partitions(COALESCE(d0, current_date),
+                                         GREATEST(COALESCE(d1, current_date), current_date) + 366);
+
+  CREATE OR REPLACE FUNCTION price_points_mirror() RETURNS trigger
+  LANGUAGE plpgsql AS $f$
+  BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+      DELETE FROM price_points_p
+      WHERE market_id = OLD.market_id AND area_id = OLD.area_id
+        AND delivery_date = OLD.delivery_date AND block_id = OLD.block_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+      INSERT INTO price_points_p (id, market_id, area_id, delivery_date, block_id,
+                                  duration_min, price_rs_per_mwh, source_file, ingested_at)
+      VALUES (NEW.id, NEW.market_id, NEW.area_id, NEW.delivery_date, NEW.block_id,
+              NEW.duration_min, NEW.price_rs_per_mwh, NEW.source_file, NEW.ingested_at)
+      ON CONFLICT (market_id, area_id, delivery_date, block_id) DO UPDATE SET
+        id = EXCLUDED.id, duration_min = EXCLUDED.duration_min,
+        price_rs_per_mwh = EXCLUDED.price_rs_per_mwh, source_file = EXCLUDED.source_file,
+        ingested_at = EXCLUDED.ingested_at;
+    END IF;
+    RETURN NULL;
+  END $f$;
+
+  DROP TRIGGER IF EXISTS price_points_mirror ON price_points;
+  CREATE TRIGGER price_points_mirror AFTER INSERT OR UPDATE OR DELETE ON price_points
+    FOR EACH ROW EXECUTE FUNCTION price_points_mirror();
+END $$;
+
+-- 2. Backfill one month per transaction; rows already mirrored are newer and win.
+CREATE OR REPLACE PROCEDURE price_points_backfill()
+LANGUAGE plpgsql AS $$
+DECLARE d DATE; d_end DATE;
+BEGIN
+  IF to_regclass('public.price_points_p') IS NULL THEN
+    RETURN;
+  END IF;
+  SELECT date_trunc('month', MIN(delivery_date))::DATE, MAX(delivery_date) INTO d, d_end FROM price_points;
+  WHILE d <= d_end LOOP
+    INSERT INTO price_points_p (id, market_id, area_id, delivery_date, block_id,
+                                duration_min, price_rs_per_mwh, source_file, ingested_at)
+    SELECT id, market_id, area_id, delivery_date, block_id,
+           duration_min, price_rs_per_mwh, source_file, ingested_at
+    FROM price_points
+    WHERE delivery_date >= d AND delivery_date < (d + INTERVAL '1 month')::DATE
+    ON CONFLICT (market_id, area_id, delivery_date, block_id) DO NOTHING;
+    COMMIT;
+    d := (d + INTERVAL '1 month')::DATE;
+  END LOOP;
+END $$;
+
+CALL price_points_backfill();
+
+-- 3. Reconcile and swap.
+DO $$
+DECLARE r RECORD;
+BEGIN
+  IF to_regclass('public.price_points_p') IS NULL THEN
+    RETURN;
+  END IF;
+  LOCK TABLE price_points IN EXCLUSIVE MODE;      -- blocks writers only
+  INSERT INTO price_points_p (id, market_id, area_id, delivery_date, block_id,
+                              duration_min, price_rs_per_mwh, source_file, ingested_at)
+  SELECT id, market_id, area_id, delivery_date, block_id,
+         duration_min, price_rs_per_mwh, source_file, ingested_at
+  FROM price_points
+  ON CONFLICT (market_id, area_id, delivery_date, block_id) DO NOTHING;
+  DELETE FROM price_points_p n
+  WHERE NOT EXISTS (SELECT 1 FROM price_points o
+                    WHERE o.market_id = n.market_id AND o.area_id = n.area_id
+                      AND o.delivery_date = n.delivery_date AND o.block_id = n.block_id);
+
+  LOCK TABLE price_points IN ACCESS EXCLUSIVE MODE;
+  DROP TRIGGER price_points_mirror ON price_points;
+  ALTER TABLE price_points RENAME TO price_points_old;
+  ALTER TABLE price_points_p RENAME TO price_points;
+  FOR r IN
+    SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'public.price_points'::regclass AND c.relname LIKE 'price\_points\_p\_y%'
+  LOOP
+    EXECUTE format('ALTER TABLE %I RENAME TO %I', r.relname, replace(r.relname, 'price_points_p_', 'price_points_'));
+  END LOOP;
+  ALTER SEQUENCE price_points_id_seq OWNED BY price_points.id;
+  PERFORM ensure_price_points_partitions(NULL, NULL);
+END $$;
+
+DROP PROCEDURE IF EXISTS price_points_backfill();
+DROP FUNCTION IF EXISTS price_points_mirror();
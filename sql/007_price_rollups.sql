@@ -0,0 +1,123 @@
+-- Pre-aggregated DAM/GDAM rollups for TWAP/VWAP over long ranges.
+--
+-- price_rollup_daily   : one row per (market, gran, day, block)
+-- price_rollup_monthly : one row per (market, gran, month, block)
+--
+-- Both hold the additive sums the app's PriceAgg needs (Σ price×min, Σ min,
+-- Σ price×MW×min, Σ MW×min, row count, min/max price), so any set of hour
+-- windows over any date range is answered by summing full months from the
+-- monthly table and the edge days from the daily one, without touching raw rows.
+-- gran is 'hour' (block 1–24) or 'quarter' (slot 1–96).
+--
+-- Rows are built from the same rpc_get_*_prices_range functions the app
+-- reads, so the rollups match what users see whatever table backs them.
+-- refresh_price_rollups() is called by the ingest path (003, scripts/ingest.py)
+-- for the changed days; re-run it for any range loaded by other means.
+-- Idempotent: safe to re-run; the backfill only fills months not yet rolled up.
+-- Run with psql outside an explicit transaction (the backfill commits).
+
+CREATE TABLE IF NOT EXISTS price_rollup_daily (
+  market        TEXT   NOT NULL,
+  gran          TEXT   NOT NULL CHECK (gran IN ('hour', 'quarter')),
+  delivery_date DATE   NOT NULL,
+  block_index   INT    NOT NULL,
+  n_rows        INT    NOT NULL,
+  minutes       FLOAT8 NOT NULL,
+  price_min     FLOAT8 NOT NULL,          -- Σ price × minutes
+  mw_min        FLOAT8 NOT NULL,          -- Σ scheduled MW × minutes
+  price_mw_min  FLOAT8 NOT NULL,          -- Σ price × scheduled MW × minutes
+  min_price     FLOAT8,
+  max_price     FLOAT8,
+  PRIMARY KEY (market, gran, delivery_date, block_index)
+);
+
+CREATE TABLE IF NOT EXISTS price_rollup_monthly (
+  month         DATE   NOT NULL,          -- first day of the month
+  market        TEXT   NOT NULL,
+  gran          TEXT   NOT NULL CHECK (gran IN ('hour', 'quarter')),
+  block_index   INT    NOT NULL,
+  n_rows        INT    NOT NULL,
+  n_days        INT    NOT NULL,          -- days with this block present
+  minutes       FLOAT8 NOT NULL,
+  price_min     FLOAT8 NOT NULL,
+  mw_min        FLOAT8 NOT NULL,
+  price_mw_min  FLOAT8 NOT NULL,
+  min_price     FLOAT8,
+  max_price     FLOAT8,
+  PRIMARY KEY (market, gran, month, block_index)
+);
+
+-- Recompute [p_from, p_to] for one market/granularity, then every month it touches.
+CREATE OR REPLACE FUNCTION refresh_price_rollups(p_market TEXT, p_gran TEXT, p_from DATE, p_to DATE)
+RETURNS INT
+LANGUAGE plpgsql AS $$
+DECLARE
+  m0 DATE := date_trunc('month', p_from)::DATE;
+  m1 DATE := (date_trunc('month', p_to) + INTERVAL '1 month')::DATE;
+  n  INT;
+BEGIN
+  IF p_from IS NULL OR p_to IS NULL THEN
+    RETURN 0;
+  END IF;
+  DELETE FROM price_rollup_daily
+  WHERE market = p_market AND gran = p_gran AND delivery_date BETWEEN p_from AND p_to;
+
+  IF p_gran = 'hour' THEN
+    INSERT INTO price_rollup_daily
+    SELECT p_market, 'hour', r.delivery_date, r.block_index, COUNT(*),
+           SUM(r.duration_min),
+           SUM(r.price_avg_rs_per_mwh::FLOAT8 * r.duration_min),
+           SUM(COALESCE(r.scheduled_mw_sum, 0)::FLOAT8 * r.duration_min),
+           SUM(r.price_avg_rs_per_mwh::FLOAT8 * COALESCE(r.scheduled_mw_sum, 0) * r.duration_min),
+           MIN(r.price_avg_rs_per_mwh), MAX(r.price_avg_rs_per_mwh)
+    FROM public.rpc_get_hourly_prices_range(p_market, p_from, p_to, NULL, NULL) r
+    GROUP BY r.delivery_date, r.block_index;
+  ELSE
+    INSERT INTO price_rollup_daily
+    SELECT p_market, 'quarter', r.delivery_date, r.slot_index, COUNT(*),
+           SUM(r.duration_min),
+           SUM(r.price_rs_per_mwh::FLOAT8 * r.duration_min),
+           SUM(COALESCE(r.scheduled_mw, 0)::FLOAT8 * r.duration_min),
+           SUM(r.price_rs_per_mwh::FLOAT8 * COALESCE(r.scheduled_mw, 0) * r.duration_min),
+           MIN(r.price_rs_per_mwh), MAX(r.price_rs_per_mwh)
+    FROM public.rpc_get_quarter_prices_range(p_market, p_from, p_to, NULL, NULL) r
+    GROUP BY r.delivery_date, r.slot_index;
+  END IF;
+  GET DIAGNOSTICS n = ROW_COUNT;
+
+  DELETE FROM price_rollup_monthly
+  WHERE market = p_market AND gran = p_gran AND month >= m0 AND month < m1;
+  INSERT INTO price_rollup_monthly
+  SELECT date_trunc('month', delivery_date)::DATE, market, gran, block_index,
+         SUM(n_rows), COUNT(*), SUM(minutes), SUM(price_min), SUM(mw_min), SUM(price_mw_min),
+         MIN(min_price), MAX(max_price)
+  FROM price_rollup_daily
+  WHERE market = p_market AND gran = p_gran AND delivery_date >= m0 AND delivery_date < m1
+  GROUP BY 1, 2, 3, 4;
+  RETURN n;
+END $$;
+
+-- One-off backfill, a month per transaction, skipping months already present.
+CREATE OR REPLACE PROCEDURE backfill_price_rollups(p_from DATE DEFAULT DATE '2022-08-01')
+LANGUAGE plpgsql AS $$
+DECLARE
+  mkt TEXT;
+  g   TEXT;
+  m   DATE;
+BEGIN
+  FOREACH mkt IN ARRAY ARRAY['DAM', 'GDAM'] LOOP
+    FOREACH g IN ARRAY ARRAY['hour', 'quarter'] LOOP
+      m := date_trunc('month', p_from)::DATE;
+      WHILE m <= current_date LOOP
+        IF NOT EXISTS (SELECT 1 FROM price_rollup_monthly
+                       WHERE market = mkt AND gran = g AND month = m) THEN
+          PERFORM refresh_price_rollups(mkt, g, m, (m + INTERVAL '1 month - 1 day')::DATE);
+          COMMIT;
+        END IF;
+        m := (m + INTERVAL '1 month')::DATE;
+      END LOOP;
+    END LOOP;
+  END LOOP;
+END $$;
+
+CALL backfill_price_rollups();
@@ -0,0 +1,154 @@
+-- Materialized hourly DAM/GDAM series: native hourly rows where the day has
+-- them, otherwise hours derived from the 15-min slots (derived = true), so
+-- the app's hourly path answers in one query and takes its "Fallback via
+-- 15-min slots" note from the flag instead of a second fetch.
+--
+-- Derived hours keep both averages so sums over them match the slots exactly:
+--   price_avg_rs_per_mwh  = Σ price×min / Σ min            (TWAP weight: duration_min)
+--   scheduled_mw_sum      = Σ MW×min / Σ min               (hour-average MW)
+--   price_vwap_rs_per_mwh = Σ price×MW×min / Σ MW×min      (VWAP weight: MW × duration_min)
+-- For native rows price_vwap_rs_per_mwh = price_avg_rs_per_mwh.
+--
+-- Built from the rpc_get_*_prices_range functions like the rollups (007).
+-- refresh_price_hourly() runs from the ingest path before the rollups; call
+-- it for any day whose hourly or 15-min data is loaded by other means.
+-- The 'hour' rollups are rebuilt from this table and count derived rows.
+-- Idempotent: safe to re-run. Run with psql outside an explicit transaction.
+
+CREATE TABLE IF NOT EXISTS price_hourly (
+  market                TEXT    NOT NULL,
+  delivery_date         DATE    NOT NULL,
+  block_index           INT     NOT NULL,
+  price_avg_rs_per_mwh  FLOAT8  NOT NULL,
+  scheduled_mw_sum      FLOAT8,
+  duration_min          INT     NOT NULL,
+  price_vwap_rs_per_mwh FLOAT8  NOT NULL,
+  derived               BOOLEAN NOT NULL DEFAULT false,
+  PRIMARY KEY (market, delivery_date, block_index)
+);
+
+CREATE OR REPLACE FUNCTION refresh_price_hourly(p_market TEXT, p_from DATE, p_to DATE)
+RETURNS INT
+LANGUAGE plpgsql AS $$
+DECLARE n INT; n_derived INT;
+BEGIN
+  IF p_from IS NULL OR p_to IS NULL THEN
+    RETURN 0;
+  END IF;
+  DELETE FROM price_hourly WHERE market = p_market AND delivery_date BETWEEN p_from AND p_to;
+
+  INSERT INTO price_hourly
+  SELECT p_market, r.delivery_date, r.block_index, r.price_avg_rs_per_mwh, r.scheduled_mw_sum,
+         r.duration_min, r.price_avg_rs_per_mwh, false
+  FROM public.rpc_get_hourly_prices_range(p_market, p_from, p_to, NULL, NULL) r;
+  GET DIAGNOSTICS n = ROW_COUNT;
+
+  -- Days without any native hourly row: average their slots into hours.
+  INSERT INTO price_hourly
+  SELECT p_market, q.delivery_date, (q.slot_index - 1) / 4 + 1,
+         SUM(q.price_rs_per_mwh::FLOAT8 * q.duration_min) / SUM(q.duration_min),
+         SUM(COALESCE(q.scheduled_mw, 0)::FLOAT8 * q.duration_min) / SUM(q.duration_min),
+         SUM(q.duration_min),
+         COALESCE(SUM(q.price_rs_per_mwh::FLOAT8 * COALESCE(q.scheduled_mw, 0) * q.duration_min)
+                    / NULLIF(SUM(COALESCE(q.scheduled_mw, 0)::FLOAT8 * q.duration_min), 0),
+                  SUM(q.price_rs_per_mwh::FLOAT8 * q.duration_min) / SUM(q.duration_min)),
+         true
+  FROM public.rpc_get_quarter_prices_range(p_market, p_from, p_to, NULL, NULL) q
+  WHERE NOT EXISTS (SELECT 1 FROM price_hourly h
+                    WHERE h.market = p_market AND h.delivery_date = q.delivery_date)
+  GROUP BY q.delivery_date, (q.slot_index - 1) / 4 + 1
+  HAVING SUM(q.duration_min) > 0;
+  GET DIAGNOSTICS n_derived = ROW_COUNT;
+  RETURN n + n_derived;
+END $$;
+
+-- Rollups learn how many of their rows are derived.
+DO $$
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                 WHERE table_name = 'price_rollup_daily' AND column_name = 'n_derived') THEN
+    ALTER TABLE price_rollup_daily   ADD COLUMN n_derived INT NOT NULL DEFAULT 0;
+    ALTER TABLE price_rollup_monthly ADD COLUMN n_derived INT NOT NULL DEFAULT 0;
+    -- 'hour' rollups are rebuilt from price_hourly by the backfill below.
+    DELETE FROM price_rollup_daily   WHERE gran = 'hour';
+    DELETE FROM price_rollup_monthly WHERE gran = 'hour';
+  END IF;
+END $$;
+
+-- Same as 007, except 'hour' now reads price_hourly (kept current first).
+CREATE OR REPLACE FUNCTION refresh_price_rollups(p_market TEXT, p_gran TEXT, p_from DATE, p_to DATE)
+RETURNS INT
+LANGUAGE plpgsql AS $$
+DECLARE
+  m0 DATE := date_trunc('month', p_from)::DATE;
+  m1 DATE := (date_trunc('month', p_to) + INTERVAL '1 month')::DATE;
+  n  INT;
+BEGIN
+  IF p_from IS NULL OR p_to IS NULL THEN
+    RETURN 0;
+  END IF;
+  DELETE FROM price_rollup_daily
+  WHERE market = p_market AND gran = p_gran AND delivery_date BETWEEN p_from AND p_to;
+
+  IF p_gran = 'hour' THEN
+    INSERT INTO price_rollup_daily (market, gran, delivery_date, block_index, n_rows, minutes, price_min,
+                                    mw_min, price_mw_min, min_price, max_price, n_derived)
+    SELECT p_market, 'hour', h.delivery_date, h.block_index, 1,
+           h.duration_min,
+           h.price_avg_rs_per_mwh * h.duration_min,
+           COALESCE(h.scheduled_mw_sum, 0) * h.duration_min,
+           h.price_vwap_rs_per_mwh * COALESCE(h.scheduled_mw_sum, 0) * h.duration_min,
+           h.price_avg_rs_per_mwh, h.price_avg_rs_per_mwh, h.derived::INT
+    FROM price_hourly h
+    WHERE h.market = p_market AND h.delivery_date BETWEEN p_from AND p_to;
+  ELSE
+    INSERT INTO price_rollup_daily (market, gran, delivery_date, block_index, n_rows, minutes, price_min,
+                                    mw_min, price_mw_min, min_price, max_price)
+    SELECT p_market, 'quarter', r.delivery_date, r.slot_index, COUNT(*),
+           SUM(r.duration_min),
+           SUM(r.price_rs_per_mwh::FLOAT8 * r.duration_min),
+           SUM(COALESCE(r.scheduled_mw, 0)::FLOAT8 * r.duration_min),
+           SUM(r.price_rs_per_mwh::FLOAT8 * COALESCE(r.scheduled_mw, 0) * r.duration_min),
+           MIN(r.price_rs_per_mwh), MAX(r.price_rs_per_mwh)
+    FROM public.rpc_get_quarter_prices_range(p_market, p_from, p_to, NULL, NULL) r
+    GROUP BY r.delivery_date, r.slot_index;
+  END IF;
+  GET DIAGNOSTICS n = ROW_COUNT;
+
+  DELETE FROM price_rollup_monthly
+  WHERE market = p_market AND gran = p_gran AND month >= m0 AND month < m1;
+  INSERT INTO price_rollup_monthly (month, market, gran, block_index, n_rows, n_days, minutes, price_min,
+                                    mw_min, price_mw_min, min_price, max_price, n_derived)
+  SELECT date_trunc('month', delivery_date)::DATE, market, gran, block_index,
+         SUM(n_rows), COUNT(*), SUM(minutes), SUM(price_min), SUM(mw_min), SUM(price_mw_min),
+         MIN(min_price), MAX(max_price), SUM(n_derived)
+  FROM price_rollup_daily
+  WHERE market = p_market AND gran = p_gran AND delivery_date >= m0 AND delivery_date < m1
+  GROUP BY 1, 2, 3, 4;
+  RETURN n;
+END $$;
+
+-- Backfill price_hourly a month per transaction (months already present are
+-- skipped), then let the 007 backfill refill the 'hour' rollups.
+CREATE OR REPLACE PROCEDURE backfill_price_hourly(p_from DATE DEFAULT DATE '2022-08-01')
+LANGUAGE plpgsql AS $$
+DECLARE
+  mkt TEXT;
+  m   DATE;
+BEGIN
+  FOREACH mkt IN ARRAY ARRAY['DAM', 'GDAM'] LOOP
+    m := date_trunc('month', p_from)::DATE;
+    WHILE m <= current_date LOOP
+      IF NOT EXISTS (SELECT 1 FROM price_hourly
+                     WHERE market = mkt AND delivery_date >= m
+                       AND delivery_date < (m + INTERVAL '1 month')::DATE) THEN
+        PERFORM refresh_price_hourly(mkt, m, (m + INTERVAL '1 month - 1 day')::DATE);
+        COMMIT;
+      END IF;
+      m := (m + INTERVAL '1 month')::DATE;
+    END LOOP;
+  END LOOP;
+END $$;
+
+CALL backfill_price_hourly();
+CALL backfill_price_rollups();
@@ -0,0 +1,18 @@
+-- Change marker for the app's in-process caches (app/ingest_log.py).
+--
+-- Every ingest that inserts or updates rows appends one entry per market with
+-- the changed delivery-date span, after its hourly/rollup refreshes:
+-- scripts/ingest.py and 003_convert_upsert.sql for DAM/GDAM prices, and
+-- derivative loaders with the exchange code (MCX, NSE) and the first changed
+-- trading day. The app reads the entries added since its last poll every
+-- ROLLUP_COVERAGE_SEC and drops the cached days they cover, instead of
+-- serving them until their TTL runs out.
+-- Idempotent: safe to re-run.
+
+CREATE TABLE IF NOT EXISTS price_ingest_log (
+  id            BIGSERIAL   PRIMARY KEY,
+  market        TEXT        NOT NULL,
+  first_changed DATE        NOT NULL,
+  last_changed  DATE        NOT NULL,
+  ingested_at   TIMESTAMPTZ NOT NULL DEFAULT now()
+);